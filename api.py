@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import sys
+from functools import partial
+from aiohttp import web
+from aiohttp.log import access_logger
+from config import (API_HOST, API_PORT, API_WORKERS, API_SHUTDOWN_TIMEOUT, API_MAX_BATCH_SIZE, API_MAX_BODY_BYTES,
+                    API_ACCESS_LOG, BATCH_MAX_CONCURRENCY, BATCH_MSEARCH_SIZE, WARMUP_ON_START, METRICS_PORT)
+from pipeline import AsyncRAGPipeline, _trace_mode
+from utils.client_manager import client_manager
+from utils.es_client import resolve_indices
+from utils.metrics import Trace, start_metrics_server
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PIPELINE = web.AppKey("pipeline", AsyncRAGPipeline)
+SHUTDOWN_SIGNALS = web.AppKey("shutdown_signals", tuple)
+
+# Código de saída do worker que não conseguiu inicializar (o processo principal não o reinicia)
+BOOT_ERROR = 3
+
+NDJSON = "application/x-ndjson"
+
+_dumps = partial(json.dumps, ensure_ascii=False)
+
+
+def _error(status, message, **headers):
+    return web.json_response({"error": message}, status=status, headers=headers, dumps=_dumps)
+
+
+def _status(events, error=None):
+    """
+    Status HTTP de uma consulta processada: as consultas recusadas pelo controle de admissão
+    ou descartadas pelo prazo não são respostas válidas para quem chama a API
+
+    Args:
+        events: Eventos do trace da consulta
+        error: Erro registrado no trace (opcional)
+
+    Returns:
+        Código de status HTTP
+    """
+    if "admission_rejected" in events:
+        return 503
+    if "deadline_exceeded" in events:
+        return 504
+    return 502 if error else 200
+
+
+async def _read_body(request):
+    """
+    Lê o corpo JSON da requisição e resolve os índices consultados (campos "tenant" e "indices")
+
+    Returns:
+        Tupla (corpo da requisição, índices)
+
+    Raises:
+        ValueError: Se o corpo não é um objeto JSON ou o tenant/índices são inválidos ou não são permitidos
+    """
+    try:
+        body = await request.json(loads=json.loads)
+    except ValueError:
+        raise ValueError("O corpo da requisição não é um JSON válido")
+    if not isinstance(body, dict):
+        raise ValueError("O corpo da requisição deve ser um objeto JSON")
+    tenant, indices = body.get("tenant"), body.get("indices")
+    if tenant is not None and not isinstance(tenant, str):
+        raise ValueError('O campo "tenant" deve ser um texto')
+    if indices is not None and not isinstance(indices, str) and not (
+            isinstance(indices, list) and all(isinstance(index, str) for index in indices)):
+        raise ValueError('O campo "indices" deve ser uma lista de textos ou um texto separado por vírgulas')
+    return body, resolve_indices(tenant, indices)
+
+
+def _flag(body, name, default):
+    """Campo booleano opcional do corpo (ValueError se não for true/false)"""
+    value = body.get(name, default)
+    if not isinstance(value, bool):
+        raise ValueError(f'O campo "{name}" deve ser true ou false')
+    return value
+
+
+def _integer(body, name, default, maximum=None):
+    """Campo inteiro opcional do corpo, limitado ao intervalo [1, maximum] (ValueError se não for inteiro)"""
+    value = body.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'O campo "{name}" deve ser um número inteiro')
+    value = max(1, value)
+    return min(value, maximum) if maximum else value
+
+
+def _query_text(body):
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError('O campo "query" é obrigatório')
+    return query
+
+
+def _batch_queries(items, ids):
+    """
+    Perguntas do /batch, no mesmo formato das linhas do batch.py: strings ou objetos com
+    o campo "query" (e opcionalmente "id")
+
+    Args:
+        items: Lista de perguntas recebida
+        ids: Lista preenchida com o id de cada pergunta (ou a sua posição)
+
+    Returns:
+        Lista com o texto das perguntas
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('O campo "queries" deve ser uma lista não vazia')
+    if len(items) > API_MAX_BATCH_SIZE:
+        raise ValueError(f"O lote excede o limite de {API_MAX_BATCH_SIZE} perguntas")
+    queries = []
+    for position, item in enumerate(items):
+        if isinstance(item, dict):
+            ids.append(item.get("id", position))
+            item = item.get("query")
+        else:
+            ids.append(position)
+        if not isinstance(item, str) or not item.strip():
+            raise ValueError(f"Pergunta inválida na posição {position}")
+        queries.append(item)
+    return queries
+
+
+def _sse(data, event=None):
+    """Formata uma mensagem Server-Sent Events com o payload em JSON"""
+    message = f"event: {event}\n" if event else ""
+    return f"{message}data: {_dumps(data)}\n\n".encode("utf-8")
+
+
+@web.middleware
+async def _errors_middleware(request, handler):
+    """Responde 400 às requisições inválidas (JSON malformado, campos ausentes ou com tipo inválido, tenant ou índices não permitidos)"""
+    try:
+        return await handler(request)
+    except ValueError as e:
+        return _error(400, str(e))
+
+
+async def query(request):
+    """
+    POST /query: processa uma pergunta e retorna a resposta completa
+
+    Corpo: {"query": "...", "use_llm_query": true, "tenant": null, "indices": null, "trace": false}
+    Resposta: {"answer": "...", "error": null} (com "trace" se solicitado)
+    """
+    body, indices = await _read_body(request)
+    user_query = _query_text(body)
+    include_trace = _flag(body, "trace", False)
+    result = await request.app[PIPELINE].process_query(user_query, _flag(body, "use_llm_query", True),
+                                                       return_trace=True, indices=indices)
+    trace = result["trace"]
+    status = _status(trace["events"], trace["error"])
+    response = {"answer": result["answer"], "error": trace["error"]}
+    if include_trace:
+        response["trace"] = trace
+    headers = {"Retry-After": "1"} if status == 503 else None
+    return web.json_response(response, status=status, headers=headers, dumps=_dumps)
+
+
+async def query_stream(request):
+    """
+    POST /query/stream: processa uma pergunta e envia a resposta em streaming (Server-Sent Events)
+
+    Corpo: o mesmo do /query. Cada trecho da resposta é enviado como `data: {"delta": "..."}` e o
+    fim da resposta como `event: done` com {"error": ...} (e o trace, se solicitado). Consultas
+    recusadas pelo controle de admissão ou descartadas pelo prazo recebem 503/504 antes do streaming.
+    """
+    body, indices = await _read_body(request)
+    user_query = _query_text(body)
+    use_llm_query = _flag(body, "use_llm_query", True)
+    include_trace = _flag(body, "trace", False)
+    trace = Trace(_trace_mode(use_llm_query))
+    stream = request.app[PIPELINE].process_query_stream(user_query, use_llm_query, trace=trace, indices=indices)
+
+    # aclosing libera as vagas do controle de admissão mesmo se o cliente desconectar no meio da resposta
+    async with contextlib.aclosing(stream):
+        first_delta = await anext(stream, None)
+        status = _status(trace.events)
+        if status != 200:
+            async for _ in stream:
+                pass
+            headers = {"Retry-After": "1"} if status == 503 else {}
+            return _error(status, first_delta, **headers)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                               "X-Accel-Buffering": "no"})
+        await response.prepare(request)
+        try:
+            if first_delta is not None:
+                await response.write(_sse({"delta": first_delta}))
+            async for delta in stream:
+                await response.write(_sse({"delta": delta}))
+        except ConnectionResetError:
+            logger.info("Cliente desconectado durante o streaming da resposta")
+            return response
+
+    done = {"error": trace.error}
+    if include_trace:
+        done["trace"] = trace.to_dict()
+    await response.write(_sse(done, event="done"))
+    await response.write_eof()
+    return response
+
+
+async def batch(request):
+    """
+    POST /batch: processa várias perguntas com um _msearch por bloco e geração concorrente
+
+    Corpo: {"queries": ["...", {"id": ..., "query": "..."}], "use_llm_query": true, "tenant": null,
+    "indices": null, "concurrency": BATCH_MAX_CONCURRENCY, "msearch_size": BATCH_MSEARCH_SIZE}
+    Resposta: {"results": [...]} na ordem das perguntas; com `Accept: application/x-ndjson`, um
+    resultado por linha à medida que ficam prontos (mesmo formato do batch.py)
+    """
+    body, indices = await _read_body(request)
+    ids = []
+    queries = _batch_queries(body.get("queries"), ids)
+    use_llm_query = _flag(body, "use_llm_query", True)
+    concurrency = _integer(body, "concurrency", BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    msearch_size = _integer(body, "msearch_size", BATCH_MSEARCH_SIZE)
+    results = request.app[PIPELINE].process_batch(queries, use_llm_query, concurrency, msearch_size, indices=indices)
+
+    async with contextlib.aclosing(results):
+        if NDJSON not in request.headers.get("Accept", ""):
+            collected = []
+            async for result in results:
+                result["id"] = ids[result["index"]]
+                collected.append(result)
+            collected.sort(key=lambda result: result["index"])
+            return web.json_response({"results": collected}, dumps=_dumps)
+
+        response = web.StreamResponse(headers={"Content-Type": NDJSON})
+        await response.prepare(request)
+        try:
+            async for result in results:
+                result["id"] = ids[result["index"]]
+                await response.write((_dumps(result) + "\n").encode("utf-8"))
+        except ConnectionResetError:
+            logger.info("Cliente desconectado durante o envio dos resultados do lote")
+            return response
+    await response.write_eof()
+    return response
+
+
+async def health(request):
+    """GET /health: verifica a conexão com o Elasticsearch (503 se indisponível)"""
+    try:
+        await request.app[PIPELINE].verify_connection()
+    except Exception as e:
+        return _error(503, f"Elasticsearch indisponível: {str(e)}")
+    return web.json_response({"status": "ok", "pid": os.getpid()})
+
+
+async def stats(request):
+    """GET /stats: estado dos caches, do agendador do Groq e do controle de admissão deste worker"""
+    return web.json_response(request.app[PIPELINE].cache_stats(), dumps=partial(_dumps, default=str))
+
+
+def _graceful_exit(loop, signals):
+    """
+    Inicia o encerramento gracioso do worker: para de aceitar conexões e aguarda as requisições
+    em andamento (API_SHUTDOWN_TIMEOUT). Um segundo sinal interrompe o processo imediatamente
+    """
+    for signum in signals:
+        loop.remove_signal_handler(signum)
+    logger.info(f"Encerrando o worker {os.getpid()}: aguardando as requisições em andamento")
+    raise web.GracefulExit()
+
+
+async def _start_pipeline(app):
+    """Cria e aquece os clientes no event loop do worker, antes da primeira requisição"""
+    loop = asyncio.get_running_loop()
+    for signum in app[SHUTDOWN_SIGNALS]:
+        loop.add_signal_handler(signum, _graceful_exit, loop, app[SHUTDOWN_SIGNALS])
+    es_client, llm_client = client_manager.create_async_clients()
+    if WARMUP_ON_START:
+        await client_manager.warm_up_async(es_client, llm_client)
+    app[PIPELINE] = AsyncRAGPipeline(es_client, llm_client)
+    logger.info(f"Worker {os.getpid()} pronto para receber requisições")
+
+
+async def _close_pipeline(app):
+    """Fecha os clientes depois que as requisições em andamento terminaram"""
+    if PIPELINE in app:
+        await app[PIPELINE].close()
+    logger.info(f"Worker {os.getpid()} encerrado")
+
+
+def create_app(shutdown_signals=(signal.SIGINT, signal.SIGTERM)):
+    """
+    Cria a aplicação da API HTTP. Os clientes e a pipeline são criados na inicialização da
+    aplicação, no event loop em que serão usados
+
+    Args:
+        shutdown_signals: Sinais que iniciam o encerramento gracioso
+
+    Returns:
+        Instância de aiohttp.web.Application
+    """
+    app = web.Application(middlewares=[_errors_middleware], client_max_size=API_MAX_BODY_BYTES)
+    app[SHUTDOWN_SIGNALS] = tuple(shutdown_signals)
+    app.on_startup.append(_start_pipeline)
+    app.on_cleanup.append(_close_pipeline)
+    app.router.add_post("/query", query)
+    app.router.add_post("/query/stream", query_stream)
+    app.router.add_post("/batch", batch)
+    app.router.add_get("/health", health)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def run_worker(sock=None, number=0, host=API_HOST, port=API_PORT):
+    """
+    Executa um worker da API até o encerramento
+
+    Args:
+        sock: Socket de escuta compartilhado com os demais workers (padrão: escuta em host:port)
+        number: Número do worker (a porta de métricas é METRICS_PORT + number)
+        host: Endereço de escuta, sem socket compartilhado
+        port: Porta de escuta, sem socket compartilhado
+    """
+    if sock is not None:
+        # Com vários workers, o Ctrl+C é tratado pelo processo principal, que encerra os workers com SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        shutdown_signals = (signal.SIGTERM,)
+    else:
+        shutdown_signals = (signal.SIGINT, signal.SIGTERM)
+
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT + number)
+
+    try:
+        web.run_app(create_app(shutdown_signals), host=None if sock else host, port=None if sock else port, sock=sock,
+                    shutdown_timeout=API_SHUTDOWN_TIMEOUT, access_log=access_logger if API_ACCESS_LOG else None,
+                    handle_signals=False, print=None)
+    except Exception as e:
+        logger.error(f"Falha ao inicializar o worker {os.getpid()}: {str(e)}")
+        sys.exit(BOOT_ERROR)
+
+
+def serve(host=API_HOST, port=API_PORT, workers=API_WORKERS):
+    """
+    Executa a API com vários workers (processos independentes, cada um com os próprios clientes,
+    caches e controle de admissão) que aceitam conexões do mesmo socket de escuta. Workers que
+    terminam inesperadamente são reiniciados; SIGINT/SIGTERM encerram todos graciosamente
+
+    Args:
+        host: Endereço de escuta
+        port: Porta de escuta
+        workers: Número de workers
+    """
+    if workers <= 1:
+        logger.info(f"API disponível em http://{host}:{port}")
+        run_worker(host=host, port=port)
+        return
+
+    sock = socket.create_server((host, port), backlog=1024)
+    processes = {}
+    stopping = False
+    boot_failed = False
+
+    def spawn(number):
+        process = multiprocessing.Process(target=run_worker, args=(sock, number), name=f"api-worker-{number}")
+        process.start()
+        processes[number] = process
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for number in range(workers):
+        spawn(number)
+    logger.info(f"API disponível em http://{host}:{port} com {workers} workers")
+
+    try:
+        while processes:
+            multiprocessing.connection.wait([process.sentinel for process in processes.values()])
+            for number, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                process.join()
+                del processes[number]
+                if stopping:
+                    continue
+                if process.exitcode == BOOT_ERROR:
+                    logger.error(f"O worker {number} não conseguiu inicializar. Encerrando a API")
+                    boot_failed = True
+                    stop(None, None)
+                    continue
+                logger.warning(f"Worker {number} terminou inesperadamente (código {process.exitcode}). Reiniciando")
+                spawn(number)
+    finally:
+        sock.close()
+    logger.info("API encerrada")
+    if boot_failed:
+        sys.exit(BOOT_ERROR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON da pipeline RAG (consulta, streaming SSE e lote)")
+    parser.add_argument("--host", default=API_HOST, help="Endereço de escuta")
+    parser.add_argument("--port", type=int, default=API_PORT, help="Porta de escuta")
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="Processos que atendem as requisições")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,15 @@
 import gradio as gr
 import logging
-import json
-import time
-from config import ES_MAX_RESULTS
-from utils.es_client import ElasticsearchClient
-from utils.llm_client import LLMClient
+import uuid
+from config import (ASYNC_PIPELINE, WARMUP_ON_START, METRICS_PORT, ES_TENANT_INDICES, ADMISSION_ENABLED,
+                    ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE)
+from pipeline import RAGPipeline, AsyncRAGPipeline
+from utils.client_manager import client_manager
+from utils.es_client import resolve_indices
+from utils.metrics import start_metrics_server
 
 # Corrigir o problema de compatibilidade com Pydantic v2
 import pydantic
-from pydantic import BaseModel
 
 # Configurar Pydantic para lidar com tipos arbitrários
 class Config:
@@ -20,84 +21,145 @@ pydantic.config.ConfigDict = lambda **kwargs: {**Config.__dict__, **kwargs}
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class RAGPipeline:
-    def __init__(self):
-        """
-        Inicializa a pipeline RAG com todos os componentes necessários
-        """
-        logger.info("Inicializando pipeline RAG")
-        
-        # Inicializar clientes
-        self.es_client = ElasticsearchClient()
-        self.llm_client = LLMClient()
-        
-        logger.info("Pipeline RAG inicializada com sucesso")
-    
-    def process_query(self, user_query, use_llm_query=True):
-        """
-        Processa a consulta do usuário através da pipeline RAG completa
-        
-        Args:
-            user_query: Pergunta ou consulta do usuário
-            use_llm_query: Se True, usa a LLM para preparar a consulta Elasticsearch. Se False, usa diretamente a busca semântica do ES.
-            
-        Returns:
-            Resposta final
-        """
-        try:
-            start_time = time.time()
-            
-            # 1. Usar a LLM para preparar a query do Elasticsearch (ou usar diretamente a busca semântica)
-            if use_llm_query:
-                logger.info("Preparando consulta Elasticsearch com LLM")
-                es_query = self.llm_client.prepare_elasticsearch_query(user_query, ES_MAX_RESULTS)
-                logger.info("Executando consulta personalizada no Elasticsearch")
-                documents = self.es_client.search(es_query)
-            else:
-                # Usando diretamente a busca semântica nativa do Elasticsearch
-                logger.info("Realizando busca semântica direta no Elasticsearch")
-                documents = self.es_client.semantic_search(user_query, ES_MAX_RESULTS)
-            
-            # Registrar tempo de busca
-            search_time = time.time() - start_time
-            logger.info(f"Busca concluída em {search_time:.2f} segundos. Encontrados {len(documents)} documentos.")
-            
-            # 2. Gerar resposta com base nos documentos encontrados
-            if not documents:
-                answer = "Não encontrei informações relevantes para responder sua pergunta."
-            else:
-                logger.info(f"Gerando resposta com LLM com base em {len(documents)} documentos")
-                answer = self.llm_client.generate_response(user_query, documents)
-            
-            total_time = time.time() - start_time
-            logger.info(f"Processamento completo em {total_time:.2f} segundos")
-            
-            return answer
-        except Exception as e:
-            logger.error(f"Erro ao processar consulta: {str(e)}")
-            return f"Ocorreu um erro ao processar sua consulta: {str(e)}"
+UNAVAILABLE_MESSAGE = "O serviço de busca está indisponível no momento. Tente novamente em instantes."
 
 # Inicializar a pipeline ao carregar o módulo
 rag_pipeline = None
+async_rag_pipeline = None
 
 def initialize_pipeline():
     global rag_pipeline
+    if rag_pipeline is not None:
+        return "Pipeline RAG já inicializada!"
     try:
-        rag_pipeline = RAGPipeline()
+        # Clientes compartilhados (pools de conexões); o ping e o aquecimento se repetem até o primeiro sucesso
+        if client_manager.healthy is not True:
+            client_manager.warm_up()
+        rag_pipeline = RAGPipeline(client_manager.get_es_client(), client_manager.get_llm_client())
+        # A verificação de saúde em segundo plano acompanha os clientes compartilhados, usados apenas pela pipeline síncrona
+        client_manager.start_health_check()
         return "Pipeline RAG inicializada com sucesso!"
     except Exception as e:
         return f"Erro ao inicializar pipeline: {str(e)}"
 
-def process_user_query(query, use_llm_for_query):
-    """Função para processar a consulta do usuário através da interface"""
-    global rag_pipeline
-    
+def pipeline_error():
+    """
+    Prepara a pipeline síncrona para uma consulta
+
+    Returns:
+        Mensagem exibida ao usuário se a consulta não puder ser processada, ou None
+    """
     if rag_pipeline is None:
         result = initialize_pipeline()
         if "Erro" in result:
             return result
+    # Com o mecanismo de recuperação indisponível na última verificação de saúde, a consulta falha na hora em vez de esperar o timeout
+    if client_manager.healthy is False:
+        return UNAVAILABLE_MESSAGE
+    return None
+
+def process_user_query(query, use_llm_for_query, tenant=None):
+    """Função para processar a consulta do usuário através da interface"""
+    error = pipeline_error()
+    if error is not None:
+        return error
+    
+    return rag_pipeline.process_query(query, use_llm_for_query, indices=resolve_indices(tenant))
+
+def process_user_query_stream(query, use_llm_for_query, tenant=None):
+    """Função para processar a consulta do usuário através da interface, exibindo a resposta em streaming"""
+    error = pipeline_error()
+    if error is not None:
+        yield error
+        return
+    
+    # Acumular os deltas e enviar o Markdown parcial para a interface
+    answer = ""
+    for delta in rag_pipeline.process_query_stream(query, use_llm_for_query, indices=resolve_indices(tenant)):
+        answer += delta
+        yield answer
+
+async def initialize_async_pipeline():
+    global async_rag_pipeline
+    if async_rag_pipeline is not None:
+        return "Pipeline RAG assíncrona já inicializada!"
+    try:
+        # Os clientes assíncronos são criados e aquecidos no event loop do Gradio, onde serão usados
+        es_client, llm_client = client_manager.create_async_clients()
+        await client_manager.warm_up_async(es_client, llm_client)
+        async_rag_pipeline = AsyncRAGPipeline(es_client, llm_client)
+        return "Pipeline RAG assíncrona inicializada com sucesso!"
+    except Exception as e:
+        return f"Erro ao inicializar pipeline: {str(e)}"
+
+async def process_user_query_async(query, use_llm_for_query, use_streaming, tenant=None):
+    """Função assíncrona para processar a consulta do usuário através da interface"""
+    global async_rag_pipeline
+    
+    if async_rag_pipeline is None:
+        result = await initialize_async_pipeline()
+        if "Erro" in result:
+            yield result
+            return
+    
+    indices = resolve_indices(tenant)
+    if not use_streaming:
+        yield await async_rag_pipeline.process_query(query, use_llm_for_query, indices=indices)
+        return
     
-    return rag_pipeline.process_query(query, use_llm_for_query)
+    # Acumular os deltas e enviar o Markdown parcial para a interface
+    answer = ""
+    async for delta in async_rag_pipeline.process_query_stream(query, use_llm_for_query, indices=indices):
+        answer += delta
+        yield answer
+
+def process_user_query_handler(query, use_llm_for_query, use_streaming, tenant=None):
+    """Encaminha a consulta para o modo streaming ou para o modo de resposta única"""
+    if use_streaming:
+        yield from process_user_query_stream(query, use_llm_for_query, tenant)
+    else:
+        yield process_user_query(query, use_llm_for_query, tenant)
+
+def process_chat_message(message, history, session_id, use_llm_for_query, tenant=None):
+    """Processa uma mensagem do modo chat, exibindo a resposta em streaming no histórico"""
+    session_id = session_id or uuid.uuid4().hex
+    history = (history or []) + [{"role": "user", "content": message}, {"role": "assistant", "content": ""}]
+    
+    error = pipeline_error()
+    if error is not None:
+        history[-1]["content"] = error
+        yield history, session_id, ""
+        return
+    
+    for delta in rag_pipeline.process_chat_stream(session_id, message, use_llm_for_query, indices=resolve_indices(tenant)):
+        history[-1]["content"] += delta
+        yield history, session_id, ""
+
+async def process_chat_message_async(message, history, session_id, use_llm_for_query, tenant=None):
+    """Versão assíncrona de process_chat_message, usada com ASYNC_PIPELINE"""
+    global async_rag_pipeline
+    
+    session_id = session_id or uuid.uuid4().hex
+    history = (history or []) + [{"role": "user", "content": message}, {"role": "assistant", "content": ""}]
+    
+    if async_rag_pipeline is None:
+        result = await initialize_async_pipeline()
+        if "Erro" in result:
+            history[-1]["content"] = result
+            yield history, session_id, ""
+            return
+    
+    async for delta in async_rag_pipeline.process_chat_stream(session_id, message, use_llm_for_query,
+                                                              indices=resolve_indices(tenant)):
+        history[-1]["content"] += delta
+        yield history, session_id, ""
+
+def reset_chat(session_id):
+    """Descarta a conversa atual e inicia uma nova sessão de chat"""
+    pipeline = async_rag_pipeline if ASYNC_PIPELINE else rag_pipeline
+    if session_id and pipeline is not None:
+        pipeline.conversations.reset(session_id)
+    return [], None, ""
 
 # Interface Gradio
 def create_interface():
@@ -110,21 +172,46 @@ def create_interface():
             with gr.Column():
                 init_button = gr.Button("Inicializar Pipeline")
                 init_output = gr.Textbox(label="Status de inicialização")
-                init_button.click(initialize_pipeline, outputs=init_output)
+                init_button.click(initialize_async_pipeline if ASYNC_PIPELINE else initialize_pipeline, outputs=init_output)
         
-        with gr.Row():
-            with gr.Column():
-                query_input = gr.Textbox(lines=3, label="Sua pergunta")
-                
+        with gr.Tabs():
+            with gr.Tab("Pergunta única"):
                 with gr.Row():
+                    with gr.Column():
+                        query_input = gr.Textbox(lines=3, label="Sua pergunta")
+                
+                        with gr.Row():
 
-                    use_llm_for_query = gr.Checkbox(label="Usar LLM para preparar consulta", value=True, 
-                                                info="Se ativado, a LLM irá preparar a consulta Elasticsearch. Se desativado, usará a busca semântica direta.")
+                            use_llm_for_query = gr.Checkbox(label="Usar LLM para preparar consulta", value=True, 
+                                                        info="Se ativado, a LLM irá preparar a consulta Elasticsearch. Se desativado, usará a busca semântica direta.")
+                    
+                            use_streaming = gr.Checkbox(label="Exibir resposta em streaming", value=True,
+                                                        info="Se ativado, a resposta é exibida à medida que é gerada pela LLM.")
+                        
+                        # Com ES_TENANT_INDICES, cada tenant consulta os próprios índices
+                        tenant_input = gr.Dropdown(choices=list(ES_TENANT_INDICES), value=None, label="Tenant",
+                                                   visible=bool(ES_TENANT_INDICES))
                 
-                search_button = gr.Button("Buscar", variant="primary")
+                        search_button = gr.Button("Buscar", variant="primary")
             
-            with gr.Column():
-                answer_output = gr.Markdown(label="Resposta", value="", show_label=True)
+                    with gr.Column():
+                        answer_output = gr.Markdown(label="Resposta", value="", show_label=True)
+            
+            # Modo chat: perguntas de continuação reaproveitam o histórico e os documentos do turno anterior
+            with gr.Tab("Chat"):
+                chatbot = gr.Chatbot(type="messages", label="Conversa", height=450)
+                chat_session = gr.State(None)
+                
+                with gr.Row():
+                    chat_input = gr.Textbox(lines=2, label="Sua mensagem", scale=4)
+                    chat_use_llm = gr.Checkbox(label="Usar LLM para preparar consulta", value=True,
+                                               info="Usado quando a mensagem muda de assunto e exige uma nova busca.")
+                    chat_tenant = gr.Dropdown(choices=list(ES_TENANT_INDICES), value=None, label="Tenant",
+                                              visible=bool(ES_TENANT_INDICES))
+                
+                with gr.Row():
+                    send_button = gr.Button("Enviar", variant="primary")
+                    reset_button = gr.Button("Nova conversa")
         
         with gr.Accordion("Sobre o sistema", open=False):
             gr.Markdown("""
@@ -139,15 +226,48 @@ def create_interface():
             O sistema utiliza o modelo de linguagem do Groq e as capacidades de busca semântica nativa do Elasticsearch.
             """)
         
+        # Com ASYNC_PIPELINE, os usuários compartilham o event loop do Gradio em vez de uma thread por consulta
         search_button.click(
-            process_user_query, 
-            inputs=[query_input, use_llm_for_query], 
+            process_user_query_async if ASYNC_PIPELINE else process_user_query_handler, 
+            inputs=[query_input, use_llm_for_query, use_streaming, tenant_input], 
             outputs=answer_output
         )
         
+        chat_handler = process_chat_message_async if ASYNC_PIPELINE else process_chat_message
+        for trigger in (send_button.click, chat_input.submit):
+            trigger(
+                chat_handler,
+                inputs=[chat_input, chatbot, chat_session, chat_use_llm, chat_tenant],
+                outputs=[chatbot, chat_session, chat_input]
+            )
+        reset_button.click(reset_chat, inputs=chat_session, outputs=[chatbot, chat_session, chat_input])
+        
+        # A pipeline assíncrona precisa do event loop do Gradio, por isso é aquecida no carregamento da página
+        if ASYNC_PIPELINE and WARMUP_ON_START:
+            interface.load(initialize_async_pipeline, outputs=init_output)
+    
+    # Com o controle de admissão, o Gradio repassa as consultas sem limitá-las: a pipeline limita as
+    # consultas simultâneas e a fila, recusa o excedente na hora e degrada o processamento sob pressão
+    if ADMISSION_ENABLED:
+        interface.queue(default_concurrency_limit=None)
+        
     return interface
 
+def warm_up():
+    """Inicializa e aquece a pipeline na inicialização do processo, antes do primeiro usuário"""
+    if not ASYNC_PIPELINE:
+        logger.info(initialize_pipeline())
+
 if __name__ == "__main__":
+    # Endpoint de métricas (latência por etapa, tokens, eventos) ao lado da interface
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    
+    if WARMUP_ON_START:
+        warm_up()
+    
     # Criar e iniciar a interface
     demo = create_interface()
-    demo.launch(share=False)  # share=True para compartilhar link público (opcional)
+    # As consultas na fila do controle de admissão aguardam em threads do Gradio (pipeline síncrona; 40 é o padrão do Gradio)
+    max_threads = ADMISSION_MAX_CONCURRENCY + ADMISSION_MAX_QUEUE if ADMISSION_ENABLED and ADMISSION_MAX_CONCURRENCY else 40
+    demo.launch(share=False, max_threads=max_threads)  # share=True para compartilhar link público (opcional)
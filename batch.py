@@ -0,0 +1,77 @@
+import argparse
+import json
+import logging
+import sys
+from config import BATCH_MAX_CONCURRENCY, BATCH_MSEARCH_SIZE
+from pipeline import RAGPipeline
+from utils.es_client import resolve_indices
+
+# Configurar logging (em stderr, para não misturar com o JSONL de saída)
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def read_queries(input_file, ids):
+    """
+    Lê as perguntas de um arquivo JSONL. Cada linha pode ser um objeto com o campo "query"
+    (e opcionalmente "id") ou uma string JSON.
+
+    Args:
+        input_file: Arquivo aberto para leitura
+        ids: Lista preenchida com o id de cada pergunta lida (ou o número da linha)
+
+    Yields:
+        Texto de cada pergunta
+    """
+    for line_number, line in enumerate(input_file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if isinstance(item, str):
+            ids.append(line_number)
+            yield item
+        else:
+            ids.append(item.get("id", line_number))
+            yield item["query"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Processa perguntas em lote pela pipeline RAG (JSONL -> JSONL)")
+    parser.add_argument("input", help="Arquivo JSONL com as perguntas ('-' para stdin)")
+    parser.add_argument("-o", "--output", help="Arquivo JSONL de saída (padrão: stdout)")
+    parser.add_argument("--no-llm-query", action="store_true", help="Usa a busca semântica direta em vez do planejamento com LLM")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY, help="Chamadas simultâneas à LLM")
+    parser.add_argument("--msearch-size", type=int, default=BATCH_MSEARCH_SIZE, help="Consultas por requisição _msearch")
+    parser.add_argument("--tenant", help="Tenant cujos índices serão consultados (ES_TENANT_INDICES)")
+    parser.add_argument("--indices", help="Índices consultados, separados por vírgula (padrão: ES_INDICES)")
+    args = parser.parse_args()
+    try:
+        indices = resolve_indices(args.tenant, args.indices)
+    except ValueError as e:
+        parser.error(str(e))
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output_file = sys.stdout if not args.output else open(args.output, "w", encoding="utf-8")
+
+    try:
+        pipeline = RAGPipeline()
+        ids = []
+        queries = read_queries(input_file, ids)
+        processed = 0
+        failed = 0
+        for result in pipeline.process_batch(queries, not args.no_llm_query, args.concurrency, args.msearch_size,
+                                             indices=indices):
+            result["id"] = ids[result["index"]]
+            output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output_file.flush()
+            processed += 1
+            if result["error"]:
+                failed += 1
+        logger.info(f"Lote concluído: {processed} perguntas processadas, {failed} com erro")
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+if __name__ == "__main__":
+    main()
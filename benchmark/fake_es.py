@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+WORDS = ("notícia governo economia futebol saúde eleição mercado cidade brasil estado política copa mundo "
+         "pesquisa inflação educação escola hospital ciência tecnologia cultura música cinema clima chuva").split()
+
+
+class FakeElasticsearchConfig:
+    """Parâmetros do Elasticsearch falso"""
+
+    def __init__(self, latency=0.02, jitter=0.01, hits=5, doc_chars=2000, embedding_dims=384,
+                 chunks_per_doc=4, corpus_size=1000, text_field="texto", semantic_field="semantic_text", seed=42):
+        """
+        Args:
+            latency: Latência base de cada requisição, em segundos
+            jitter: Variação aleatória máxima somada à latência, em segundos
+            hits: Número máximo de documentos retornados por consulta
+            doc_chars: Tamanho aproximado do texto de cada documento, em caracteres
+            embedding_dims: Dimensões de cada embedding incluído no campo semantic_text
+            chunks_per_doc: Número de chunks (com embeddings) do campo semantic_text por documento
+            corpus_size: Número de documentos distintos do corpus simulado
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.hits = hits
+        self.doc_chars = doc_chars
+        self.embedding_dims = embedding_dims
+        self.chunks_per_doc = chunks_per_doc
+        self.corpus_size = corpus_size
+        self.text_field = text_field
+        self.semantic_field = semantic_field
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._documents = {}
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def sleep(self):
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def document(self, doc_id):
+        """Gera (e memoriza) o _source de um documento do corpus simulado"""
+        with self._lock:
+            source = self._documents.get(doc_id)
+        if source is not None:
+            return source
+
+        rng = random.Random(f"{self.seed}-{doc_id}")
+        words = []
+        length = 0
+        while length < self.doc_chars:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+            if rng.random() < 0.08:
+                words[-1] += "."
+        text = " ".join(words)
+        chunk_size = max(1, len(text) // self.chunks_per_doc)
+        source = {
+            self.text_field: text,
+            self.semantic_field: {
+                "inference": {
+                    "chunks": [
+                        {
+                            "text": text[i:i + chunk_size],
+                            "embeddings": [round(rng.uniform(-1, 1), 6) for _ in range(self.embedding_dims)]
+                        }
+                        for i in range(0, len(text), chunk_size)
+                    ]
+                }
+            }
+        }
+        with self._lock:
+            self._documents[doc_id] = source
+        return source
+
+    def search(self, body, index="bench"):
+        """Simula a resposta de um _search para o corpo informado (índices diferentes retornam documentos diferentes)"""
+        size = min(int(body.get("size", 10)), self.hits)
+        digest = hashlib.sha256((index + json.dumps(body, sort_keys=True, ensure_ascii=False)).encode("utf-8")).digest()
+        start = int.from_bytes(digest[:4], "big") % self.corpus_size
+        hits = []
+        for rank in range(size):
+            doc_id = str((start + rank * 7) % self.corpus_size)
+            source = _filter_source(self.document(doc_id), body.get("_source"))
+            hit = {"_index": index, "_id": doc_id, "_score": round(1.0 / (60 + rank + 1), 6), "_source": source}
+            highlight = body.get("highlight")
+            if highlight:
+                field = next(iter(highlight.get("fields", {})), self.text_field)
+                fragment_size = highlight["fields"].get(field, {}).get("fragment_size", 150)
+                hit["highlight"] = {field: [self.document(doc_id)[self.text_field][:fragment_size]]}
+            hits.append(hit)
+        return {
+            "took": int(self.latency * 1000),
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "max_score": hits[0]["_score"] if hits else None, "hits": hits}
+        }
+
+
+def _filter_source(source, source_filter):
+    """Aplica um filtro _source simples (includes/excludes de campos de primeiro nível)"""
+    if source_filter is None or source_filter is True:
+        return source
+    if source_filter is False:
+        return {}
+    if isinstance(source_filter, (list, str)):
+        source_filter = {"includes": source_filter}
+    includes = source_filter.get("includes") or []
+    excludes = source_filter.get("excludes") or []
+    if isinstance(includes, str):
+        includes = [includes]
+    if isinstance(excludes, str):
+        excludes = [excludes]
+    return {key: value for key, value in source.items()
+            if (not includes or key in includes) and key not in excludes}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/":
+            self._send_json({"name": "fake", "cluster_name": "bench", "version": {"number": "8.15.0"},
+                             "tagline": "You Know, for Search"})
+        elif path.endswith("/_search"):
+            self._handle_search()
+        elif "/_stats" in path:
+            self._handle_stats(path.split("/")[1])
+        else:
+            self._send_json({"error": f"rota não suportada: {path}"}, status=404)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path.endswith("/_msearch"):
+            self._handle_msearch()
+        elif path.endswith("/_search"):
+            self._handle_search()
+        else:
+            self._read_body()
+            self._send_json({"error": f"rota não suportada: {path}"}, status=404)
+
+    def _handle_search(self):
+        raw = self._read_body()
+        body = json.loads(raw) if raw else {}
+        self.config.count_request()
+        self.config.sleep()
+        self._send_json(self.config.search(body, self.path.split("?")[0].split("/")[1]))
+
+    def _handle_stats(self, index):
+        # Corpus fixo: a versão do índice nunca muda
+        corpus_size = self.config.corpus_size
+        self._send_json({"indices": {index: {
+            "uuid": f"fake-{self.config.seed}",
+            "primaries": {"docs": {"count": corpus_size, "deleted": 0},
+                          "indexing": {"index_total": corpus_size, "delete_total": 0}}
+        }}})
+
+    def _handle_msearch(self):
+        lines = [line for line in self._read_body().decode("utf-8").splitlines() if line.strip()]
+        headers = [json.loads(line) for line in lines[0::2]]
+        bodies = [json.loads(line) for line in lines[1::2]]
+        self.config.count_request()
+        self.config.sleep()
+        self._send_json({"took": int(self.config.latency * 1000),
+                         "responses": [dict(self.config.search(body, header.get("index", "bench")), status=200)
+                                       for header, body in zip(headers, bodies)]})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_fake_elasticsearch(config, host="127.0.0.1", port=0):
+    """
+    Inicia o Elasticsearch falso (protocolo _search/_msearch) em uma thread em segundo plano
+
+    Args:
+        config: FakeElasticsearchConfig
+        host: Endereço de escuta
+        port: Porta (0 escolhe uma porta livre)
+
+    Returns:
+        Tupla (servidor, URL base)
+    """
+    handler = type("FakeElasticsearchHandler", (_Handler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-es", daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Elasticsearch falso disponível em {url}")
+    return server, url
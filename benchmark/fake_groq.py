@@ -0,0 +1,259 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+_QUESTION_RE = re.compile(r'Pergunta do usuário:\s*(.+)')
+_PLAN_QUESTION_RE = re.compile(r'Pergunta:\s*(.+)')
+_SIZE_RE = re.compile(r'"size":\s*(\d+)')
+_WORD_RE = re.compile(r'\w{4,}')
+
+ANSWER_WORDS = ("De acordo com os documentos encontrados, a resposta envolve os pontos principais "
+                "descritos nas fontes, com destaque para os fatos mais recentes e relevantes.").split()
+
+
+class FakeGroqConfig:
+    """Parâmetros do endpoint falso compatível com a API de chat do Groq (OpenAI)"""
+
+    def __init__(self, planning_latency=0.15, first_token_latency=0.2, token_latency=0.005,
+                 completion_tokens=150, jitter=0.02, requests_per_minute=0, tokens_per_minute=0,
+                 text_field="texto", semantic_field="semantic_text"):
+        """
+        Args:
+            planning_latency: Tempo até o primeiro token das chamadas de planejamento de consulta, em segundos
+            first_token_latency: Tempo até o primeiro token das respostas geradas, em segundos
+            token_latency: Intervalo entre tokens sucessivos, em segundos
+            completion_tokens: Número de tokens de cada resposta gerada
+            jitter: Variação aleatória máxima somada às latências, em segundos
+            requests_per_minute: Limite de requisições por minuto, acima do qual responde 429 (0 = sem limite)
+            tokens_per_minute: Limite de tokens por minuto, acima do qual responde 429 (0 = sem limite)
+        """
+        self.planning_latency = planning_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.completion_tokens = completion_tokens
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.rate_limited = 0
+        self._window = deque()  # (instante, tokens) das requisições do último minuto
+        self.text_field = text_field
+        self.semantic_field = semantic_field
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def admit(self, tokens):
+        """
+        Aplica os limites por minuto em uma janela deslizante, como faz a API do Groq
+
+        Returns:
+            Tupla (headers x-ratelimit-*, segundos para retry-after se a requisição foi recusada, ou None)
+        """
+        with self._lock:
+            now = time.time()
+            while self._window and self._window[0][0] <= now - 60:
+                self._window.popleft()
+            used_requests = len(self._window)
+            used_tokens = sum(entry[1] for entry in self._window)
+            rejected = ((self.requests_per_minute and used_requests + 1 > self.requests_per_minute)
+                        or (self.tokens_per_minute and used_tokens + tokens > self.tokens_per_minute))
+            if rejected:
+                self.rate_limited += 1
+            else:
+                self._window.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+            reset = f"{max(0.0, self._window[0][0] + 60 - now):.2f}s" if self._window else "0s"
+            headers = {}
+            if self.requests_per_minute:
+                headers.update({"x-ratelimit-limit-requests": str(self.requests_per_minute),
+                                "x-ratelimit-remaining-requests": str(max(0, self.requests_per_minute - used_requests)),
+                                "x-ratelimit-reset-requests": reset})
+            if self.tokens_per_minute:
+                headers.update({"x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+                                "x-ratelimit-remaining-tokens": str(max(0, self.tokens_per_minute - used_tokens)),
+                                "x-ratelimit-reset-tokens": reset})
+            retry_after = None
+            if rejected:
+                retry_after = max(0.0, self._window[0][0] + 60 - now) if self._window else 1.0
+                headers["retry-after"] = str(max(1, round(retry_after)))
+            return headers, retry_after
+
+    def sleep(self, seconds):
+        time.sleep(seconds + random.uniform(0, self.jitter))
+
+    def plan(self, prompt, json_mode=False):
+        """
+        Gera a resposta de um prompt de planejamento, como faria a LLM: o plano compacto
+        {keywords, filters, size} em JSON mode, ou a consulta RRF completa no modo template
+        """
+        match = _QUESTION_RE.search(prompt) or _PLAN_QUESTION_RE.search(prompt)
+        question = match.group(1).strip() if match else prompt[:200]
+        words = list(dict.fromkeys(_WORD_RE.findall(question.lower())))
+        size_match = _SIZE_RE.search(prompt)
+        max_results = int(size_match.group(1)) if size_match else 5
+        if json_mode:
+            return json.dumps({"keywords": words, "filters": {}, "size": max_results}, ensure_ascii=False)
+        keywords = " OR ".join(f"({word})" for word in words) or "*"
+        return json.dumps({
+            "retriever": {
+                "rrf": {
+                    "retrievers": [
+                        {"standard": {"query": {"query_string": {"default_field": self.text_field, "query": keywords}}}},
+                        {"standard": {"query": {"semantic": {"field": self.semantic_field, "query": question}}}}
+                    ],
+                    "rank_window_size": max_results
+                }
+            },
+            "size": max_results
+        }, ensure_ascii=False, indent=2)
+
+    def answer_tokens(self):
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(self.completion_tokens)]
+
+
+def _usage(messages, completion_tokens):
+    prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split("?")[0].endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "bench"}]})
+        else:
+            self._send_json({"error": {"message": "rota não suportada"}}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json({"error": {"message": "rota não suportada"}}, status=404)
+            return
+
+        self.config.count_request()
+        messages = request.get("messages", [])
+        model = request.get("model", "fake-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        planning = any("consultas Elasticsearch" in message.get("content", "")
+                       for message in messages if message.get("role") == "system")
+
+        estimated_tokens = _usage(messages, request.get("max_tokens") or self.config.completion_tokens)["total_tokens"]
+        rate_headers, retry_after = self.config.admit(estimated_tokens)
+        if retry_after is not None:
+            self._send_json({"error": {"message": "Rate limit reached. Please try again later.",
+                                       "type": "tokens", "code": "rate_limit_exceeded"}},
+                            status=429, headers=rate_headers)
+            return
+
+        if planning:
+            self.config.sleep(self.config.planning_latency)
+            json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+            tokens = [self.config.plan(messages[-1].get("content", ""), json_mode)]
+            completion_tokens = len(tokens[0]) // 4
+            # O tempo de geração cresce com o número de tokens da resposta
+            time.sleep(self.config.token_latency * completion_tokens)
+        else:
+            self.config.sleep(self.config.first_token_latency)
+            tokens = self.config.answer_tokens()
+            completion_tokens = len(tokens)
+
+        if request.get("stream"):
+            self._stream(completion_id, model, tokens, _usage(messages, completion_tokens), rate_headers)
+            return
+
+        if not planning:
+            time.sleep(self.config.token_latency * len(tokens))
+        self._send_json({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                         "finish_reason": "stop"}],
+            "usage": _usage(messages, completion_tokens)
+        }, headers=rate_headers)
+
+    def _stream(self, completion_id, model, tokens, usage, headers):
+        """Envia a resposta como server-sent events, no formato de chunks da API do Groq"""
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(payload):
+            self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None, **extra):
+            return json.dumps(dict({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }, **extra), ensure_ascii=False)
+
+        try:
+            send(chunk({"role": "assistant", "content": ""}))
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(self.config.token_latency)
+                send(chunk({"content": token}))
+            send(chunk({}, "stop", x_groq={"id": completion_id, "usage": usage}))
+            send("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Cliente encerrou o streaming antes do fim")
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_fake_groq(config, host="127.0.0.1", port=0):
+    """
+    Inicia o endpoint falso do Groq (/openai/v1/chat/completions) em uma thread em segundo plano
+
+    Args:
+        config: FakeGroqConfig
+        host: Endereço de escuta
+        port: Porta (0 escolhe uma porta livre)
+
+    Returns:
+        Tupla (servidor, URL base para GROQ_BASE_URL)
+    """
+    handler = type("FakeGroqHandler", (_Handler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Groq falso disponível em {url}")
+    return server, url
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmark.fake_es import FakeElasticsearchConfig, start_fake_elasticsearch
+from benchmark.fake_groq import FakeGroqConfig, start_fake_groq
+
+# Configurar logging (em stderr; apenas avisos, para não interferir nas medições)
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = [
+    "Quais são as últimas notícias sobre a economia brasileira?",
+    "Me resuma 3 notícias de copas do mundo de futebol",
+    "O que aconteceu nas eleições municipais?",
+    "Quais medidas o governo anunciou para a saúde pública?",
+    "Como está a inflação neste ano?",
+    "Notícias sobre educação e escolas públicas",
+    "Quais foram os destaques da cultura e do cinema nacional?",
+    "Previsão de chuva e mudanças no clima nas capitais",
+    "Novidades de ciência e tecnologia no Brasil",
+    "O que os hospitais estão fazendo para reduzir as filas?",
+    "Resultados do mercado financeiro na última semana",
+    "Quais cidades receberam investimentos em infraestrutura?",
+]
+
+
+def percentile(values, p):
+    """Percentil por interpolação linear entre as amostras ordenadas"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(mode, samples, elapsed):
+    """
+    Resume as amostras de um cenário
+
+    Args:
+        mode: Nome do cenário
+        samples: Lista de dicionários {"latency", "ttft", "error", "timings"}
+        elapsed: Duração total do cenário (relógio de parede), em segundos
+
+    Returns:
+        Dicionário com contagens, QPS e percentis de latência (em milissegundos)
+    """
+    def stats(values):
+        return {f"p{p}": round(percentile(values, p) * 1000, 2) for p in (50, 95, 99)} if values else None
+
+    ok = [sample for sample in samples if not sample["error"]]
+    stages = {}
+    for sample in ok:
+        for stage, seconds in sample["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "mode": mode,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "elapsed_s": round(elapsed, 3),
+        "qps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "latency_ms": stats([sample["latency"] for sample in ok]),
+        "ttft_ms": stats([sample["ttft"] for sample in ok if sample["ttft"] is not None]),
+        "stages_ms": {stage: stats(values) for stage, values in sorted(stages.items()) if stage != "total"}
+    }
+
+
+def _sample(latency, trace, ttft=None):
+    return {"latency": latency, "ttft": ttft, "error": trace["error"], "timings": trace["timings"]}
+
+
+def run_sync(pipeline, queries, use_llm_query, requests, concurrency, stream):
+    """Executa o cenário com a pipeline síncrona em um pool de threads"""
+    from utils.metrics import Trace
+    from pipeline import _trace_mode
+
+    def one(index):
+        user_query = queries[index % len(queries)]
+        start = time.perf_counter()
+        if stream:
+            trace = Trace(_trace_mode(use_llm_query))
+            ttft = None
+            for _ in pipeline.process_query_stream(user_query, use_llm_query, trace=trace):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+            return _sample(time.perf_counter() - start, trace.to_dict(), ttft)
+        result = pipeline.process_query(user_query, use_llm_query, return_trace=True)
+        return _sample(time.perf_counter() - start, result["trace"])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as executor:
+        samples = list(executor.map(one, range(requests)))
+    return samples, time.perf_counter() - start
+
+
+async def run_async(pipeline, queries, use_llm_query, requests, concurrency, stream):
+    """Executa o cenário com a pipeline assíncrona, limitando as consultas simultâneas"""
+    from utils.metrics import Trace
+    from pipeline import _trace_mode
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        user_query = queries[index % len(queries)]
+        async with semaphore:
+            start = time.perf_counter()
+            if stream:
+                trace = Trace(_trace_mode(use_llm_query))
+                ttft = None
+                async for _ in pipeline.process_query_stream(user_query, use_llm_query, trace=trace):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                return _sample(time.perf_counter() - start, trace.to_dict(), ttft)
+            result = await pipeline.process_query(user_query, use_llm_query, return_trace=True)
+            return _sample(time.perf_counter() - start, result["trace"])
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*(one(index) for index in range(requests)))
+    return samples, time.perf_counter() - start
+
+
+def configure_environment(es_url, groq_url, with_caches, rerank=False, admission=False):
+    """
+    Aponta a aplicação para os servidores falsos. Precisa ser chamada antes de importar
+    config, que lê as variáveis de ambiente na importação.
+    """
+    os.environ["ES_URL"] = es_url
+    os.environ["ES_API_KEY"] = ""
+    os.environ["GROQ_BASE_URL"] = groq_url
+    if not os.environ.get("GROQ_API_KEY"):
+        os.environ["GROQ_API_KEY"] = "benchmark"
+    if not with_caches:
+        os.environ["ANSWER_CACHE_BACKEND"] = "none"
+        os.environ["QUERY_CACHE_ENABLED"] = "false"
+        os.environ["RETRIEVAL_CACHE_BACKEND"] = "none"
+        os.environ["REQUEST_COALESCING"] = "false"
+    os.environ["RERANK_ENABLED"] = "true" if rerank else "false"
+    os.environ["ADMISSION_ENABLED"] = "true" if admission else "false"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline da pipeline RAG com Elasticsearch e Groq simulados")
+    parser.add_argument("-n", "--requests", type=int, default=100, help="Consultas por cenário")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="Consultas simultâneas")
+    parser.add_argument("--modes", default="llm_query,semantic", help="Cenários separados por vírgula: llm_query, semantic")
+    parser.add_argument("--stream", action="store_true", help="Usa a geração em streaming e mede o tempo até o primeiro token")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Usa a pipeline assíncrona")
+    parser.add_argument("--with-caches", action="store_true", help="Mantém os caches de resposta, de planejamento e de recuperação e a coalescência de consultas habilitados")
+    parser.add_argument("--rerank", action="store_true", help="Habilita o reranking (use --es-hits com a janela de candidatos, ex.: 30)")
+    parser.add_argument("--admission", action="store_true", help="Habilita o controle de admissão (fila limitada, prazo e modo degradado; ajuste com ADMISSION_*)")
+    parser.add_argument("--warmup", type=int, default=5, help="Consultas de aquecimento por cenário (fora das estatísticas)")
+    parser.add_argument("--queries", help="Arquivo JSONL com as perguntas (mesmo formato do batch.py)")
+    parser.add_argument("--es-latency", type=float, default=0.02, help="Latência do Elasticsearch, em segundos")
+    parser.add_argument("--es-hits", type=int, default=5, help="Documentos retornados por consulta")
+    parser.add_argument("--doc-chars", type=int, default=2000, help="Tamanho do texto de cada documento, em caracteres")
+    parser.add_argument("--embedding-dims", type=int, default=384, help="Dimensões dos embeddings no campo semantic_text")
+    parser.add_argument("--planning-latency", type=float, default=0.15, help="Latência das chamadas de planejamento, em segundos")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="Tempo até o primeiro token da resposta, em segundos")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Intervalo entre tokens da resposta, em segundos")
+    parser.add_argument("--completion-tokens", type=int, default=150, help="Tokens de cada resposta gerada")
+    parser.add_argument("--groq-rpm", type=int, default=0, help="Limite de requisições por minuto do Groq simulado (0 = sem limite)")
+    parser.add_argument("--groq-tpm", type=int, default=0, help="Limite de tokens por minuto do Groq simulado (0 = sem limite)")
+    parser.add_argument("-o", "--output", help="Arquivo JSON com os resultados (padrão: apenas a tabela em stdout)")
+    args = parser.parse_args()
+
+    es_config = FakeElasticsearchConfig(latency=args.es_latency, jitter=args.es_latency / 2, hits=args.es_hits,
+                                        doc_chars=args.doc_chars, embedding_dims=args.embedding_dims)
+    groq_config = FakeGroqConfig(planning_latency=args.planning_latency, first_token_latency=args.first_token_latency,
+                                 token_latency=args.token_latency, completion_tokens=args.completion_tokens,
+                                 requests_per_minute=args.groq_rpm, tokens_per_minute=args.groq_tpm)
+    es_server, es_url = start_fake_elasticsearch(es_config)
+    groq_server, groq_url = start_fake_groq(groq_config)
+    configure_environment(es_url, groq_url, args.with_caches, args.rerank, args.admission)
+
+    # Importações feitas depois de configurar o ambiente
+    from config import ES_TEXT_FIELD, ES_SEMANTIC_FIELD
+    from pipeline import RAGPipeline, AsyncRAGPipeline
+    from utils.client_manager import client_manager
+
+    es_config.text_field = groq_config.text_field = ES_TEXT_FIELD
+    es_config.semantic_field = groq_config.semantic_field = ES_SEMANTIC_FIELD
+
+    if args.queries:
+        from batch import read_queries
+        with open(args.queries, encoding="utf-8") as input_file:
+            queries = list(read_queries(input_file, []))
+    else:
+        queries = DEFAULT_QUERIES
+
+    results = []
+    try:
+        if args.use_async:
+            async def run_all():
+                es_client, llm_client = client_manager.create_async_clients()
+                pipeline = AsyncRAGPipeline(es_client=es_client, llm_client=llm_client)
+                try:
+                    for mode in args.modes.split(","):
+                        use_llm_query = mode.strip() == "llm_query"
+                        await run_async(pipeline, queries, use_llm_query, args.warmup, args.concurrency, args.stream)
+                        samples, elapsed = await run_async(pipeline, queries, use_llm_query, args.requests,
+                                                           args.concurrency, args.stream)
+                        results.append(dict(summarize(mode.strip(), samples, elapsed), caches=pipeline.cache_stats()))
+                finally:
+                    await pipeline.close()
+            asyncio.run(run_all())
+        else:
+            pipeline = RAGPipeline(es_client=client_manager.get_es_client(), llm_client=client_manager.get_llm_client())
+            try:
+                for mode in args.modes.split(","):
+                    use_llm_query = mode.strip() == "llm_query"
+                    run_sync(pipeline, queries, use_llm_query, args.warmup, args.concurrency, args.stream)
+                    samples, elapsed = run_sync(pipeline, queries, use_llm_query, args.requests, args.concurrency, args.stream)
+                    results.append(dict(summarize(mode.strip(), samples, elapsed), caches=pipeline.cache_stats()))
+            finally:
+                pipeline.close()
+    finally:
+        es_server.shutdown()
+        groq_server.shutdown()
+
+    print(f"{'cenário':<10} {'req':>5} {'erros':>5} {'QPS':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'TTFT p50':>9}")
+    for result in results:
+        latency = result["latency_ms"] or {}
+        ttft = result["ttft_ms"] or {}
+        print(f"{result['mode']:<10} {result['requests']:>5} {result['errors']:>5} {result['qps'] or 0:>8.2f} "
+              f"{latency.get('p50', 0):>9.1f} {latency.get('p95', 0):>9.1f} {latency.get('p99', 0):>9.1f} "
+              f"{ttft.get('p50', 0):>9.1f}")
+
+    if args.output:
+        report = {
+            "parameters": vars(args),
+            "fake_requests": {"elasticsearch": es_config.requests, "groq": groq_config.requests,
+                              "groq_rate_limited": groq_config.rate_limited},
+            "results": results
+        }
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+        logger.warning(f"Resultados salvos em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
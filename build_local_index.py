@@ -0,0 +1,45 @@
+import argparse
+import logging
+from config import (ES_TEXT_FIELD, LOCAL_RETRIEVER_PATH, LOCAL_RETRIEVER_MODEL, INGEST_CHUNK_TOKENS,
+                    INGEST_CHUNK_OVERLAP)
+from utils.ingestion import INPUT_FORMATS, build_actions, read_documents
+from utils.local_retriever import QueryEncoder, build_local_index
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o índice do mecanismo de recuperação local (embeddings + BM25)")
+    parser.add_argument("inputs", nargs="+", help="Arquivos ou diretórios com os documentos (os mesmos do ingest.py)")
+    parser.add_argument("--format", choices=INPUT_FORMATS, help="Formato dos arquivos (padrão: detectado pela extensão)")
+    parser.add_argument("-o", "--output", default=LOCAL_RETRIEVER_PATH, help="Diretório do índice local")
+    parser.add_argument("--text-field", default=ES_TEXT_FIELD, help="Campo com o texto dos documentos")
+    parser.add_argument("--id-field", default="id", help="Campo com o identificador do documento na origem")
+    parser.add_argument("--embedding-field", help="Campo com o embedding pré-calculado de cada documento (dispensa o modelo)")
+    parser.add_argument("--model", default=LOCAL_RETRIEVER_MODEL, help="Modelo sentence-transformers dos embeddings")
+    parser.add_argument("--no-embeddings", action="store_true", help="Gera apenas o índice BM25")
+    parser.add_argument("--batch-size", type=int, default=64, help="Documentos por lote na geração dos embeddings")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Número de listas IVF (0 = busca exaustiva)")
+    parser.add_argument("--chunk-tokens", type=int, default=INGEST_CHUNK_TOKENS, help="Tamanho máximo de cada trecho, em tokens estimados")
+    parser.add_argument("--chunk-overlap", type=int, default=INGEST_CHUNK_OVERLAP, help="Tokens repetidos entre trechos consecutivos")
+    args = parser.parse_args()
+
+    encoder = None
+    if not args.no_embeddings and not args.embedding_field:
+        encoder = QueryEncoder(args.model)
+        if not encoder.available:
+            parser.error("sentence-transformers não instalado: use --embedding-field, --no-embeddings ou "
+                         "instale o pacote (pip install sentence-transformers)")
+
+    # Mesma divisão em trechos e mesmos _ids (hash do conteúdo) da ingestão no Elasticsearch. Embeddings
+    # pré-calculados correspondem ao documento inteiro, que então não é dividido
+    max_tokens = float("inf") if args.embedding_field else args.chunk_tokens
+    documents = read_documents(args.inputs, args.format, args.text_field)
+    actions = build_actions(documents, text_field=args.text_field, id_field=args.id_field,
+                            max_tokens=max_tokens, overlap_tokens=args.chunk_overlap)
+    build_local_index(((action["_id"], action["_source"]) for action in actions), args.output, args.text_field,
+                      args.embedding_field, encoder, args.batch_size, args.ivf_lists)
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,169 @@ load_dotenv()
 # Configurações do Elasticsearch
 ES_CLOUD_ID = os.getenv("ES_CLOUD_ID", "")
 ES_API_KEY = os.getenv("ES_API_KEY", "")
+ES_URL = os.getenv("ES_URL", "")  # URL de um Elasticsearch on-prem ou local (tem precedência sobre ES_CLOUD_ID)
 ES_INDEX = os.getenv("ES_INDEX", "documentos")
+ES_INDICES = [index.strip() for index in (os.getenv("ES_INDICES") or ES_INDEX).split(",") if index.strip()]  # Índices consultados por padrão (lista separada por vírgula)
+# Índices de cada tenant, no formato "tenant:indice1|indice2,outro_tenant:indice3"
+ES_TENANT_INDICES = {tenant.strip(): [index.strip() for index in indices.split("|") if index.strip()]
+                     for tenant, _, indices in (item.partition(":") for item in os.getenv("ES_TENANT_INDICES", "").split(",") if item.strip())}
+# Número máximo de documentos de cada índice na busca em vários índices, no formato "indice1:3,indice2:2"
+ES_INDEX_BUDGETS = {index.strip(): int(budget)
+                    for index, _, budget in (item.partition(":") for item in os.getenv("ES_INDEX_BUDGETS", "").split(",") if item.strip())}
+ES_MERGE_STRATEGY = os.getenv("ES_MERGE_STRATEGY", "rrf").lower()  # Combinação dos resultados de vários índices: rrf ou score (scores normalizados por índice)
 ES_TIMEOUT = int(os.getenv("ES_TIMEOUT", "30"))
 ES_MAX_RESULTS = int(os.getenv("ES_MAX_RESULTS", "5"))
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "10"))  # Tamanho do pool de conexões HTTP por nó
 ES_TEXT_FIELD = os.getenv("ES_TEXT_FIELD", "texto")  # Campo de texto principal para consultas
 ES_SEMANTIC_FIELD = os.getenv("ES_SEMANTIC_FIELD", "semantic_text")  # Campo vetorizado
+# Filtragem do _source retornado (listas separadas por vírgula). Por padrão exclui o campo vetorizado (chunks e embeddings)
+ES_SOURCE_INCLUDES = [field.strip() for field in os.getenv("ES_SOURCE_INCLUDES", "").split(",") if field.strip()]
+ES_SOURCE_EXCLUDES = [field.strip() for field in os.getenv("ES_SOURCE_EXCLUDES", ES_SEMANTIC_FIELD).split(",") if field.strip()]
+# Highlight: retorna os melhores fragmentos do campo de texto, usados como passagens no contexto
+ES_HIGHLIGHT = os.getenv("ES_HIGHLIGHT", "false").lower() == "true"
+ES_HIGHLIGHT_FIELD = os.getenv("ES_HIGHLIGHT_FIELD", ES_TEXT_FIELD)
+ES_HIGHLIGHT_FRAGMENT_SIZE = int(os.getenv("ES_HIGHLIGHT_FRAGMENT_SIZE", "300"))  # Tamanho de cada fragmento, em caracteres
+ES_HIGHLIGHT_FRAGMENTS = int(os.getenv("ES_HIGHLIGHT_FRAGMENTS", "3"))  # Número de fragmentos por documento
 
 # Configurações da LLM (Groq)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "")  # Endpoint alternativo compatível com a API do Groq (opcional)
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.3"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))  # Tamanho do pool de conexões HTTP com o Groq
+GROQ_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GROQ_MAX_KEEPALIVE_CONNECTIONS", "10"))  # Conexões mantidas abertas (keep-alive)
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # Tempo que uma conexão ociosa permanece aberta, em segundos
+
+# Configurações do agendador de chamadas ao Groq (limites de taxa, concorrência, prioridade e novas tentativas)
+GROQ_SCHEDULER_ENABLED = os.getenv("GROQ_SCHEDULER_ENABLED", "true").lower() == "true"
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))  # Chamadas simultâneas ao Groq
+GROQ_RPM_LIMIT = int(os.getenv("GROQ_RPM_LIMIT", "0"))  # Requisições por minuto por modelo (0 = apenas os limites informados pela API)
+GROQ_TPM_LIMIT = int(os.getenv("GROQ_TPM_LIMIT", "0"))  # Tokens por minuto por modelo (0 = obtido dos headers da API)
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))  # Novas tentativas em erros 429, timeouts e 5xx
+GROQ_RETRY_BASE_DELAY = float(os.getenv("GROQ_RETRY_BASE_DELAY", "0.5"))  # Espera base do backoff exponencial, em segundos
+GROQ_RETRY_MAX_DELAY = float(os.getenv("GROQ_RETRY_MAX_DELAY", "8"))  # Espera máxima entre tentativas, em segundos
+GROQ_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("GROQ_COMPLETION_TOKENS_ESTIMATE", "400"))  # Tokens de resposta estimados quando max_tokens não é informado
+GROQ_FALLBACK_MODEL = os.getenv("GROQ_FALLBACK_MODEL", "")  # Modelo menor e mais rápido usado com a fila longa (ex.: llama3-8b-8192; vazio desativa)
+GROQ_FALLBACK_QUEUE_DEPTH = int(os.getenv("GROQ_FALLBACK_QUEUE_DEPTH", "8"))  # Chamadas na fila a partir das quais o modelo alternativo é usado
+
+# Configurações do planejamento de consultas pela LLM (use_llm_query=True)
+QUERY_PLANNING_MODE = os.getenv("QUERY_PLANNING_MODE", "json")  # json (plano compacto em JSON mode) ou template (consulta RRF completa gerada pela LLM)
+QUERY_PLANNING_MAX_TOKENS = int(os.getenv("QUERY_PLANNING_MAX_TOKENS", "200"))  # Limite de tokens da resposta do planejamento em JSON mode
+QUERY_PLANNING_TEMPERATURE = float(os.getenv("QUERY_PLANNING_TEMPERATURE", "0"))  # Temperatura do planejamento em JSON mode
+QUERY_PLANNING_RETRIES = int(os.getenv("QUERY_PLANNING_RETRIES", "1"))  # Novas tentativas quando o plano retornado é inválido
+QUERY_PLANNING_FILTER_FIELDS = [field.strip() for field in os.getenv("QUERY_PLANNING_FILTER_FIELDS", "").split(",") if field.strip()]  # Campos que a LLM pode usar como filtro
+
+# Configurações da montagem do contexto enviado à LLM
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))  # Orçamento total de tokens (aproximado) do contexto
+CONTEXT_MAX_TOKENS_PER_DOC = int(os.getenv("CONTEXT_MAX_TOKENS_PER_DOC", "800"))  # Tokens máximos por documento
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # Similaridade a partir da qual trechos são considerados duplicados
+
+# Configurações da aplicação
+ASYNC_PIPELINE = os.getenv("ASYNC_PIPELINE", "false").lower() == "true"  # Usa a pipeline assíncrona (asyncio) na interface
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() == "true"  # Conecta e aquece os clientes na inicialização do processo
+HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", "30"))  # Intervalo da verificação de saúde em segundo plano, em segundos (0 desativa)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Porta do endpoint /metrics no formato Prometheus (0 desativa)
+
+# Configurações do cache de respostas
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")  # memory, sqlite ou none
+ANSWER_CACHE_MAX_SIZE = int(os.getenv("ANSWER_CACHE_MAX_SIZE", "1000"))  # Número máximo de respostas armazenadas
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))  # Tempo de vida de cada resposta, em segundos
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite3")  # Arquivo usado pelo backend sqlite
+
+# Configurações do cache de consultas geradas pela LLM (use_llm_query=True)
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_MAX_SIZE = int(os.getenv("QUERY_CACHE_MAX_SIZE", "5000"))  # Número máximo de consultas armazenadas
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))  # Tempo de vida de cada consulta, em segundos
+
+# Configurações do cache de resultados da recuperação (consultas enviadas ao Elasticsearch)
+RETRIEVAL_CACHE_BACKEND = os.getenv("RETRIEVAL_CACHE_BACKEND", "memory")  # memory, sqlite ou none
+RETRIEVAL_CACHE_MAX_SIZE = int(os.getenv("RETRIEVAL_CACHE_MAX_SIZE", "2000"))  # Número máximo de resultados armazenados
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))  # Tempo de vida de cada resultado, em segundos
+RETRIEVAL_CACHE_PATH = os.getenv("RETRIEVAL_CACHE_PATH", "retrieval_cache.sqlite3")  # Arquivo usado pelo backend sqlite
+RETRIEVAL_CACHE_VERSION_INTERVAL = float(os.getenv("RETRIEVAL_CACHE_VERSION_INTERVAL", "5"))  # Intervalo entre as verificações da versão do índice, em segundos
+
+# Configurações da extração de palavras-chave (busca sem LLM e fallback do planejamento)
+KEYWORDS_MAX_TERMS = int(os.getenv("KEYWORDS_MAX_TERMS", "8"))  # Número máximo de termos na expressão query_string
+
+# Configurações do índice local BM25 (camada em memória antes do Elasticsearch)
+LOCAL_INDEX_ENABLED = os.getenv("LOCAL_INDEX_ENABLED", "false").lower() == "true"
+LOCAL_INDEX_MAX_DOCS = int(os.getenv("LOCAL_INDEX_MAX_DOCS", "2000"))  # Número máximo de documentos mantidos em memória
+LOCAL_INDEX_TTL = int(os.getenv("LOCAL_INDEX_TTL", "600"))  # Tempo de vida de cada documento no índice local, em segundos
+LOCAL_INDEX_MIN_COVERAGE = float(os.getenv("LOCAL_INDEX_MIN_COVERAGE", "1.0"))  # Fração mínima dos termos da consulta conhecidos localmente
+LOCAL_INDEX_MIN_MARGIN = float(os.getenv("LOCAL_INDEX_MIN_MARGIN", "0.25"))  # Separação mínima (relativa) entre o último documento retornado e o seguinte
+
+# Configurações do mecanismo de recuperação (elasticsearch, local ou fallback = Elasticsearch com o mecanismo local nas falhas)
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "elasticsearch").lower()
+RETRIEVER_FALLBACK_TIMEOUT = float(os.getenv("RETRIEVER_FALLBACK_TIMEOUT", "3"))  # Timeout das consultas ao Elasticsearch no modo fallback, em segundos
+RETRIEVER_FALLBACK_COOLDOWN = float(os.getenv("RETRIEVER_FALLBACK_COOLDOWN", "30"))  # Tempo em modo degradado (apenas local) depois de uma falha, em segundos
+
+# Configurações do mecanismo de recuperação local (vetores + BM25 com RRF em processo; índice gerado por build_local_index.py)
+LOCAL_RETRIEVER_PATH = os.getenv("LOCAL_RETRIEVER_PATH", "local_index")  # Diretório do índice local
+LOCAL_RETRIEVER_MODEL = os.getenv("LOCAL_RETRIEVER_MODEL", "intfloat/multilingual-e5-small")  # Modelo sentence-transformers das consultas (o mesmo dos documentos)
+LOCAL_RETRIEVER_NPROBE = int(os.getenv("LOCAL_RETRIEVER_NPROBE", "8"))  # Listas IVF visitadas por consulta (se o índice tiver IVF)
+LOCAL_RETRIEVER_BLOCK_ROWS = int(os.getenv("LOCAL_RETRIEVER_BLOCK_ROWS", "65536"))  # Vetores comparados por bloco na busca exaustiva
+
+# Configurações do reranking (candidatos da recuperação reordenados em CPU antes da geração)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_WINDOW = int(os.getenv("RERANK_WINDOW", "30"))  # Candidatos buscados para o reranking
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", str(ES_MAX_RESULTS)))  # Documentos enviados à LLM depois do reranking
+RERANK_MAX_CHARS = int(os.getenv("RERANK_MAX_CHARS", "2000"))  # Caracteres de cada documento considerados no score
+RERANK_EMBEDDINGS = os.getenv("RERANK_EMBEDDINGS", "false").lower() == "true"  # Similaridade de embeddings (requer sentence-transformers)
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.4"))  # Peso do BM25 dos termos da pergunta
+RERANK_COVERAGE_WEIGHT = float(os.getenv("RERANK_COVERAGE_WEIGHT", "0.3"))  # Peso da fração (por idf) dos termos da pergunta presentes
+RERANK_PROXIMITY_WEIGHT = float(os.getenv("RERANK_PROXIMITY_WEIGHT", "0.1"))  # Peso dos pares de termos consecutivos da pergunta
+RERANK_RETRIEVAL_WEIGHT = float(os.getenv("RERANK_RETRIEVAL_WEIGHT", "0.3"))  # Peso da posição na recuperação original
+RERANK_EMBEDDING_WEIGHT = float(os.getenv("RERANK_EMBEDDING_WEIGHT", "0.5"))  # Peso da similaridade de embeddings
+
+# Configurações da recuperação especulativa (use_llm_query=True)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"  # Executa a busca heurística em paralelo ao planejamento da LLM
+PLANNING_DEADLINE = float(os.getenv("PLANNING_DEADLINE", "1.5"))  # Tempo máximo de espera pelo planejamento da LLM, em segundos
+SPECULATIVE_MAX_WORKERS = int(os.getenv("SPECULATIVE_MAX_WORKERS", "16"))  # Threads usadas pela pipeline síncrona
+
+# Configurações da coalescência de consultas idênticas simultâneas (single-flight)
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() == "true"
+
+# Configurações do controle de admissão das consultas interativas (interface Gradio)
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))  # Consultas processadas simultaneamente
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))  # Consultas aguardando vaga; com a fila cheia, as novas são recusadas
+ADMISSION_RETRIEVAL_CONCURRENCY = int(os.getenv("ADMISSION_RETRIEVAL_CONCURRENCY", "16"))  # Recuperações (planejamento + busca) simultâneas (0 = sem limite)
+ADMISSION_GENERATION_CONCURRENCY = int(os.getenv("ADMISSION_GENERATION_CONCURRENCY", "16"))  # Gerações de resposta simultâneas (0 = sem limite)
+ADMISSION_DEADLINE = float(os.getenv("ADMISSION_DEADLINE", "20"))  # Espera máxima do usuário até a chamada ao Groq, em segundos (0 = sem prazo)
+ADMISSION_DEGRADE_QUEUE_DEPTH = int(os.getenv("ADMISSION_DEGRADE_QUEUE_DEPTH", "8"))  # Consultas na fila a partir das quais a busca semântica direta substitui o planejamento pela LLM (0 = nunca)
+
+# Configurações do modo conversa (chat com múltiplos turnos)
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))  # Número máximo de sessões mantidas em memória
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "3600"))  # Tempo de inatividade até a sessão expirar, em segundos
+CHAT_MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "6"))  # Turnos mantidos na íntegra antes de resumir os mais antigos
+CHAT_KEEP_TURNS = int(os.getenv("CHAT_KEEP_TURNS", "2"))  # Turnos recentes preservados na íntegra após o resumo
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "800"))  # Orçamento de tokens do histórico no prompt
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "200"))  # Limite de tokens do resumo dos turnos antigos
+CHAT_TOPIC_OVERLAP = float(os.getenv("CHAT_TOPIC_OVERLAP", "0.3"))  # Fração mínima de termos em comum para considerar a pergunta uma continuação
+CHAT_DELTA_SIZE = int(os.getenv("CHAT_DELTA_SIZE", "3"))  # Documentos buscados para os termos novos de uma continuação
+
+# Configurações do processamento em lote
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))  # Chamadas simultâneas à LLM
+BATCH_MSEARCH_SIZE = int(os.getenv("BATCH_MSEARCH_SIZE", "100"))  # Consultas por requisição _msearch
+
+# Configurações da API HTTP (api.py)
+API_HOST = os.getenv("API_HOST", "0.0.0.0")  # Endereço de escuta
+API_PORT = int(os.getenv("API_PORT", "8000"))  # Porta de escuta
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))  # Processos que atendem as requisições, sem estado compartilhado
+API_SHUTDOWN_TIMEOUT = float(os.getenv("API_SHUTDOWN_TIMEOUT", "30"))  # Espera máxima pelas requisições em andamento no encerramento, em segundos
+API_MAX_BATCH_SIZE = int(os.getenv("API_MAX_BATCH_SIZE", "1000"))  # Perguntas por requisição ao /batch
+API_MAX_BODY_BYTES = int(os.getenv("API_MAX_BODY_BYTES", str(10 * 1024 * 1024)))  # Tamanho máximo do corpo das requisições
+API_ACCESS_LOG = os.getenv("API_ACCESS_LOG", "false").lower() == "true"  # Registra cada requisição no log (custo por requisição em QPS alto)
+
+# Configurações da ingestão de documentos (ingest.py)
+INGEST_INFERENCE_ID = os.getenv("INGEST_INFERENCE_ID", ".multilingual-e5-small-elasticsearch")  # Endpoint de inferência do campo semantic_text
+INGEST_CHUNK_TOKENS = int(os.getenv("INGEST_CHUNK_TOKENS", "400"))  # Tamanho máximo de cada trecho indexado, em tokens estimados
+INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "50"))  # Tokens repetidos entre trechos consecutivos
+INGEST_BULK_SIZE = int(os.getenv("INGEST_BULK_SIZE", "100"))  # Documentos por requisição _bulk
+INGEST_BULK_MAX_BYTES = int(os.getenv("INGEST_BULK_MAX_BYTES", str(10 * 1024 * 1024)))  # Tamanho máximo de cada requisição _bulk
+INGEST_THREADS = int(os.getenv("INGEST_THREADS", "4"))  # Requisições _bulk simultâneas
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))  # Novas tentativas dos documentos recusados com 429
+INGEST_REQUEST_TIMEOUT = int(os.getenv("INGEST_REQUEST_TIMEOUT", "120"))  # Timeout das requisições _bulk (a inferência do semantic_text é lenta), em segundos
 
 # Prompt templates
 ELASTICSEARCH_QUERY_TEMPLATE = """
@@ -79,6 +232,33 @@ Formate a consulta Elasticsearch como JSON seguindo este modelo:
 Você DEVE substituir "PALAVRAS_CHAVE_AQUI" pelas palavras-chave relevantes que você extraiu da pergunta do usuário, formatadas como expressão booleana com operadores OR.
 """
 
+QUERY_PLANNING_TEMPLATE = """
+Extraia da pergunta abaixo o plano de uma busca textual e responda apenas com um objeto JSON no formato:
+{{"keywords": ["termo", "expressão composta"], "filters": {{}}, "size": {max_results}}}
+
+- keywords: até {max_keywords} palavras-chave ou expressões relevantes da pergunta (sem stop words), incluindo sinônimos úteis
+- filters: {filters_hint}
+- size: número de documentos necessários para responder (de 1 a {max_results})
+
+Pergunta: {query}
+"""
+
+CHAT_HISTORY_TEMPLATE = """
+Histórico da conversa (use-o apenas para entender a pergunta atual, por exemplo referências a respostas anteriores):
+{history}
+"""
+
+CHAT_SUMMARY_TEMPLATE = """
+Resuma a conversa abaixo em até 5 frases, em português, preservando os assuntos, nomes, datas e conclusões que possam ser necessários para as próximas perguntas.
+
+{summary}
+
+{turns}
+"""
+
+# Versão do template de resposta. Altere sempre que modificar o template para invalidar o cache de respostas
+RESPONSE_TEMPLATE_VERSION = "2"
+
 RESPONSE_GENERATION_TEMPLATE = """
 Você é um assistente especializado em fornecer respostas precisas com base no contexto fornecido.
 
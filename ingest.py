@@ -0,0 +1,48 @@
+import argparse
+import logging
+from config import (ES_INDEX, ES_TEXT_FIELD, ANSWER_CACHE_BACKEND, INGEST_CHUNK_TOKENS, INGEST_CHUNK_OVERLAP, INGEST_BULK_SIZE,
+                    INGEST_BULK_MAX_BYTES, INGEST_THREADS, INGEST_MAX_RETRIES)
+from utils.answer_cache import SQLiteAnswerCache
+from utils.ingestion import INPUT_FORMATS, DocumentIngestor, read_documents
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexa documentos (JSONL, CSV ou texto) no índice semantic_text do Elasticsearch")
+    parser.add_argument("inputs", nargs="+", help="Arquivos ou diretórios com os documentos")
+    parser.add_argument("--format", choices=INPUT_FORMATS, help="Formato dos arquivos (padrão: detectado pela extensão)")
+    parser.add_argument("--index", default=ES_INDEX, help="Índice de destino")
+    parser.add_argument("--create-index", action="store_true", help="Cria o índice com o mapeamento semantic_text, se não existir")
+    parser.add_argument("--text-field", default=ES_TEXT_FIELD, help="Campo com o texto dos documentos")
+    parser.add_argument("--id-field", default="id", help="Campo com o identificador do documento na origem")
+    parser.add_argument("--chunk-tokens", type=int, default=INGEST_CHUNK_TOKENS, help="Tamanho máximo de cada trecho, em tokens estimados")
+    parser.add_argument("--chunk-overlap", type=int, default=INGEST_CHUNK_OVERLAP, help="Tokens repetidos entre trechos consecutivos")
+    parser.add_argument("--threads", type=int, default=INGEST_THREADS, help="Requisições _bulk simultâneas")
+    parser.add_argument("--bulk-size", type=int, default=INGEST_BULK_SIZE, help="Documentos por requisição _bulk")
+    parser.add_argument("--max-bytes", type=int, default=INGEST_BULK_MAX_BYTES, help="Tamanho máximo de cada requisição _bulk")
+    parser.add_argument("--max-retries", type=int, default=INGEST_MAX_RETRIES, help="Novas tentativas dos documentos recusados com 429")
+    parser.add_argument("--keep-answer-cache", action="store_true", help="Não remove do cache de respostas em disco as respostas do índice")
+    args = parser.parse_args()
+
+    ingestor = DocumentIngestor(index=args.index, text_field=args.text_field, bulk_size=args.bulk_size,
+                                max_bytes=args.max_bytes, threads=args.threads, max_retries=args.max_retries)
+    try:
+        if args.create_index:
+            ingestor.create_index()
+        documents = read_documents(args.inputs, args.format, args.text_field)
+        stats = ingestor.ingest(documents, args.id_field, args.chunk_tokens, args.chunk_overlap)
+    finally:
+        ingestor.es.close()
+
+    # As respostas em cache do índice foram geradas sem os documentos novos. Só o cache em disco (SQLite) é
+    # compartilhado com a aplicação; no cache em memória, as respostas expiram pelo TTL
+    if stats["indexed"] and ANSWER_CACHE_BACKEND == "sqlite" and not args.keep_answer_cache:
+        SQLiteAnswerCache().invalidate_index(args.index)
+
+    if stats["failed"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
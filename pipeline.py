@@ -0,0 +1,1021 @@
+import logging
+import time
+import asyncio
+import contextvars
+from itertools import islice
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from config import (ES_MAX_RESULTS, SPECULATIVE_RETRIEVAL, PLANNING_DEADLINE, SPECULATIVE_MAX_WORKERS,
+                    BATCH_MAX_CONCURRENCY, BATCH_MSEARCH_SIZE, CHAT_DELTA_SIZE, REQUEST_COALESCING, ADMISSION_ENABLED)
+from utils.es_client import same_keywords, build_rrf_query, search_indices, current_indices
+from utils.client_manager import create_retriever, create_async_retriever
+from utils.keywords import build_keyword_expression
+from utils.conversation import ConversationStore, RETRIEVAL_REUSE, RETRIEVAL_DELTA
+from utils.llm_client import LLMClient, AsyncLLMClient
+from utils.answer_cache import create_answer_cache, normalize_query
+from utils.single_flight import SingleFlight, AsyncSingleFlight
+from utils.groq_scheduler import llm_priority, PRIORITY_BATCH
+from utils.admission import (AdmissionController, AsyncAdmissionController, AdmissionError, STAGE_RETRIEVAL,
+                             STAGE_GENERATION)
+from utils.metrics import Trace, activate, current_trace, iterate_in_trace, aiterate_in_trace
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+NO_RESULTS_MESSAGE = "Não encontrei informações relevantes para responder sua pergunta."
+
+def _chunked(iterable, size):
+    """Divide um iterável em listas de até size itens, sem carregá-lo inteiro em memória"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _batch_result(index, user_query, documents=None, answer=None, error=None, trace=None):
+    """Monta o resultado de uma consulta processada em lote"""
+    return {
+        "index": index,
+        "query": user_query,
+        "answer": answer,
+        "document_ids": [doc["id"] for doc in documents] if documents else [],
+        "error": str(error) if error is not None else None,
+        "trace": trace.to_dict() if trace is not None else None
+    }
+
+def _batch_trace(documents):
+    """Cria o trace da geração da resposta de uma pergunta do lote"""
+    trace = Trace("batch")
+    trace.set("hits", len(documents))
+    return trace
+
+def _batch_answered(index, user_query, documents, trace, answer=None, error=None):
+    """Finaliza o trace de uma pergunta do lote e monta o seu resultado (com a resposta ou o erro da geração)"""
+    if error is not None:
+        logger.error(f"Erro ao gerar resposta da consulta {index}: {str(error)}")
+    trace.finish(error)
+    return _batch_result(index, user_query, documents, answer=answer, error=error, trace=trace)
+
+def _batch_searched(offset, chunk, search_results):
+    """
+    Separa os resultados do _msearch de um bloco do lote
+    
+    Returns:
+        Tupla (resultados das consultas que falharam, lista de (posição, pergunta, documentos) a responder)
+    """
+    failed, pending = [], []
+    for i, (user_query, documents) in enumerate(zip(chunk, search_results)):
+        if isinstance(documents, Exception):
+            failed.append(_batch_result(offset + i, user_query, error=documents))
+        else:
+            pending.append((offset + i, user_query, documents))
+    return failed, pending
+
+def _merge_documents(new_documents, previous_documents, limit=ES_MAX_RESULTS):
+    """Junta os documentos da busca incremental aos do turno anterior, sem repetições"""
+    merged = {}
+    for doc in list(new_documents) + list(previous_documents):
+        merged.setdefault((doc.get("index"), doc["id"]), doc)
+    return list(merged.values())[:limit]
+
+def _error_message(error):
+    """Mensagem exibida ao usuário quando a consulta falha (as consultas descartadas pelo controle de admissão têm mensagem própria)"""
+    if isinstance(error, AdmissionError):
+        return str(error)
+    return f"Ocorreu um erro ao processar sua consulta: {str(error)}"
+
+def _failure_message(error, subject="consulta"):
+    """Registra a falha no processamento e retorna a mensagem exibida ao usuário"""
+    logger.error(f"Erro ao processar {subject}: {str(error)}")
+    return _error_message(error)
+
+def _log_search(start_time, documents):
+    logger.info(f"Busca concluída em {time.time() - start_time:.2f} segundos. Encontrados {len(documents)} documentos.")
+
+def _planning_timed_out(trace):
+    # O planejamento continua em segundo plano e, se válido, aquece o cache de consultas
+    logger.warning(f"Planejamento da LLM excedeu {PLANNING_DEADLINE:.2f} segundos. Usando resultados heurísticos")
+    trace.event("planning_timeout")
+
+def _planning_failed(error, trace):
+    logger.error(f"Erro no planejamento da consulta com LLM: {str(error)}. Usando resultados heurísticos")
+    trace.event("planning_error")
+
+def _speculative_choice(es_query, heuristic_query, trace):
+    """
+    Escolhe entre a consulta planejada pela LLM e os resultados heurísticos da recuperação especulativa
+    
+    Returns:
+        A consulta planejada, ou None se os resultados heurísticos devem ser usados
+    """
+    if es_query is None:
+        logger.warning("Consulta planejada pela LLM inválida ou indisponível. Usando resultados heurísticos")
+    elif same_keywords(es_query, heuristic_query):
+        logger.info("Consulta planejada usa as mesmas palavras-chave da heurística. Usando resultados heurísticos")
+        es_query = None
+    if es_query is None:
+        trace.event("speculative_heuristic_used")
+    else:
+        trace.event("speculative_plan_used")
+        logger.info("Executando consulta planejada pela LLM no Elasticsearch")
+    return es_query
+
+def _trace_mode(use_llm_query):
+    return "llm_query" if use_llm_query else "semantic"
+
+def _flight_key(user_query, use_llm_query, indices=None):
+    """Chave da coalescência de consultas: a pergunta normalizada (como no cache de respostas), o modo e os índices"""
+    return normalize_query(user_query), _trace_mode(use_llm_query), tuple(indices or ())
+
+class _StreamedAnswer:
+    """Acumula os trechos de uma resposta gerada em streaming, registrando o primeiro token e o tempo de geração no trace"""
+    
+    def __init__(self, trace, start_time=None):
+        """
+        Args:
+            trace: Trace da consulta
+            start_time: Início da consulta, para registrar no log o tempo até o primeiro token (opcional)
+        """
+        self.trace = trace
+        self.start_time = start_time
+        self.chunks = []
+        self._generation_start = time.time()
+    
+    def add(self, delta):
+        if not self.chunks:
+            self.trace.mark("first_token")
+            if self.start_time is not None:
+                logger.info(f"Primeiro token recebido em {time.time() - self.start_time:.2f} segundos")
+        self.chunks.append(delta)
+        return delta
+    
+    def finish(self):
+        """Registra o tempo de geração e retorna a resposta completa"""
+        self.trace.add_timing("generation", time.time() - self._generation_start)
+        return "".join(self.chunks)
+
+@contextmanager
+def _summarizing():
+    """
+    Bloco do resumo dos turnos antigos da conversa: feito depois da resposta, cede a vez às
+    chamadas interativas, e suas falhas não interrompem o turno
+    """
+    try:
+        with current_trace().stage("chat_summary"), llm_priority(PRIORITY_BATCH):
+            yield
+    except Exception as e:
+        # Sem o novo resumo, o histórico continua limitado pelo orçamento de tokens do prompt
+        logger.warning(f"Falha ao resumir a conversa: {str(e)}")
+
+class RAGPipeline:
+    # Implementações dos componentes (a AsyncRAGPipeline usa as versões assíncronas)
+    _create_retriever = staticmethod(create_retriever)
+    _llm_client_class = LLMClient
+    _single_flight_class = SingleFlight
+    _admission_class = AdmissionController
+    _description = "pipeline RAG"
+    
+    def __init__(self, es_client=None, llm_client=None):
+        """
+        Inicializa a pipeline RAG com todos os componentes necessários
+        
+        Args:
+            es_client: Mecanismo de recuperação compartilhado (opcional; por padrão cria o de RETRIEVER_BACKEND)
+            llm_client: LLMClient compartilhado (opcional; por padrão cria um novo)
+        """
+        logger.info(f"Inicializando {self._description}")
+        
+        # Inicializar clientes
+        self.es_client = es_client if es_client is not None else self._create_retriever()
+        self.llm_client = llm_client if llm_client is not None else self._llm_client_class()
+        self.answer_cache = create_answer_cache()
+        self.conversations = ConversationStore()
+        self.single_flight = self._single_flight_class() if REQUEST_COALESCING else None
+        self.admission = self._admission_class() if ADMISSION_ENABLED else None
+        self._executor = self._create_executor()
+        
+        logger.info(f"Inicialização da {self._description} concluída")
+    
+    def _create_executor(self):
+        """Executor usado pela recuperação especulativa (busca heurística em paralelo ao planejamento)"""
+        if not SPECULATIVE_RETRIEVAL:
+            return None
+        return ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_WORKERS, thread_name_prefix="rag-speculative")
+    
+    def _retrieve(self, user_query, use_llm_query):
+        """
+        Recupera os documentos relevantes para a consulta do usuário
+        
+        Args:
+            user_query: Pergunta ou consulta do usuário
+            use_llm_query: Se True, usa a LLM para preparar a consulta Elasticsearch. Se False, usa diretamente a busca semântica do ES.
+        
+        Returns:
+            Lista de documentos encontrados
+        """
+        # Usar a LLM para preparar a query do Elasticsearch (ou usar diretamente a busca semântica)
+        if use_llm_query and SPECULATIVE_RETRIEVAL:
+            return self._retrieve_speculative(user_query)
+        
+        if use_llm_query:
+            logger.info("Preparando consulta Elasticsearch com LLM")
+            with current_trace().stage("planning"):
+                es_query = self.llm_client.prepare_elasticsearch_query(user_query, ES_MAX_RESULTS)
+            logger.info("Executando consulta personalizada no Elasticsearch")
+            return self.es_client.search(es_query)
+        
+        # Usando diretamente a busca semântica nativa do Elasticsearch
+        logger.info("Realizando busca semântica direta no Elasticsearch")
+        return self.es_client.semantic_search(user_query, ES_MAX_RESULTS)
+    
+    def _retrieve_speculative(self, user_query):
+        """
+        Executa a busca heurística (semantic_search) ao mesmo tempo que o planejamento da consulta pela LLM.
+        Os resultados heurísticos são usados se o planejamento exceder PLANNING_DEADLINE, falhar na validação
+        ou produzir as mesmas palavras-chave; caso contrário, a consulta planejada é executada.
+        
+        Args:
+            user_query: Pergunta ou consulta do usuário
+        
+        Returns:
+            Lista de documentos encontrados
+        """
+        heuristic_query = self.es_client.build_semantic_query(user_query, ES_MAX_RESULTS)
+        logger.info("Disparando busca heurística especulativa e planejamento da consulta com LLM em paralelo")
+        # As threads do executor recebem uma cópia do contexto, para registrar no trace da consulta
+        heuristic_future = self._executor.submit(contextvars.copy_context().run, self.es_client.search, heuristic_query)
+        plan_future = self._executor.submit(contextvars.copy_context().run, self.llm_client.prepare_elasticsearch_query,
+                                            user_query, ES_MAX_RESULTS, False)
+        trace = current_trace()
+        
+        es_query = None
+        try:
+            with trace.stage("planning"):
+                es_query = plan_future.result(timeout=PLANNING_DEADLINE)
+        except FutureTimeoutError:
+            _planning_timed_out(trace)
+        except Exception as e:
+            _planning_failed(e, trace)
+        
+        es_query = _speculative_choice(es_query, heuristic_query, trace)
+        if es_query is None:
+            return heuristic_future.result()
+        heuristic_future.cancel()
+        return self.es_client.search(es_query)
+    
+    def _get_cached_answer(self, user_query, documents):
+        """
+        Consulta o cache de respostas
+        
+        Returns:
+            Tupla (chave, resposta), com resposta None em caso de falha no cache
+        """
+        if self.answer_cache is None:
+            return None, None
+        key = self.answer_cache.make_key(user_query, documents)
+        answer = self.answer_cache.get(key)
+        if answer is not None:
+            current_trace().event("answer_cache_hit")
+            logger.info("Resposta encontrada no cache")
+        return key, answer
+    
+    def _store_answer(self, key, answer, indices=None):
+        """
+        Armazena a resposta gerada no cache de respostas, associada aos índices consultados (padrão: ES_INDICES).
+        Respostas geradas pelo modelo alternativo do agendador não são armazenadas, pois a chave do
+        cache corresponde ao modelo principal.
+        """
+        if self.answer_cache is None or key is None:
+            return
+        if current_trace().attributes.get("generation_model", self.llm_client.model) != self.llm_client.model:
+            current_trace().event("answer_cache_skip_fallback")
+            return
+        self.answer_cache.set(key, answer, ",".join(indices or current_indices()))
+    
+    def invalidate_index(self, index):
+        """
+        Remove do cache de respostas as respostas geradas a partir de consultas ao índice informado
+        (por exemplo, depois de uma ingestão de documentos nesse índice)
+        
+        Args:
+            index: Nome do índice
+        
+        Returns:
+            Número de respostas removidas
+        """
+        if self.answer_cache is None:
+            return 0
+        return self.answer_cache.invalidate_index(index)
+    
+    def cache_stats(self):
+        """Retorna as estatísticas dos caches de respostas e de consultas da LLM, do índice local, do mecanismo de recuperação, da coalescência, do agendador do Groq e do controle de admissão"""
+        return {
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "query_cache": self.llm_client.query_cache.stats() if self.llm_client.query_cache is not None else None,
+            "local_index": self.es_client.local_index.stats() if self.es_client.local_index is not None else None,
+            "retriever": self.es_client.stats(),
+            "single_flight": self.single_flight.stats() if self.single_flight is not None else None,
+            "groq_scheduler": self.llm_client.scheduler.stats() if self.llm_client.scheduler is not None else None,
+            "admission": self.admission.stats() if self.admission is not None else None
+        }
+    
+    def _admit(self, trace):
+        """
+        Admite a consulta interativa no controle de admissão (se habilitado). O bloco recebe True
+        quando a consulta deve ser processada no modo degradado, sem o planejamento pela LLM
+        """
+        if self.admission is None:
+            return nullcontext(False)
+        return self.admission.admit(trace)
+    
+    def _stage(self, name):
+        """Ocupa uma vaga da etapa no controle de admissão (se habilitado)"""
+        return self.admission.stage(name) if self.admission is not None else nullcontext()
+    
+    def _coalesce(self, user_query, use_llm_query, trace, factory, indices=None):
+        """
+        Encaminha a consulta para a computação idêntica em andamento (mesma pergunta normalizada e
+        mesmo modo), acompanhando seu fluxo de trechos, ou inicia uma nova computação
+        
+        Args:
+            user_query: Pergunta ou consulta do usuário
+            use_llm_query: Modo da consulta
+            trace: Trace da consulta
+            factory: Função que cria o iterador de trechos da computação
+            indices: Índices consultados (apenas consultas aos mesmos índices são coalescidas)
+        
+        Returns:
+            Iterador dos trechos (deltas) da resposta
+        """
+        if self.single_flight is None:
+            return factory()
+        chunks, leader = self.single_flight.join(_flight_key(user_query, use_llm_query, indices), factory)
+        return chunks if leader else self._follow(chunks, trace)
+    
+    def _follow(self, chunks, trace):
+        """Repassa os trechos de uma computação idêntica em andamento, registrando a consulta no próprio trace"""
+        trace.event("coalesced")
+        error = None
+        try:
+            for delta in chunks:
+                trace.mark("first_token")
+                yield delta
+        except Exception as e:
+            error = e
+            yield _failure_message(e)
+        finally:
+            trace.finish(error)
+    
+    def _generate_answer(self, user_query, documents, indices=None):
+        """
+        Gera a resposta com base nos documentos encontrados, consultando antes o cache de respostas
+        
+        Args:
+            user_query: Pergunta ou consulta do usuário
+            documents: Documentos recuperados
+            indices: Índices consultados, associados à resposta no cache (padrão: ES_INDICES)
+        
+        Returns:
+            Resposta final
+        """
+        if not documents:
+            return NO_RESULTS_MESSAGE
+        
+        cache_key, answer = self._get_cached_answer(user_query, documents)
+        if answer is None:
+            logger.info(f"Gerando resposta com LLM com base em {len(documents)} documentos")
+            with self._stage(STAGE_GENERATION), current_trace().stage("generation"):
+                answer = self.llm_client.generate_response(user_query, documents)
+            self._store_answer(cache_key, answer, indices)
+        return answer
+    
+    def process_query(self, user_query, use_llm_query=True, return_trace=False, indices=None):
+        """
+        Processa a consulta do usuário através da pipeline RAG completa
+        
+        Args:
+            user_query: Pergunta ou consulta do usuário
+            use_llm_query: Se True, usa a LLM para preparar a consulta Elasticsearch. Se False, usa diretamente a busca semântica do ES.
+            return_trace: Se True, retorna um dicionário com a resposta ("answer") e o trace da consulta ("trace")
+            indices: Índices consultados (padrão: ES_INDICES; use resolve_indices para o roteamento por tenant)
+        
+        Returns:
+            Resposta final
+        """
+        trace = Trace(_trace_mode(use_llm_query))
+        chunks = self._coalesce(user_query, use_llm_query, trace,
+                                lambda: self._answer_chunks(user_query, use_llm_query, trace, indices), indices)
+        return self._query_result("".join(chunks), trace, return_trace)
+    
+    def _query_result(self, answer, trace, return_trace):
+        if return_trace:
+            return {"answer": answer, "trace": trace.to_dict()}
+        return answer
+    
+    def _answer_chunks(self, user_query, use_llm_query, trace, indices=None):
+        """Resposta completa como um único trecho, para que a consulta possa ser coalescida"""
+        yield self._process_query(user_query, use_llm_query, trace, indices)
+    
+    def _process_query(self, user_query, use_llm_query, trace, indices=None):
+        error = None
+        try:
+            with activate(trace), self._admit(trace) as degraded:
+                # Sob pressão, a busca semântica direta dispensa o planejamento pela LLM
+                use_llm_query = use_llm_query and not degraded
+                start_time = time.time()
+                
+                # 1. Recuperar os documentos relevantes
+                with search_indices(indices), self._stage(STAGE_RETRIEVAL):
+                    documents = self._retrieve(user_query, use_llm_query)
+                _log_search(start_time, documents)
+                
+                # 2. Gerar resposta com base nos documentos encontrados
+                answer = self._generate_answer(user_query, documents, indices)
+                logger.info(f"Processamento completo em {time.time() - start_time:.2f} segundos")
+        except Exception as e:
+            error = e
+            answer = _failure_message(e)
+        
+        trace.finish(error)
+        return answer
+    
+    def process_query_stream(self, user_query, use_llm_query=True, trace=None, indices=None):
+        """
+        Processa a consulta do usuário em modo streaming, produzindo a resposta aos poucos
+        
+        Args:
+            user_query: Pergunta ou consulta do usuário
+            use_llm_query: Se True, usa a LLM para preparar a consulta Elasticsearch. Se False, usa diretamente a busca semântica do ES.
+            trace: Trace a ser preenchido com os tempos da consulta (opcional)
+            indices: Índices consultados (padrão: ES_INDICES)
+        
+        Yields:
+            Trechos (deltas) da resposta final
+        """
+        trace = trace if trace is not None else Trace(_trace_mode(use_llm_query))
+        # Consultas idênticas simultâneas acompanham o mesmo fluxo de tokens
+        yield from self._coalesce(user_query, use_llm_query, trace,
+                                  lambda: iterate_in_trace(self._process_query_stream(user_query, use_llm_query, trace, indices), trace),
+                                  indices)
+    
+    def _streamed_answer_source(self, user_query, documents):
+        """
+        Primeira etapa da geração em streaming: a resposta sem documentos ou do cache, se houver
+        
+        Returns:
+            Tupla (chave do cache, resposta pronta ou None se a LLM deve gerá-la)
+        """
+        if not documents:
+            return None, NO_RESULTS_MESSAGE
+        cache_key, cached_answer = self._get_cached_answer(user_query, documents)
+        if cached_answer is None:
+            logger.info(f"Gerando resposta em streaming com LLM com base em {len(documents)} documentos")
+        return cache_key, cached_answer
+    
+    def _process_query_stream(self, user_query, use_llm_query, trace, indices=None):
+        error = None
+        try:
+            with self._admit(trace) as degraded:
+                use_llm_query = use_llm_query and not degraded
+                start_time = time.time()
+                
+                # 1. Recuperar os documentos relevantes
+                with search_indices(indices), self._stage(STAGE_RETRIEVAL):
+                    documents = self._retrieve(user_query, use_llm_query)
+                _log_search(start_time, documents)
+                
+                # 2. Gerar resposta em streaming com base nos documentos encontrados
+                cache_key, ready_answer = self._streamed_answer_source(user_query, documents)
+                if ready_answer is not None:
+                    yield ready_answer
+                    return
+                
+                with self._stage(STAGE_GENERATION):
+                    answer = _StreamedAnswer(trace, start_time)
+                    for delta in self.llm_client.generate_response_stream(user_query, documents):
+                        yield answer.add(delta)
+                self._store_answer(cache_key, answer.finish(), indices)
+                logger.info(f"Processamento completo em {time.time() - start_time:.2f} segundos")
+        except Exception as e:
+            error = e
+            yield _failure_message(e)
+        finally:
+            trace.finish(error)
+    
+    def _delta_query(self, conversation, user_query, delta_keywords):
+        """
+        Monta a consulta incremental de uma continuação: palavras-chave apenas dos termos novos e,
+        na parte semântica, a pergunta anterior junto com a atual (para resolver referências)
+        """
+        keyword_expression = build_keyword_expression(" ".join(delta_keywords) or user_query)
+        semantic_text = f"{conversation.last_question} {user_query}" if conversation.last_question else user_query
+        return build_rrf_query(keyword_expression, semantic_text, CHAT_DELTA_SIZE)
+    
+    def _plan_turn(self, conversation, user_query):
+        """
+        Decide a recuperação de um turno do chat: reutiliza os documentos do turno anterior nas
+        continuações do mesmo assunto, busca apenas os termos novos quando houver e faz a
+        recuperação completa quando o assunto ou os índices consultados mudam
+        
+        Args:
+            conversation: Conversa da sessão
+            user_query: Pergunta do turno atual
+        
+        Returns:
+            Tupla (tipo de recuperação, consulta incremental ou None)
+        """
+        trace = current_trace()
+        if conversation.use_indices(current_indices()):
+            trace.event("chat_indices_changed")
+        retrieval, delta_keywords = conversation.plan_retrieval(user_query)
+        trace.set("chat_retrieval", retrieval)
+        
+        if retrieval == RETRIEVAL_REUSE:
+            trace.event("chat_documents_reused")
+            logger.info(f"Continuação do assunto: reutilizando {len(conversation.documents)} documentos do turno anterior")
+        elif retrieval == RETRIEVAL_DELTA:
+            trace.event("chat_delta_retrieval")
+            logger.info(f"Continuação do assunto: buscando apenas os termos novos {delta_keywords}")
+            return retrieval, self._delta_query(conversation, user_query, delta_keywords)
+        return retrieval, None
+    
+    def _retrieve_turn(self, conversation, user_query, use_llm_query):
+        """
+        Recupera os documentos de um turno do chat, conforme _plan_turn
+        
+        Args:
+            conversation: Conversa da sessão
+            user_query: Pergunta do turno atual
+            use_llm_query: Se True, usa a LLM para preparar a consulta na recuperação completa
+        
+        Returns:
+            Tupla (tipo de recuperação, documentos)
+        """
+        retrieval, delta_query = self._plan_turn(conversation, user_query)
+        if retrieval == RETRIEVAL_REUSE:
+            return retrieval, conversation.documents
+        if retrieval == RETRIEVAL_DELTA:
+            return retrieval, _merge_documents(self.es_client.search(delta_query), conversation.documents)
+        return retrieval, self._retrieve(user_query, use_llm_query)
+    
+    def _finish_turn(self, conversation, user_query, answer, documents, retrieval):
+        """Registra o turno na conversa e resume os turnos antigos quando o histórico fica longo"""
+        conversation.add_turn(user_query, answer, documents, retrieval)
+        turns = conversation.turns_to_summarize()
+        if turns:
+            with _summarizing():
+                conversation.apply_summary(self.llm_client.summarize_conversation(conversation.summary, turns), len(turns))
+    
+    def process_chat(self, session_id, user_query, use_llm_query=True, indices=None):
+        """
+        Processa um turno do modo chat, considerando o histórico da sessão
+        
+        Args:
+            session_id: Identificador da sessão de chat
+            user_query: Pergunta do usuário
+            use_llm_query: Se True, usa a LLM para preparar a consulta Elasticsearch quando o assunto muda
+            indices: Índices consultados (padrão: ES_INDICES)
+        
+        Returns:
+            Resposta final
+        """
+        conversation = self.conversations.get(session_id)
+        trace = Trace(_trace_mode(use_llm_query))
+        error = None
+        try:
+            with activate(trace):
+                with self._admit(trace) as degraded:
+                    use_llm_query = use_llm_query and not degraded
+                    with search_indices(indices), self._stage(STAGE_RETRIEVAL):
+                        retrieval, documents = self._retrieve_turn(conversation, user_query, use_llm_query)
+                    if not documents:
+                        answer = NO_RESULTS_MESSAGE
+                    else:
+                        with self._stage(STAGE_GENERATION), trace.stage("generation"):
+                            answer = self.llm_client.generate_response(user_query, documents, conversation.history_text())
+                self._finish_turn(conversation, user_query, answer, documents, retrieval)
+        except Exception as e:
+            error = e
+            answer = _failure_message(e, "mensagem do chat")
+        
+        trace.finish(error)
+        return answer
+    
+    def process_chat_stream(self, session_id, user_query, use_llm_query=True, trace=None, indices=None):
+        """
+        Processa um turno do modo chat em streaming, considerando o histórico da sessão
+        
+        Args:
+            session_id: Identificador da sessão de chat
+            user_query: Pergunta do usuário
+            use_llm_query: Se True, usa a LLM para preparar a consulta Elasticsearch quando o assunto muda
+            trace: Trace a ser preenchido com os tempos da consulta (opcional)
+            indices: Índices consultados (padrão: ES_INDICES)
+        
+        Yields:
+            Trechos (deltas) da resposta final
+        """
+        conversation = self.conversations.get(session_id)
+        trace = trace if trace is not None else Trace(_trace_mode(use_llm_query))
+        yield from iterate_in_trace(self._process_chat_stream(conversation, user_query, use_llm_query, trace, indices), trace)
+    
+    def _process_chat_stream(self, conversation, user_query, use_llm_query, trace, indices=None):
+        error = None
+        try:
+            with self._admit(trace) as degraded:
+                use_llm_query = use_llm_query and not degraded
+                with search_indices(indices), self._stage(STAGE_RETRIEVAL):
+                    retrieval, documents = self._retrieve_turn(conversation, user_query, use_llm_query)
+                if not documents:
+                    answer = NO_RESULTS_MESSAGE
+                    yield answer
+                else:
+                    with self._stage(STAGE_GENERATION):
+                        streamed = _StreamedAnswer(trace)
+                        for delta in self.llm_client.generate_response_stream(user_query, documents, conversation.history_text()):
+                            yield streamed.add(delta)
+                    answer = streamed.finish()
+            # O turno é registrado (e o histórico resumido) depois que a resposta já foi entregue, fora do controle de admissão
+            self._finish_turn(conversation, user_query, answer, documents, retrieval)
+        except Exception as e:
+            error = e
+            yield _failure_message(e, "mensagem do chat")
+        finally:
+            trace.finish(error)
+    
+    def _generate_traced(self, index, user_query, documents, trace, indices=None):
+        """Gera a resposta de uma pergunta do lote, registrando as etapas no trace informado, e monta o resultado"""
+        try:
+            with activate(trace), llm_priority(PRIORITY_BATCH):
+                answer = self._generate_answer(user_query, documents, indices)
+        except Exception as e:
+            return _batch_answered(index, user_query, documents, trace, error=e)
+        return _batch_answered(index, user_query, documents, trace, answer=answer)
+    
+    def _heuristic_query(self, user_query, error=None):
+        """Consulta heurística de uma pergunta do lote (usada também quando o planejamento com a LLM falha)"""
+        if error is not None:
+            logger.error(f"Erro no planejamento da consulta com LLM: {str(error)}. Usando consulta heurística")
+        return self.es_client.build_semantic_query(user_query, ES_MAX_RESULTS)
+    
+    def _plan_query(self, user_query, use_llm_query):
+        """
+        Monta a consulta Elasticsearch de uma pergunta do lote. Em caso de erro no planejamento
+        com a LLM, usa a consulta heurística.
+        """
+        if not use_llm_query:
+            return self._heuristic_query(user_query)
+        try:
+            with llm_priority(PRIORITY_BATCH):
+                return self.llm_client.prepare_elasticsearch_query(user_query, ES_MAX_RESULTS)
+        except Exception as e:
+            return self._heuristic_query(user_query, e)
+    
+    def process_batch(self, queries, use_llm_query=True, max_concurrency=BATCH_MAX_CONCURRENCY, msearch_size=BATCH_MSEARCH_SIZE,
+                      indices=None):
+        """
+        Processa uma lista de perguntas em lote: as consultas de cada bloco são enviadas em um único _msearch
+        e as respostas são geradas concorrentemente, com concorrência limitada
+        
+        Args:
+            queries: Iterável de perguntas (lido em blocos, sem carregá-lo inteiro em memória)
+            use_llm_query: Se True, usa a LLM para preparar as consultas Elasticsearch
+            max_concurrency: Número máximo de chamadas simultâneas à LLM
+            msearch_size: Número máximo de consultas por requisição _msearch
+            indices: Índices consultados (padrão: ES_INDICES)
+        
+        Yields:
+            Dicionários com index, query, answer, document_ids e error, na ordem de conclusão
+        """
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="rag-batch") as executor:
+            offset = 0
+            for chunk in _chunked(queries, msearch_size):
+                start_time = time.time()
+                
+                # 1. Montar as consultas (planejamento com a LLM em paralelo, se ativado)
+                es_queries = list(executor.map(lambda query: self._plan_query(query, use_llm_query), chunk))
+                
+                # 2. Recuperar os documentos de todo o bloco em um único _msearch
+                try:
+                    with search_indices(indices):
+                        search_results = self.es_client.msearch(es_queries)
+                except Exception as e:
+                    search_results = [e] * len(chunk)
+                else:
+                    logger.info(f"Busca em lote de {len(chunk)} consultas concluída em {time.time() - start_time:.2f} segundos")
+                failed, pending = _batch_searched(offset, chunk, search_results)
+                yield from failed
+                
+                # 3. Gerar as respostas concorrentemente
+                futures = [executor.submit(self._generate_traced, index, user_query, documents, _batch_trace(documents), indices)
+                           for index, user_query, documents in pending]
+                for future in as_completed(futures):
+                    yield future.result()
+                
+                logger.info(f"Bloco de {len(chunk)} consultas processado em {time.time() - start_time:.2f} segundos")
+                offset += len(chunk)
+    
+    def close(self):
+        """Encerra o executor da recuperação especulativa e fecha as conexões dos clientes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.es_client.close()
+        self.llm_client.close()
+
+class AsyncRAGPipeline(RAGPipeline):
+    """
+    Pipeline RAG assíncrona, baseada em AsyncElasticsearch e groq.AsyncClient. Reutiliza a lógica
+    da RAGPipeline e redefine apenas as etapas que fazem E/S. A conexão deve ser verificada com
+    await verify_connection().
+    """
+    
+    _create_retriever = staticmethod(create_async_retriever)
+    _llm_client_class = AsyncLLMClient
+    _single_flight_class = AsyncSingleFlight
+    _admission_class = AsyncAdmissionController
+    _description = "pipeline RAG assíncrona"
+    
+    def _create_executor(self):
+        # A recuperação especulativa usa tarefas no event loop
+        return None
+    
+    async def verify_connection(self):
+        """Verifica a conexão com o Elasticsearch"""
+        await self.es_client.verify_connection()
+    
+    async def _retrieve(self, user_query, use_llm_query):
+        """Versão assíncrona de _retrieve"""
+        if use_llm_query and SPECULATIVE_RETRIEVAL:
+            return await self._retrieve_speculative(user_query)
+        
+        if use_llm_query:
+            logger.info("Preparando consulta Elasticsearch com LLM")
+            with current_trace().stage("planning"):
+                es_query = await self.llm_client.prepare_elasticsearch_query(user_query, ES_MAX_RESULTS)
+            logger.info("Executando consulta personalizada no Elasticsearch")
+            return await self.es_client.search(es_query)
+        
+        logger.info("Realizando busca semântica direta no Elasticsearch")
+        return await self.es_client.semantic_search(user_query, ES_MAX_RESULTS)
+    
+    async def _retrieve_speculative(self, user_query):
+        """
+        Versão assíncrona da recuperação especulativa: a busca heurística e o planejamento
+        da consulta pela LLM são disparados ao mesmo tempo no event loop
+        """
+        heuristic_query = self.es_client.build_semantic_query(user_query, ES_MAX_RESULTS)
+        logger.info("Disparando busca heurística especulativa e planejamento da consulta com LLM em paralelo")
+        heuristic_task = asyncio.create_task(self.es_client.search(heuristic_query))
+        plan_task = asyncio.create_task(
+            self.llm_client.prepare_elasticsearch_query(user_query, ES_MAX_RESULTS, use_fallback=False)
+        )
+        trace = current_trace()
+        
+        es_query = None
+        try:
+            # shield mantém o planejamento em execução após o prazo, aquecendo o cache de consultas
+            with trace.stage("planning"):
+                es_query = await asyncio.wait_for(asyncio.shield(plan_task), PLANNING_DEADLINE)
+        except asyncio.TimeoutError:
+            _planning_timed_out(trace)
+        except Exception as e:
+            _planning_failed(e, trace)
+        
+        es_query = _speculative_choice(es_query, heuristic_query, trace)
+        if es_query is None:
+            return await heuristic_task
+        heuristic_task.cancel()
+        return await self.es_client.search(es_query)
+    
+    async def _follow(self, chunks, trace):
+        """Versão assíncrona de _follow"""
+        trace.event("coalesced")
+        error = None
+        try:
+            async for delta in chunks:
+                trace.mark("first_token")
+                yield delta
+        except Exception as e:
+            error = e
+            yield _failure_message(e)
+        finally:
+            trace.finish(error)
+    
+    async def _generate_answer(self, user_query, documents, indices=None):
+        """Versão assíncrona de _generate_answer"""
+        if not documents:
+            return NO_RESULTS_MESSAGE
+        
+        cache_key, answer = self._get_cached_answer(user_query, documents)
+        if answer is None:
+            logger.info(f"Gerando resposta com LLM com base em {len(documents)} documentos")
+            async with self._stage(STAGE_GENERATION):
+                with current_trace().stage("generation"):
+                    answer = await self.llm_client.generate_response(user_query, documents)
+            self._store_answer(cache_key, answer, indices)
+        return answer
+    
+    async def process_query(self, user_query, use_llm_query=True, return_trace=False, indices=None):
+        """Versão assíncrona de process_query"""
+        trace = Trace(_trace_mode(use_llm_query))
+        chunks = self._coalesce(user_query, use_llm_query, trace,
+                                lambda: self._answer_chunks(user_query, use_llm_query, trace, indices), indices)
+        return self._query_result("".join([delta async for delta in chunks]), trace, return_trace)
+    
+    async def _answer_chunks(self, user_query, use_llm_query, trace, indices=None):
+        yield await self._process_query(user_query, use_llm_query, trace, indices)
+    
+    async def _process_query(self, user_query, use_llm_query, trace, indices=None):
+        error = None
+        try:
+            with activate(trace):
+                async with self._admit(trace) as degraded:
+                    use_llm_query = use_llm_query and not degraded
+                    start_time = time.time()
+                    
+                    with search_indices(indices):
+                        async with self._stage(STAGE_RETRIEVAL):
+                            documents = await self._retrieve(user_query, use_llm_query)
+                    _log_search(start_time, documents)
+                    
+                    answer = await self._generate_answer(user_query, documents, indices)
+                    logger.info(f"Processamento completo em {time.time() - start_time:.2f} segundos")
+        except Exception as e:
+            error = e
+            answer = _failure_message(e)
+        
+        trace.finish(error)
+        return answer
+    
+    async def process_query_stream(self, user_query, use_llm_query=True, trace=None, indices=None):
+        """Versão assíncrona de process_query_stream"""
+        trace = trace if trace is not None else Trace(_trace_mode(use_llm_query))
+        chunks = self._coalesce(user_query, use_llm_query, trace,
+                                lambda: aiterate_in_trace(self._process_query_stream(user_query, use_llm_query, trace, indices), trace),
+                                indices)
+        async for delta in chunks:
+            yield delta
+    
+    async def _process_query_stream(self, user_query, use_llm_query, trace, indices=None):
+        error = None
+        try:
+            async with self._admit(trace) as degraded:
+                use_llm_query = use_llm_query and not degraded
+                start_time = time.time()
+                
+                with search_indices(indices):
+                    async with self._stage(STAGE_RETRIEVAL):
+                        documents = await self._retrieve(user_query, use_llm_query)
+                _log_search(start_time, documents)
+                
+                cache_key, ready_answer = self._streamed_answer_source(user_query, documents)
+                if ready_answer is not None:
+                    yield ready_answer
+                    return
+                
+                async with self._stage(STAGE_GENERATION):
+                    answer = _StreamedAnswer(trace, start_time)
+                    async for delta in self.llm_client.generate_response_stream(user_query, documents):
+                        yield answer.add(delta)
+                self._store_answer(cache_key, answer.finish(), indices)
+                logger.info(f"Processamento completo em {time.time() - start_time:.2f} segundos")
+        except Exception as e:
+            error = e
+            yield _failure_message(e)
+        finally:
+            trace.finish(error)
+    
+    async def _retrieve_turn(self, conversation, user_query, use_llm_query):
+        """Versão assíncrona de _retrieve_turn"""
+        retrieval, delta_query = self._plan_turn(conversation, user_query)
+        if retrieval == RETRIEVAL_REUSE:
+            return retrieval, conversation.documents
+        if retrieval == RETRIEVAL_DELTA:
+            return retrieval, _merge_documents(await self.es_client.search(delta_query), conversation.documents)
+        return retrieval, await self._retrieve(user_query, use_llm_query)
+    
+    async def _finish_turn(self, conversation, user_query, answer, documents, retrieval):
+        """Versão assíncrona de _finish_turn"""
+        conversation.add_turn(user_query, answer, documents, retrieval)
+        turns = conversation.turns_to_summarize()
+        if turns:
+            with _summarizing():
+                conversation.apply_summary(await self.llm_client.summarize_conversation(conversation.summary, turns), len(turns))
+    
+    async def process_chat(self, session_id, user_query, use_llm_query=True, indices=None):
+        """Versão assíncrona de process_chat"""
+        conversation = self.conversations.get(session_id)
+        trace = Trace(_trace_mode(use_llm_query))
+        error = None
+        try:
+            with activate(trace):
+                async with self._admit(trace) as degraded:
+                    use_llm_query = use_llm_query and not degraded
+                    with search_indices(indices):
+                        async with self._stage(STAGE_RETRIEVAL):
+                            retrieval, documents = await self._retrieve_turn(conversation, user_query, use_llm_query)
+                    if not documents:
+                        answer = NO_RESULTS_MESSAGE
+                    else:
+                        async with self._stage(STAGE_GENERATION):
+                            with trace.stage("generation"):
+                                answer = await self.llm_client.generate_response(user_query, documents, conversation.history_text())
+                await self._finish_turn(conversation, user_query, answer, documents, retrieval)
+        except Exception as e:
+            error = e
+            answer = _failure_message(e, "mensagem do chat")
+        
+        trace.finish(error)
+        return answer
+    
+    async def process_chat_stream(self, session_id, user_query, use_llm_query=True, trace=None, indices=None):
+        """Versão assíncrona de process_chat_stream"""
+        conversation = self.conversations.get(session_id)
+        trace = trace if trace is not None else Trace(_trace_mode(use_llm_query))
+        async for delta in aiterate_in_trace(self._process_chat_stream(conversation, user_query, use_llm_query, trace, indices), trace):
+            yield delta
+    
+    async def _process_chat_stream(self, conversation, user_query, use_llm_query, trace, indices=None):
+        error = None
+        try:
+            async with self._admit(trace) as degraded:
+                use_llm_query = use_llm_query and not degraded
+                with search_indices(indices):
+                    async with self._stage(STAGE_RETRIEVAL):
+                        retrieval, documents = await self._retrieve_turn(conversation, user_query, use_llm_query)
+                if not documents:
+                    answer = NO_RESULTS_MESSAGE
+                    yield answer
+                else:
+                    async with self._stage(STAGE_GENERATION):
+                        streamed = _StreamedAnswer(trace)
+                        async for delta in self.llm_client.generate_response_stream(user_query, documents, conversation.history_text()):
+                            yield streamed.add(delta)
+                    answer = streamed.finish()
+            # O turno é registrado (e o histórico resumido) depois que a resposta já foi entregue, fora do controle de admissão
+            await self._finish_turn(conversation, user_query, answer, documents, retrieval)
+        except Exception as e:
+            error = e
+            yield _failure_message(e, "mensagem do chat")
+        finally:
+            trace.finish(error)
+    
+    async def _generate_traced(self, index, user_query, documents, trace, indices=None):
+        """Versão assíncrona de _generate_traced"""
+        try:
+            with activate(trace), llm_priority(PRIORITY_BATCH):
+                answer = await self._generate_answer(user_query, documents, indices)
+        except Exception as e:
+            return _batch_answered(index, user_query, documents, trace, error=e)
+        return _batch_answered(index, user_query, documents, trace, answer=answer)
+    
+    async def _plan_query(self, user_query, use_llm_query):
+        """Versão assíncrona de _plan_query"""
+        if not use_llm_query:
+            return self._heuristic_query(user_query)
+        try:
+            with llm_priority(PRIORITY_BATCH):
+                return await self.llm_client.prepare_elasticsearch_query(user_query, ES_MAX_RESULTS)
+        except Exception as e:
+            return self._heuristic_query(user_query, e)
+    
+    async def process_batch(self, queries, use_llm_query=True, max_concurrency=BATCH_MAX_CONCURRENCY, msearch_size=BATCH_MSEARCH_SIZE,
+                            indices=None):
+        """Versão assíncrona de process_batch: um _msearch por bloco e geração concorrente limitada por semáforo"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+        
+        offset = 0
+        for chunk in _chunked(queries, msearch_size):
+            start_time = time.time()
+            
+            es_queries = await asyncio.gather(*(limited(self._plan_query(query, use_llm_query)) for query in chunk))
+            
+            try:
+                with search_indices(indices):
+                    search_results = await self.es_client.msearch(es_queries)
+            except Exception as e:
+                search_results = [e] * len(chunk)
+            else:
+                logger.info(f"Busca em lote de {len(chunk)} consultas concluída em {time.time() - start_time:.2f} segundos")
+            failed, pending = _batch_searched(offset, chunk, search_results)
+            for result in failed:
+                yield result
+            
+            tasks = [limited(self._generate_traced(index, user_query, documents, _batch_trace(documents), indices))
+                     for index, user_query, documents in pending]
+            for task in asyncio.as_completed(tasks):
+                yield await task
+            
+            logger.info(f"Bloco de {len(chunk)} consultas processado em {time.time() - start_time:.2f} segundos")
+            offset += len(chunk)
+    
+    async def close(self):
+        """Fecha as conexões dos clientes assíncronos"""
+        await self.es_client.close()
+        await self.llm_client.close()
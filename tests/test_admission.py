@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import threading
+import time
+import pytest
+from utils.admission import (AdmissionController, AsyncAdmissionController, AdmissionRejected, DeadlineExceeded,
+                             check_deadline, remaining_time, STAGE_GENERATION, STAGE_RETRIEVAL)
+from utils.metrics import Trace, activate
+
+
+def _controller(cls=AdmissionController, max_concurrency=1, max_queue=1, deadline=0, degrade_queue_depth=0,
+                stage_limits=None):
+    return cls(max_concurrency=max_concurrency, max_queue=max_queue, deadline=deadline,
+               degrade_queue_depth=degrade_queue_depth, stage_limits=stage_limits or {})
+
+
+def _wait_until(condition, timeout=2.0):
+    limit = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < limit, "condição não atingida"
+        time.sleep(0.005)
+
+
+def test_admitted_query_gets_a_deadline_only_while_admitted():
+    controller = _controller(deadline=10)
+    trace = Trace()
+
+    with controller.admit(trace) as degraded:
+        assert not degraded
+        assert 9 < remaining_time(trace) <= 10
+    assert trace.deadline is None
+    assert controller.stats()["admitted"] == 1
+    assert controller.stats()["active"] == 0
+
+
+def test_full_queue_rejects_immediately():
+    controller = _controller(max_concurrency=1, max_queue=0)
+    rejected = Trace()
+
+    with controller.admit(Trace()):
+        with pytest.raises(AdmissionRejected):
+            with controller.admit(rejected):
+                pass
+    assert rejected.events == ["admission_rejected"]
+    assert controller.stats()["rejected"] == 1
+
+
+def test_query_waiting_past_the_deadline_is_dropped():
+    controller = _controller(max_concurrency=1, max_queue=5, deadline=0.05)
+    expired = Trace()
+
+    with controller.admit(Trace()):
+        with pytest.raises(DeadlineExceeded):
+            with controller.admit(expired):
+                pass
+    assert expired.events == ["deadline_exceeded"]
+    assert expired.attributes["deadline_stage"] == "admission"
+    stats = controller.stats()
+    assert stats["expired"] == 1
+    assert stats["waiting"] == 0
+    assert stats["active"] == 0
+
+
+def test_released_slot_goes_to_the_oldest_waiting_query():
+    controller = _controller(max_concurrency=1, max_queue=5)
+    order = []
+
+    def query(name):
+        with controller.admit(Trace()):
+            order.append(name)
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(controller.admit(Trace()))
+        threads = []
+        for name in ("primeira", "segunda"):
+            thread = threading.Thread(target=query, args=(name,))
+            thread.start()
+            threads.append(thread)
+            _wait_until(lambda: controller.stats()["waiting"] == len(threads))
+    for thread in threads:
+        thread.join()
+    assert order == ["primeira", "segunda"]
+    assert controller.stats()["active"] == 0
+
+
+def test_long_queue_degrades_the_query():
+    controller = _controller(max_concurrency=1, max_queue=5, degrade_queue_depth=1)
+    results = []
+
+    def query():
+        trace = Trace()
+        with controller.admit(trace) as degraded:
+            results.append((degraded, trace.events))
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(controller.admit(Trace()))
+        first = threading.Thread(target=query)
+        first.start()
+        _wait_until(lambda: controller.stats()["waiting"] == 1)
+        second = threading.Thread(target=query)
+        second.start()
+        _wait_until(lambda: controller.stats()["waiting"] == 2)
+    first.join()
+    second.join()
+    assert results == [(False, []), (True, ["admission_degraded"])]
+    assert controller.stats()["degraded"] == 1
+
+
+def test_stage_slots_apply_only_to_admitted_queries():
+    controller = _controller(deadline=0.05, stage_limits={STAGE_RETRIEVAL: 1})
+    trace = Trace()
+
+    # Fora do controle de admissão (ex.: processamento em lote), as etapas não são limitadas
+    with controller.stage(STAGE_RETRIEVAL), controller.stage(STAGE_RETRIEVAL):
+        pass
+
+    with activate(trace), controller.admit(trace):
+        with controller.stage(STAGE_GENERATION), controller.stage(STAGE_RETRIEVAL):
+            with pytest.raises(DeadlineExceeded):
+                with controller.stage(STAGE_RETRIEVAL):
+                    pass
+    assert trace.attributes["deadline_stage"] == STAGE_RETRIEVAL
+    assert "retrieval_queue" in trace.timings
+
+
+def test_check_deadline():
+    trace = Trace()
+    with activate(trace):
+        check_deadline("groq")
+        trace.deadline = time.perf_counter() + 10
+        check_deadline("groq")
+        trace.deadline = time.perf_counter() - 1
+        with pytest.raises(DeadlineExceeded):
+            check_deadline("groq")
+    assert trace.attributes["deadline_stage"] == "groq"
+
+
+def test_async_full_queue_rejects_and_deadline_drops():
+    async def scenario():
+        controller = _controller(AsyncAdmissionController, max_concurrency=1, max_queue=1, deadline=0.05)
+
+        async def query(trace):
+            async with controller.admit(trace):
+                await asyncio.sleep(0)
+
+        async with controller.admit(Trace()):
+            expired = Trace()
+            waiting = asyncio.create_task(query(expired))
+            await asyncio.sleep(0.01)
+            with pytest.raises(AdmissionRejected):
+                await query(Trace())
+            with pytest.raises(DeadlineExceeded):
+                await waiting
+        assert expired.events == ["deadline_exceeded"]
+        stats = controller.stats()
+        assert (stats["rejected"], stats["expired"], stats["waiting"], stats["active"]) == (1, 1, 0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_async_cancelled_waiting_query_leaves_the_queue():
+    async def scenario():
+        controller = _controller(AsyncAdmissionController, max_concurrency=1, max_queue=5)
+
+        async def query():
+            async with controller.admit(Trace()):
+                await asyncio.sleep(0)
+
+        async with controller.admit(Trace()):
+            cancelled = asyncio.create_task(query())
+            await asyncio.sleep(0.01)
+            assert controller.stats()["waiting"] == 1
+            cancelled.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await cancelled
+            assert controller.stats()["waiting"] == 0
+        await query()
+        assert controller.stats()["active"] == 0
+
+    asyncio.run(scenario())
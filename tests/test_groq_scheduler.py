@@ -0,0 +1,190 @@
+import threading
+import time
+import groq
+import httpx
+import pytest
+from utils.admission import DeadlineExceeded
+from utils.groq_scheduler import GroqScheduler, TokenBucket, llm_priority, parse_duration, PRIORITY_BATCH
+from utils.metrics import Trace, activate
+
+
+class _Raw:
+    def __init__(self, response, headers=None):
+        self.headers = headers or {}
+        self._response = response
+
+    def parse(self):
+        return self._response
+
+
+class _Completions:
+    """Recurso chat.completions falso: registra as chamadas e responde com o texto da mensagem"""
+
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+        self.with_raw_response = self
+        self._lock = threading.Lock()
+
+    def create(self, **options):
+        with self._lock:
+            self.calls.append((options["messages"][0]["content"], options["model"]))
+            if self.errors:
+                raise self.errors.pop(0)
+        if options.get("stream"):
+            return _Raw(iter(["a", "b", "c"]))
+        return _Raw(options["messages"][0]["content"])
+
+
+def _options(content, model="principal", stream=False):
+    return {"model": model, "messages": [{"role": "user", "content": content}], "max_tokens": 1, "stream": stream}
+
+
+def _wait_until(condition, timeout=2.0):
+    limit = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < limit, "condição não atingida"
+        time.sleep(0.005)
+
+
+def _call_in_thread(scheduler, completions, options, priority=None):
+    def run():
+        if priority is None:
+            scheduler.call(completions, options)
+        else:
+            with llm_priority(priority):
+                scheduler.call(completions, options)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_parse_duration():
+    assert parse_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_duration("120ms") == pytest.approx(0.12)
+    assert parse_duration("3") == 3.0
+    assert parse_duration("") is None
+    assert parse_duration("abc") is None
+
+
+def test_token_bucket_refills_continuously():
+    bucket = TokenBucket(60)
+    now = bucket._updated
+    bucket.consume(60, now)
+
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now + 1.0) == 0.0
+    # A reposição não passa da capacidade
+    assert bucket.wait_time(60, now + 120) == 0.0
+    assert bucket.level == 60
+
+
+def test_token_bucket_call_larger_than_capacity_waits_for_a_full_bucket():
+    bucket = TokenBucket(60)
+    now = bucket._updated
+    bucket.consume(30, now)
+
+    assert bucket.wait_time(600, now) == pytest.approx(30.0)
+
+
+def test_token_bucket_block_and_api_headers():
+    bucket = TokenBucket(0)
+    now = bucket._updated
+    assert bucket.wait_time(10, now) == 0.0
+
+    bucket.update(None, 0, 5.0, now)
+    assert bucket.wait_time(1, now) == pytest.approx(5.0)
+    assert bucket.wait_time(1, now + 5.0) == 0.0
+
+    bucket.block(3.0, now + 5.0)
+    assert bucket.wait_time(1, now + 6.0) == pytest.approx(2.0)
+
+
+def test_observe_updates_model_limits_from_headers():
+    scheduler = GroqScheduler(rpm=0, tpm=0, fallback_model="")
+    scheduler.observe("principal", {"x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "100",
+                                    "x-ratelimit-reset-tokens": "2s"})
+
+    stats = scheduler.stats()["models"]["principal"]
+    assert stats["tokens_per_minute"] == 6000
+    assert stats["tokens_available"] == 100
+
+
+def test_interactive_calls_are_served_before_batch_calls():
+    scheduler = GroqScheduler(max_concurrency=1, rpm=0, tpm=0, fallback_model="")
+    completions = _Completions()
+    stream = scheduler.call(completions, _options("stream", stream=True))
+    assert next(stream) == "a"
+
+    batch = _call_in_thread(scheduler, completions, _options("lote"), PRIORITY_BATCH)
+    _wait_until(lambda: scheduler.stats()["waiting"] == 1)
+    interactive = _call_in_thread(scheduler, completions, _options("interativa"))
+    _wait_until(lambda: scheduler.stats()["waiting"] == 2)
+
+    stream.close()
+    batch.join()
+    interactive.join()
+    assert [content for content, _ in completions.calls] == ["stream", "interativa", "lote"]
+
+
+def test_long_queue_switches_to_the_fallback_model():
+    scheduler = GroqScheduler(max_concurrency=1, rpm=0, tpm=0, fallback_model="menor", fallback_queue_depth=1)
+    completions = _Completions()
+    stream = scheduler.call(completions, _options("stream", stream=True))
+    next(stream)
+
+    first = _call_in_thread(scheduler, completions, _options("primeira"))
+    _wait_until(lambda: scheduler.stats()["waiting"] == 1)
+    second = _call_in_thread(scheduler, completions, _options("segunda"))
+    _wait_until(lambda: scheduler.stats()["waiting"] == 2)
+
+    stream.close()
+    first.join()
+    second.join()
+    assert dict(completions.calls) == {"stream": "principal", "primeira": "principal", "segunda": "menor"}
+    assert scheduler.stats()["fallbacks"] == 1
+
+
+def test_stream_closed_early_releases_the_slot():
+    scheduler = GroqScheduler(max_concurrency=1, rpm=0, tpm=0, fallback_model="")
+    completions = _Completions()
+    stream = scheduler.call(completions, _options("stream", stream=True))
+
+    assert next(stream) == "a"
+    assert scheduler.stats()["active"] == 1
+    stream.close()
+    assert scheduler.stats()["active"] == 0
+
+    # A vaga liberada atende a próxima chamada sem espera
+    assert scheduler.call(completions, _options("seguinte")) == "seguinte"
+
+
+def test_retryable_errors_are_retried():
+    request = httpx.Request("POST", "http://groq.test/chat/completions")
+    completions = _Completions(errors=[groq.APIConnectionError(request=request)])
+    scheduler = GroqScheduler(max_concurrency=1, rpm=0, tpm=0, retry_base_delay=0.001, retry_max_delay=0.001,
+                              fallback_model="")
+
+    assert scheduler.call(completions, _options("pergunta")) == "pergunta"
+    assert len(completions.calls) == 2
+    assert scheduler.stats()["retries"] == 1
+    assert scheduler.stats()["active"] == 0
+
+
+def test_call_waiting_past_the_deadline_is_dropped_before_groq():
+    scheduler = GroqScheduler(max_concurrency=1, rpm=0, tpm=0, fallback_model="")
+    completions = _Completions()
+    stream = scheduler.call(completions, _options("stream", stream=True))
+    next(stream)
+    trace = Trace()
+    trace.deadline = time.perf_counter() + 0.05
+
+    with activate(trace), pytest.raises(DeadlineExceeded):
+        scheduler.call(completions, _options("atrasada"))
+    assert [content for content, _ in completions.calls] == ["stream"]
+    assert scheduler.stats()["waiting"] == 0
+    assert trace.events == ["deadline_exceeded"]
+    assert trace.attributes["deadline_stage"] == "groq_queue"
+    stream.close()
@@ -0,0 +1,155 @@
+import asyncio
+import pytest
+from utils.single_flight import SingleFlight, AsyncSingleFlight
+
+
+class _Source:
+    """Iterador de trechos que registra quantas vezes foi criado e se foi encerrado"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.created = 0
+        self.closed = False
+
+    def __call__(self):
+        self.created += 1
+        return self._iterate()
+
+    def _iterate(self):
+        try:
+            yield from self.chunks
+        finally:
+            self.closed = True
+
+
+def test_follower_shares_the_leader_computation():
+    flights = SingleFlight()
+    source = _Source(["a", "b", "c"])
+    leader, is_leader = flights.join("k", source)
+    follower, is_follower_leader = flights.join("k", source)
+
+    assert is_leader and not is_follower_leader
+    assert list(leader) == ["a", "b", "c"]
+    assert list(follower) == ["a", "b", "c"]
+    assert source.created == 1
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_follower_closing_early_does_not_stop_the_leader():
+    flights = SingleFlight()
+    source = _Source(["a", "b", "c"])
+    leader, _ = flights.join("k", source)
+    follower, _ = flights.join("k", source)
+
+    assert next(follower) == "a"
+    follower.close()
+    assert not source.closed
+    assert list(leader) == ["a", "b", "c"]
+
+
+def test_leader_closing_early_does_not_stop_the_follower():
+    flights = SingleFlight()
+    source = _Source(["a", "b", "c"])
+    leader, _ = flights.join("k", source)
+    follower, _ = flights.join("k", source)
+
+    assert next(leader) == "a"
+    leader.close()
+    assert list(follower) == ["a", "b", "c"]
+
+
+def test_computation_is_closed_when_every_participant_leaves():
+    flights = SingleFlight()
+    source = _Source(["a", "b", "c"])
+    leader, _ = flights.join("k", source)
+    follower, _ = flights.join("k", source)
+
+    next(leader)
+    next(follower)
+    leader.close()
+    follower.close()
+    assert source.closed
+    assert flights.stats()["in_flight"] == 0
+
+    # Uma nova chamada com a mesma chave inicia outra computação
+    _, is_leader = flights.join("k", source)
+    assert is_leader
+
+
+def test_error_is_delivered_to_every_participant():
+    def failing():
+        yield "a"
+        raise RuntimeError("falha")
+
+    flights = SingleFlight()
+    leader, _ = flights.join("k", failing)
+    follower, _ = flights.join("k", failing)
+
+    with pytest.raises(RuntimeError):
+        list(leader)
+    with pytest.raises(RuntimeError):
+        list(follower)
+
+
+class _AsyncSource:
+    def __init__(self, chunks, delay=0.01):
+        self.chunks = chunks
+        self.delay = delay
+        self.created = 0
+        self.closed = False
+
+    def __call__(self):
+        self.created += 1
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            for chunk in self.chunks:
+                await asyncio.sleep(self.delay)
+                yield chunk
+        finally:
+            self.closed = True
+
+
+async def _collect(iterator):
+    return [chunk async for chunk in iterator]
+
+
+@pytest.mark.parametrize("cancelled", ["leader", "follower"])
+def test_async_cancelled_participant_does_not_stop_the_other(cancelled):
+    async def scenario():
+        flights = AsyncSingleFlight()
+        source = _AsyncSource(["a", "b", "c"])
+        leader, _ = flights.join("k", source)
+        follower, _ = flights.join("k", source)
+        tasks = {"leader": asyncio.create_task(_collect(leader)),
+                 "follower": asyncio.create_task(_collect(follower))}
+        await asyncio.sleep(0.015)
+        tasks[cancelled].cancel()
+        remaining = tasks["follower" if cancelled == "leader" else "leader"]
+
+        assert await remaining == ["a", "b", "c"]
+        with pytest.raises(asyncio.CancelledError):
+            await tasks[cancelled]
+        assert source.created == 1
+
+    asyncio.run(scenario())
+
+
+def test_async_computation_is_cancelled_when_every_participant_leaves():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        source = _AsyncSource(["a", "b", "c"])
+        leader, _ = flights.join("k", source)
+        follower, _ = flights.join("k", source)
+        tasks = [asyncio.create_task(_collect(leader)), asyncio.create_task(_collect(follower))]
+        await asyncio.sleep(0.015)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert source.closed
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,335 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import math
+import threading
+import time
+from config import (ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_RETRIEVAL_CONCURRENCY,
+                    ADMISSION_GENERATION_CONCURRENCY, ADMISSION_DEADLINE, ADMISSION_DEGRADE_QUEUE_DEPTH)
+from utils.metrics import current_trace
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Etapas da consulta com vagas próprias
+STAGE_RETRIEVAL = "retrieval"
+STAGE_GENERATION = "generation"
+
+OVERLOADED_MESSAGE = "O sistema está sobrecarregado no momento. Tente novamente em alguns instantes."
+DEADLINE_MESSAGE = "O tempo de espera da consulta se esgotou porque o sistema está sobrecarregado. Tente novamente em alguns instantes."
+
+
+class AdmissionError(Exception):
+    """Consulta descartada pelo controle de admissão; a mensagem é exibida ao usuário"""
+
+
+class AdmissionRejected(AdmissionError):
+    """Fila de espera cheia: a consulta é recusada imediatamente"""
+
+
+class DeadlineExceeded(AdmissionError):
+    """Prazo da consulta esgotado: ela é descartada antes de chegar ao Groq"""
+
+
+def remaining_time(trace=None):
+    """
+    Tempo restante até o prazo da consulta
+
+    Args:
+        trace: Trace da consulta (padrão: o da consulta em andamento)
+
+    Returns:
+        Segundos restantes (negativo se o prazo já passou), ou None se a consulta não tem prazo
+    """
+    trace = trace if trace is not None else current_trace()
+    if trace.deadline is None or math.isinf(trace.deadline):
+        return None
+    return trace.deadline - time.perf_counter()
+
+
+def _expire(trace, stage):
+    trace.event("deadline_exceeded")
+    trace.set("deadline_stage", stage)
+    logger.warning(f"Prazo da consulta esgotado (etapa {stage}). Consulta descartada")
+    raise DeadlineExceeded(DEADLINE_MESSAGE)
+
+
+def check_deadline(stage):
+    """
+    Descarta a consulta em andamento se o seu prazo já se esgotou (usado antes das chamadas ao Groq)
+
+    Args:
+        stage: Etapa em que o prazo foi verificado (registrada no trace)
+
+    Raises:
+        DeadlineExceeded: Se o prazo se esgotou
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        _expire(current_trace(), stage)
+
+
+class _Slots:
+    """
+    Vagas de uma etapa, com fila de espera opcionalmente limitada (limit <= 0 = sem limite). A vaga
+    liberada é entregue diretamente à consulta mais antiga da fila, para que as consultas recém-chegadas
+    não passem à frente de quem já espera
+    """
+
+    def __init__(self, limit, max_waiting=None):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting = 0
+        self._waiters = collections.deque()
+        self._condition = threading.Condition()
+
+    def _available(self):
+        return self.limit <= 0 or self.active < self.limit
+
+    def _check_queue(self):
+        if not self._available() and self.max_waiting is not None and self.waiting >= self.max_waiting:
+            raise AdmissionRejected(OVERLOADED_MESSAGE)
+
+    def acquire(self, timeout=None):
+        """
+        Ocupa uma vaga, aguardando até timeout segundos (None = sem limite)
+
+        Returns:
+            True se a vaga foi ocupada, False se o tempo se esgotou
+
+        Raises:
+            AdmissionRejected: Se não há vaga livre e a fila de espera está cheia
+        """
+        with self._condition:
+            self._check_queue()
+            if self._available() and not self.waiting:
+                self.active += 1
+                return True
+            granted = threading.Event()
+            self._waiters.append(granted)
+            self.waiting += 1
+            if not self._condition.wait_for(granted.is_set, timeout):
+                self._waiters.remove(granted)
+                self.waiting -= 1
+                return False
+            return True
+
+    def release(self):
+        with self._condition:
+            if self._waiters:
+                # A vaga passa para a consulta mais antiga da fila, que deixa de contar como em espera
+                self._waiters.popleft().set()
+                self.waiting -= 1
+                self._condition.notify_all()
+            else:
+                self.active -= 1
+
+    def stats(self):
+        return {"active": self.active, "waiting": self.waiting, "limit": self.limit}
+
+
+class _AsyncSlots(_Slots):
+    """Versão assíncrona de _Slots (toda a coordenação ocorre no event loop)"""
+
+    async def acquire(self, timeout=None):
+        self._check_queue()
+        if self._available() and not self.waiting:
+            self.active += 1
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.waiting -= 1
+            return False
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Cancelada no instante em que recebeu a vaga: repassá-la à próxima da fila
+                self.release()
+            else:
+                self.waiting -= 1
+            raise
+        return True
+
+    def release(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(True)
+                self.waiting -= 1
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """
+    Controle de admissão das consultas interativas: limita as consultas em processamento e a fila
+    de espera (com a fila cheia, as novas consultas são recusadas na hora), limita as vagas de cada
+    etapa (recuperação e geração), define o prazo de cada consulta, propagado pelo trace até as
+    chamadas ao Groq, e, com a fila longa, processa as consultas no modo degradado (busca semântica
+    direta, sem o planejamento pela LLM)
+    """
+
+    _slots = _Slots
+
+    def __init__(self, max_concurrency=ADMISSION_MAX_CONCURRENCY, max_queue=ADMISSION_MAX_QUEUE,
+                 deadline=ADMISSION_DEADLINE, degrade_queue_depth=ADMISSION_DEGRADE_QUEUE_DEPTH, stage_limits=None):
+        """
+        Args:
+            max_concurrency: Número máximo de consultas em processamento (0 = sem limite)
+            max_queue: Número máximo de consultas aguardando vaga
+            deadline: Espera máxima do usuário até a chamada ao Groq, em segundos (0 = sem prazo)
+            degrade_queue_depth: Consultas na fila a partir das quais o modo degradado é usado (0 = nunca)
+            stage_limits: Vagas por etapa (padrão: ADMISSION_RETRIEVAL_CONCURRENCY e ADMISSION_GENERATION_CONCURRENCY)
+        """
+        if stage_limits is None:
+            stage_limits = {STAGE_RETRIEVAL: ADMISSION_RETRIEVAL_CONCURRENCY, STAGE_GENERATION: ADMISSION_GENERATION_CONCURRENCY}
+        self.deadline = deadline
+        self.degrade_queue_depth = degrade_queue_depth
+        self.admitted = 0
+        self.rejected = 0
+        self.degraded = 0
+        self.expired = 0
+        self._requests = self._slots(max_concurrency, max_queue)
+        self._stages = {name: self._slots(limit) for name, limit in stage_limits.items()}
+        self._lock = threading.Lock()
+
+    def _start(self, trace):
+        """
+        Define o prazo da consulta
+
+        Returns:
+            Número de consultas na fila na chegada da consulta
+        """
+        trace.deadline = trace.start + self.deadline if self.deadline > 0 else math.inf
+        return self._requests.waiting
+
+    def _admitted(self, trace, queue_depth):
+        """Registra a admissão e decide, pela fila encontrada na chegada, se a consulta usa o modo degradado"""
+        degraded = 0 < self.degrade_queue_depth <= queue_depth
+        with self._lock:
+            self.admitted += 1
+            self.degraded += degraded
+        if degraded:
+            logger.warning(f"{queue_depth} consultas na fila. Usando a busca semântica direta, sem planejamento pela LLM")
+            trace.event("admission_degraded")
+        return degraded
+
+    def _rejected(self, trace):
+        logger.warning(f"Fila de admissão cheia ({self._requests.waiting} consultas). Consulta recusada")
+        trace.event("admission_rejected")
+        with self._lock:
+            self.rejected += 1
+
+    def _acquired(self, acquired, name, trace, start):
+        """Registra a espera pela vaga e descarta a consulta se o prazo se esgotou antes dela"""
+        trace.add_timing(f"{name}_queue", time.perf_counter() - start)
+        if not acquired:
+            with self._lock:
+                self.expired += 1
+            _expire(trace, name)
+
+    def _timeout(self, trace):
+        remaining = remaining_time(trace)
+        return max(0.0, remaining) if remaining is not None else None
+
+    def _acquire(self, slots, name, trace):
+        start = time.perf_counter()
+        try:
+            acquired = slots.acquire(self._timeout(trace))
+        except AdmissionRejected:
+            self._rejected(trace)
+            raise
+        self._acquired(acquired, name, trace, start)
+
+    @contextlib.contextmanager
+    def admit(self, trace):
+        """
+        Admite a consulta durante o bloco, aguardando uma vaga até o prazo
+
+        Args:
+            trace: Trace da consulta (recebe o prazo e os eventos do controle de admissão)
+
+        Yields:
+            True se a consulta deve ser processada no modo degradado (sem o planejamento pela LLM)
+
+        Raises:
+            AdmissionRejected: Se não há vaga e a fila de espera está cheia
+            DeadlineExceeded: Se o prazo se esgotou antes de uma vaga ser liberada
+        """
+        queue_depth = self._start(trace)
+        self._acquire(self._requests, "admission", trace)
+        try:
+            yield self._admitted(trace, queue_depth)
+        finally:
+            # O prazo vale apenas enquanto a consulta está admitida (não vale, por exemplo, para o resumo do chat)
+            trace.deadline = None
+            self._requests.release()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Ocupa uma vaga da etapa durante o bloco. Não limita etapas sem limite configurado nem
+        consultas fora do controle de admissão (sem prazo, como as do processamento em lote)
+        """
+        trace = current_trace()
+        slots = self._stages.get(name)
+        if slots is None or trace.deadline is None:
+            yield
+            return
+        self._acquire(slots, name, trace)
+        try:
+            yield
+        finally:
+            slots.release()
+
+    def stats(self):
+        """Retorna o estado do controle de admissão: vagas, fila, consultas admitidas, recusadas, degradadas e expiradas"""
+        return dict(self._requests.stats(), max_queue=self._requests.max_waiting, admitted=self.admitted,
+                    rejected=self.rejected, degraded=self.degraded, expired=self.expired,
+                    stages={name: slots.stats() for name, slots in self._stages.items()})
+
+
+class AsyncAdmissionController(AdmissionController):
+    """Versão assíncrona de AdmissionController, para a pipeline assíncrona"""
+
+    _slots = _AsyncSlots
+
+    async def _acquire(self, slots, name, trace):
+        start = time.perf_counter()
+        try:
+            acquired = await slots.acquire(self._timeout(trace))
+        except AdmissionRejected:
+            self._rejected(trace)
+            raise
+        self._acquired(acquired, name, trace, start)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, trace):
+        """Versão assíncrona de AdmissionController.admit"""
+        queue_depth = self._start(trace)
+        await self._acquire(self._requests, "admission", trace)
+        try:
+            yield self._admitted(trace, queue_depth)
+        finally:
+            trace.deadline = None
+            self._requests.release()
+
+    @contextlib.asynccontextmanager
+    async def stage(self, name):
+        """Versão assíncrona de AdmissionController.stage"""
+        trace = current_trace()
+        slots = self._stages.get(name)
+        if slots is None or trace.deadline is None:
+            yield
+            return
+        await self._acquire(slots, name, trace)
+        try:
+            yield
+        finally:
+            slots.release()
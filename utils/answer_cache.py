@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from config import (ES_INDEX, LLM_MODEL, LLM_TEMPERATURE, RESPONSE_TEMPLATE_VERSION, ANSWER_CACHE_BACKEND,
+                    ANSWER_CACHE_MAX_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_PATH)
+from utils.lru_cache import KeyValueCache, MemoryKeyValueCache, SQLiteKeyValueCache
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_query(query_text):
+    """
+    Normaliza a consulta do usuário para uso como chave de cache
+    (minúsculas, sem pontuação e com espaços colapsados)
+
+    Args:
+        query_text: Texto da consulta
+
+    Returns:
+        Consulta normalizada
+    """
+    text = unicodedata.normalize("NFKC", query_text).lower()
+    text = _PUNCTUATION_RE.sub(' ', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+class AnswerCache(KeyValueCache):
+    """
+    Interface base do cache de respostas. A chave combina a consulta normalizada, os ids dos
+    documentos recuperados e a configuração da LLM (modelo, temperatura e versão do template).
+    """
+
+    name = "Cache de respostas"
+
+    def make_key(self, user_query, documents):
+        """
+        Calcula a chave de cache para uma consulta e seus documentos recuperados
+
+        Args:
+            user_query: Pergunta do usuário
+            documents: Documentos retornados pelo ElasticsearchClient.search
+
+        Returns:
+            Hash SHA-256 da chave
+        """
+        key_data = {
+            "query": normalize_query(user_query),
+            # Com o índice de cada documento, para que tenants com os mesmos ids não compartilhem respostas
+            "ids": sorted(f"{doc['index']}/{doc['id']}" if doc.get("index") else str(doc["id"]) for doc in documents),
+            "model": LLM_MODEL,
+            "temperature": LLM_TEMPERATURE,
+            "template": RESPONSE_TEMPLATE_VERSION
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def set(self, key, answer, index=ES_INDEX):
+        """
+        Armazena a resposta para a chave, associada aos índices consultados (separados por vírgula)
+        """
+        super().set(key, answer, index)
+
+
+class MemoryAnswerCache(MemoryKeyValueCache, AnswerCache):
+    """Cache LRU em memória, limitado por número de entradas e com TTL"""
+
+    def __init__(self, max_size=ANSWER_CACHE_MAX_SIZE, ttl=ANSWER_CACHE_TTL):
+        super().__init__(max_size, ttl)
+
+
+class SQLiteAnswerCache(SQLiteKeyValueCache, AnswerCache):
+    """Cache em disco (SQLite), persistente entre reinicializações, limitado por número de entradas e com TTL"""
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_size=ANSWER_CACHE_MAX_SIZE, ttl=ANSWER_CACHE_TTL):
+        super().__init__(path, "answer_entries", max_size, ttl)
+
+
+def create_answer_cache(backend=ANSWER_CACHE_BACKEND):
+    """
+    Cria o cache de respostas configurado em ANSWER_CACHE_BACKEND
+
+    Args:
+        backend: "memory", "sqlite" ou "none"
+
+    Returns:
+        Instância de AnswerCache, ou None se o cache estiver desativado
+    """
+    if backend == "memory":
+        logger.info(f"Cache de respostas em memória ativado (max_size={ANSWER_CACHE_MAX_SIZE}, ttl={ANSWER_CACHE_TTL}s)")
+        return MemoryAnswerCache()
+    if backend == "sqlite":
+        return SQLiteAnswerCache()
+    if backend == "none":
+        logger.info("Cache de respostas desativado")
+        return None
+    raise ValueError(f"ANSWER_CACHE_BACKEND inválido: {backend}")
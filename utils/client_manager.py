@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+import groq
+import httpx
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from config import (ES_CONNECTIONS_PER_NODE, GROQ_MAX_CONNECTIONS, GROQ_MAX_KEEPALIVE_CONNECTIONS,
+                    HTTP_KEEPALIVE_EXPIRY, HEALTH_CHECK_INTERVAL, RETRIEVER_BACKEND, RETRIEVER_FALLBACK_TIMEOUT,
+                    RERANK_ENABLED)
+from utils.es_client import ElasticsearchClient, AsyncElasticsearchClient, connection_options
+from utils.local_retriever import LocalHybridRetriever, AsyncLocalHybridRetriever
+from utils.retriever import FallbackRetriever, AsyncFallbackRetriever
+from utils.retrieval_cache import CachingRetriever, AsyncCachingRetriever, create_retrieval_cache
+from utils.reranker import RerankingRetriever, AsyncRerankingRetriever
+from utils.llm_client import LLMClient, AsyncLLMClient, groq_options
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Consulta usada para aquecer o endpoint de inferência do campo semantic_text
+WARMUP_QUERY = "aquecimento"
+
+# Mecanismos de recuperação disponíveis (RETRIEVER_BACKEND)
+RETRIEVER_BACKENDS = ("elasticsearch", "local", "fallback")
+
+
+def _es_options():
+    """Parâmetros do cliente Elasticsearch; no modo fallback, com o timeout curto que aciona o mecanismo local"""
+    options = connection_options()
+    if RETRIEVER_BACKEND == "fallback":
+        options["request_timeout"] = RETRIEVER_FALLBACK_TIMEOUT
+    return options
+
+
+def create_retriever(es_client=None, backend=RETRIEVER_BACKEND):
+    """
+    Cria o mecanismo de recuperação configurado em RETRIEVER_BACKEND, com o cache de resultados
+    do Elasticsearch (RETRIEVAL_CACHE_BACKEND) e o reranking dos candidatos se RERANK_ENABLED
+
+    Args:
+        es_client: ElasticsearchClient a usar (opcional; por padrão cria um novo, com ping)
+        backend: elasticsearch, local ou fallback (Elasticsearch com o mecanismo local nas falhas)
+
+    Returns:
+        Retriever
+    """
+    if backend not in RETRIEVER_BACKENDS:
+        raise ValueError(f"RETRIEVER_BACKEND inválido: {backend} (use {', '.join(RETRIEVER_BACKENDS)})")
+    if backend == "local":
+        retriever = LocalHybridRetriever()
+    else:
+        retriever = es_client if es_client is not None else ElasticsearchClient()
+        retrieval_cache = create_retrieval_cache()
+        if retrieval_cache is not None:
+            retriever = CachingRetriever(retriever, retrieval_cache)
+        if backend == "fallback":
+            retriever = FallbackRetriever(retriever, LocalHybridRetriever())
+    return RerankingRetriever(retriever) if RERANK_ENABLED else retriever
+
+
+def create_async_retriever(es_client=None, backend=RETRIEVER_BACKEND):
+    """Versão assíncrona de create_retriever (AsyncElasticsearchClient e AsyncLocalHybridRetriever)"""
+    if backend not in RETRIEVER_BACKENDS:
+        raise ValueError(f"RETRIEVER_BACKEND inválido: {backend} (use {', '.join(RETRIEVER_BACKENDS)})")
+    if backend == "local":
+        retriever = AsyncLocalHybridRetriever()
+    else:
+        retriever = es_client if es_client is not None else AsyncElasticsearchClient()
+        retrieval_cache = create_retrieval_cache()
+        if retrieval_cache is not None:
+            retriever = AsyncCachingRetriever(retriever, retrieval_cache)
+        if backend == "fallback":
+            retriever = AsyncFallbackRetriever(retriever, AsyncLocalHybridRetriever())
+    return AsyncRerankingRetriever(retriever) if RERANK_ENABLED else retriever
+
+
+class ClientManager:
+    """
+    Gerencia clientes Elasticsearch e Groq compartilhados pelo processo, com pools de conexões
+    HTTP persistentes (keep-alive), aquecimento na inicialização e verificação de saúde em segundo plano
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._es_client = None
+        self._llm_client = None
+        self._health_thread = None
+        self._stop_event = threading.Event()
+        self.healthy = None
+        self.last_health_check = None
+
+    def _httpx_limits(self):
+        return httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+
+    def get_es_client(self):
+        """
+        Retorna o mecanismo de recuperação compartilhado (RETRIEVER_BACKEND), criando-o na primeira
+        chamada (sem ping): o ElasticsearchClient, o mecanismo local ou o Elasticsearch com fallback local
+        """
+        with self._lock:
+            if self._es_client is None:
+                es_client = None
+                if RETRIEVER_BACKEND != "local":
+                    logger.info(f"Criando pool de conexões do Elasticsearch (connections_per_node={ES_CONNECTIONS_PER_NODE})")
+                    es_client = ElasticsearchClient(es=Elasticsearch(**_es_options()))
+                self._es_client = create_retriever(es_client)
+            return self._es_client
+
+    def get_llm_client(self):
+        """Retorna o LLMClient compartilhado, criando-o na primeira chamada"""
+        with self._lock:
+            if self._llm_client is None:
+                logger.info(f"Criando pool de conexões do Groq (max_connections={GROQ_MAX_CONNECTIONS})")
+                client = groq.Client(**groq_options(), http_client=httpx.Client(limits=self._httpx_limits()))
+                self._llm_client = LLMClient(client=client)
+            return self._llm_client
+
+    def create_async_clients(self):
+        """
+        Cria os clientes assíncronos com os mesmos limites de pool. Clientes assíncronos ficam
+        associados ao event loop em que são usados, por isso não são compartilhados entre loops.
+
+        Returns:
+            Tupla (mecanismo de recuperação assíncrono, AsyncLLMClient)
+        """
+        es_client = None
+        if RETRIEVER_BACKEND != "local":
+            es_client = AsyncElasticsearchClient(es=AsyncElasticsearch(**_es_options()))
+        client = groq.AsyncClient(**groq_options(), http_client=httpx.AsyncClient(limits=self._httpx_limits()))
+        return create_async_retriever(es_client), AsyncLLMClient(client=client)
+
+    def warm_up(self):
+        """
+        Abre as conexões (TLS) com o Elasticsearch e o Groq e executa uma consulta semântica
+        de aquecimento, para que o primeiro usuário não pague esse custo
+        """
+        start_time = time.time()
+        es_client = self.get_es_client()
+        llm_client = self.get_llm_client()
+
+        if not es_client.ping():
+            self.healthy = False
+            raise ConnectionError("Falha no ping: Não foi possível conectar ao Elasticsearch")
+        self.healthy = True
+        self.last_health_check = time.time()
+
+        try:
+            es_client.semantic_search(WARMUP_QUERY, size=1)
+        except Exception as e:
+            logger.warning(f"Falha na consulta de aquecimento do Elasticsearch: {str(e)}")
+
+        try:
+            llm_client.client.models.list()
+        except Exception as e:
+            logger.warning(f"Falha no aquecimento da conexão com o Groq: {str(e)}")
+
+        logger.info(f"Clientes aquecidos em {time.time() - start_time:.2f} segundos")
+
+    async def warm_up_async(self, es_client, llm_client):
+        """Versão assíncrona do aquecimento, executada no event loop em que os clientes serão usados"""
+        start_time = time.time()
+        await es_client.verify_connection()
+        try:
+            await es_client.semantic_search(WARMUP_QUERY, size=1)
+        except Exception as e:
+            logger.warning(f"Falha na consulta de aquecimento do Elasticsearch: {str(e)}")
+        try:
+            await llm_client.client.models.list()
+        except Exception as e:
+            logger.warning(f"Falha no aquecimento da conexão com o Groq: {str(e)}")
+        logger.info(f"Clientes assíncronos aquecidos em {time.time() - start_time:.2f} segundos")
+
+    def _health_check_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                healthy = bool(self.get_es_client().ping())
+            except Exception as e:
+                logger.error(f"Erro na verificação de saúde do Elasticsearch: {str(e)}")
+                healthy = False
+            if healthy != self.healthy:
+                logger.info(f"Estado do Elasticsearch alterado: {'saudável' if healthy else 'indisponível'}")
+            self.healthy = healthy
+            self.last_health_check = time.time()
+
+    def start_health_check(self, interval=HEALTH_CHECK_INTERVAL):
+        """Inicia a verificação de saúde periódica em uma thread em segundo plano"""
+        if interval <= 0 or self._health_thread is not None:
+            return
+        self._stop_event.clear()
+        self._health_thread = threading.Thread(target=self._health_check_loop, args=(interval,),
+                                               name="health-check", daemon=True)
+        self._health_thread.start()
+        logger.info(f"Verificação de saúde em segundo plano iniciada (intervalo de {interval}s)")
+
+    def stop_health_check(self):
+        """Interrompe a verificação de saúde em segundo plano"""
+        self._stop_event.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+            self._health_thread = None
+
+    def close(self):
+        """Interrompe a verificação de saúde e fecha os pools de conexões"""
+        self.stop_health_check()
+        with self._lock:
+            if self._es_client is not None:
+                self._es_client.close()
+                self._es_client = None
+            if self._llm_client is not None:
+                self._llm_client.client.close()
+                self._llm_client = None
+
+
+# Instância compartilhada pelo processo
+client_manager = ClientManager()
@@ -0,0 +1,177 @@
+import json
+import logging
+import re
+from config import ES_TEXT_FIELD, ES_SEMANTIC_FIELD, CONTEXT_MAX_TOKENS, CONTEXT_MAX_TOKENS_PER_DOC, CONTEXT_DEDUP_THRESHOLD
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+_WORD_RE = re.compile(r'\w+')
+_PASSAGE_SPLIT_RE = re.compile(r'(?<=[.!?;])\s+|\n+')
+
+# Documentos que não cabem com pelo menos este número de tokens não são incluídos (exceto o primeiro)
+MIN_DOCUMENT_TOKENS = 50
+
+def estimate_tokens(text):
+    """
+    Estima o número de tokens de um texto sem depender do tokenizador do modelo.
+    Cada palavra ou sinal de pontuação conta como um token, e palavras longas contam
+    como um token adicional a cada 6 caracteres (aproximação de tokenizadores BPE).
+
+    Args:
+        text: Texto a ser medido
+
+    Returns:
+        Número aproximado de tokens
+    """
+    return sum(1 + len(piece) // 6 for piece in _TOKEN_RE.findall(text))
+
+def truncate_to_tokens(text, max_tokens):
+    """Corta o texto no ponto em que a estimativa de tokens excede max_tokens"""
+    used = 0
+    for match in _TOKEN_RE.finditer(text):
+        used += 1 + len(match.group()) // 6
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + " ..."
+    return text
+
+def split_passages(text):
+    """Divide o texto em passagens (frases e parágrafos), sem as passagens vazias"""
+    return [passage.strip() for passage in _PASSAGE_SPLIT_RE.split(text) if passage.strip()]
+
+def extract_document_text(source):
+    """
+    Extrai o conteúdo textual de um documento com base nos campos mais comuns
+    Adicione ou modifique os campos de acordo com a estrutura real do seu índice
+
+    Args:
+        source: _source do documento retornado pelo Elasticsearch
+
+    Returns:
+        Texto do documento
+    """
+    if ES_TEXT_FIELD in source:
+        return str(source[ES_TEXT_FIELD])
+    if "text" in source:
+        return str(source["text"])
+    if "content" in source:
+        return str(source["content"])
+    if "title" in source and "body" in source:
+        return f"Título: {source['title']}\n\nConteúdo: {source['body']}"
+
+    # Mostrar todo o documento se não houver campo específico
+    # Excluir o campo vetorial para não sobrecarregar o contexto
+    source_copy = {key: value for key, value in source.items() if key != ES_SEMANTIC_FIELD}
+    return json.dumps(source_copy, ensure_ascii=False, indent=2)
+
+def _terms(text):
+    return {word for word in _WORD_RE.findall(text.lower()) if len(word) > 2}
+
+def truncate_around_query(text, query_terms, max_tokens):
+    """
+    Reduz o texto a uma janela de passagens consecutivas centrada na passagem mais
+    relevante para a consulta (maior número de termos da consulta), dentro de max_tokens
+
+    Args:
+        text: Texto do documento
+        query_terms: Conjunto de termos da consulta
+        max_tokens: Número máximo de tokens da janela
+
+    Returns:
+        Texto truncado
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    passages = split_passages(text)
+    costs = [estimate_tokens(passage) for passage in passages]
+    scores = [len(query_terms & _terms(passage)) for passage in passages]
+    best = max(range(len(passages)), key=lambda i: scores[i])
+
+    if costs[best] >= max_tokens:
+        return truncate_to_tokens(passages[best], max_tokens)
+
+    # Expandir a janela para os vizinhos, alternando entre a passagem seguinte e a anterior
+    start = end = best
+    used = costs[best]
+    while True:
+        expanded = False
+        if end + 1 < len(passages) and used + costs[end + 1] <= max_tokens:
+            end += 1
+            used += costs[end]
+            expanded = True
+        if start > 0 and used + costs[start - 1] <= max_tokens:
+            start -= 1
+            used += costs[start]
+            expanded = True
+        if not expanded:
+            break
+
+    window = " ".join(passages[start:end + 1])
+    if start > 0:
+        window = "... " + window
+    if end < len(passages) - 1:
+        window = window + " ..."
+    return window
+
+def _shingles(text, size=3):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def build_context(user_query, documents, max_tokens=CONTEXT_MAX_TOKENS,
+                  max_tokens_per_doc=CONTEXT_MAX_TOKENS_PER_DOC, dedup_threshold=CONTEXT_DEDUP_THRESHOLD):
+    """
+    Seleciona e prepara os trechos dos documentos que entram no contexto do prompt:
+    ordena por score, usa os fragmentos do highlight (se houver) ou trunca cada documento
+    em torno da passagem relevante, remove quase-duplicatas e empacota até atingir o orçamento
+    de tokens. O documento mais relevante é sempre incluído (truncado ao orçamento, se necessário)
+
+    Args:
+        user_query: Pergunta do usuário
+        documents: Documentos recuperados do Elasticsearch
+        max_tokens: Orçamento total de tokens do contexto
+        max_tokens_per_doc: Número máximo de tokens por documento
+        dedup_threshold: Similaridade de Jaccard (shingles de 3 palavras) a partir da qual um trecho é descartado
+
+    Returns:
+        Lista de tuplas (documento, trecho) na ordem em que devem aparecer no contexto
+    """
+    query_terms = _terms(user_query)
+    ordered = sorted(documents, key=lambda doc: doc.get("score") or 0.0, reverse=True)
+
+    selected = []
+    selected_shingles = []
+    used = 0
+    for position, doc in enumerate(ordered):
+        remaining = max_tokens - used
+        # Mesmo com um orçamento menor que MIN_DOCUMENT_TOKENS, o contexto nunca fica vazio
+        if selected and remaining < MIN_DOCUMENT_TOKENS:
+            logger.info(f"Orçamento de contexto esgotado; {len(ordered) - position} documentos não incluídos")
+            break
+
+        # Com highlight, os fragmentos retornados pelo Elasticsearch já são as passagens relevantes
+        if doc.get("highlights"):
+            text = truncate_to_tokens(" ... ".join(doc["highlights"]), min(max_tokens_per_doc, remaining))
+        else:
+            text = truncate_around_query(extract_document_text(doc["source"]), query_terms,
+                                         min(max_tokens_per_doc, remaining))
+        shingles = _shingles(text)
+        if any(_jaccard(shingles, other) >= dedup_threshold for other in selected_shingles):
+            logger.info(f"Documento {doc['id']} descartado do contexto por ser quase duplicado")
+            continue
+
+        selected.append((doc, text))
+        selected_shingles.append(shingles)
+        used += estimate_tokens(text)
+
+    logger.info(f"Contexto montado com {len(selected)} documentos e ~{used} tokens")
+    return selected
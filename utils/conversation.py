@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+import uuid
+from config import (CHAT_MAX_SESSIONS, CHAT_SESSION_TTL, CHAT_MAX_TURNS, CHAT_KEEP_TURNS,
+                    CHAT_HISTORY_MAX_TOKENS, CHAT_TOPIC_OVERLAP)
+from utils.context_builder import estimate_tokens, truncate_to_tokens
+from utils.keywords import extract_keywords, normalize_terms
+from utils.lru_cache import TTLLRUCache
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tipos de recuperação de um turno da conversa
+RETRIEVAL_FULL = "full"  # Novo assunto: recuperação completa
+RETRIEVAL_REUSE = "reuse"  # Continuação sem termos novos: reutiliza os documentos do turno anterior
+RETRIEVAL_DELTA = "delta"  # Continuação com termos novos: busca apenas os termos novos
+
+# Palavras típicas de perguntas de continuação, que não indicam um assunto novo
+FOLLOW_UP_TERMS = frozenset(normalize_terms("""
+depois entao antes agora explique explica explicar melhor detalhe detalhes detalhar exemplo exemplos
+continue continua resuma resumo resumir outro outra outros outras aconteceu acontece dizer disse falar
+"""))
+
+
+class Conversation:
+    """
+    Estado de uma sessão de chat: turnos recentes, resumo dos turnos antigos, documentos
+    recuperados no último turno, termos do assunto em andamento e índices consultados
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.turns = []  # [{"question", "answer"}]
+        self.summary = ""
+        self.documents = []
+        self.topic_terms = set()
+        self.last_question = None
+        self.indices = None
+        self.updated_at = time.time()
+
+    def use_indices(self, indices):
+        """
+        Associa a conversa aos índices consultados no turno. Se a sessão chega com outros índices
+        (por exemplo, outro tenant), o histórico, o resumo e os documentos são descartados, para
+        que nada recuperado dos índices anteriores seja reaproveitado, e o turno faz a recuperação completa
+
+        Args:
+            indices: Tupla de índices consultados no turno
+
+        Returns:
+            True se a conversa foi reiniciada por causa da troca de índices
+        """
+        indices = tuple(indices)
+        if indices == self.indices:
+            return False
+        changed = self.indices is not None
+        if changed:
+            logger.info(f"Sessão {self.session_id} mudou de índices ({', '.join(self.indices)} -> {', '.join(indices)}). Reiniciando a conversa")
+            self.turns = []
+            self.summary = ""
+            self.documents = []
+            self.topic_terms = set()
+            self.last_question = None
+        self.indices = indices
+        return changed
+
+    def plan_retrieval(self, question):
+        """
+        Decide como recuperar os documentos do turno: continuação do assunto anterior (com ou
+        sem termos novos) ou novo assunto
+
+        Args:
+            question: Pergunta do turno atual
+
+        Returns:
+            Tupla (tipo de recuperação, palavras-chave novas para a busca incremental)
+        """
+        if not self.documents or not self.topic_terms:
+            return RETRIEVAL_FULL, []
+
+        terms = set(normalize_terms(question)) - FOLLOW_UP_TERMS
+        new_terms = terms - self.topic_terms
+        # Perguntas sem termos próprios ("e depois?", "explique melhor") continuam o assunto
+        if not new_terms:
+            return RETRIEVAL_REUSE, []
+        if len(terms & self.topic_terms) / len(terms) < CHAT_TOPIC_OVERLAP and len(terms) > 1:
+            return RETRIEVAL_FULL, []
+
+        delta_keywords = [keyword for keyword in extract_keywords(question)
+                          if set(normalize_terms(keyword)) & new_terms]
+        return RETRIEVAL_DELTA, delta_keywords
+
+    def history_text(self, max_tokens=CHAT_HISTORY_MAX_TOKENS):
+        """
+        Texto do histórico enviado à LLM: resumo dos turnos antigos e os turnos recentes que
+        couberem no orçamento de tokens (os mais recentes têm prioridade)
+        """
+        parts = []
+        used = 0
+        for turn in reversed(self.turns):
+            text = f"Usuário: {turn['question']}\nAssistente: {turn['answer']}"
+            cost = estimate_tokens(text)
+            if parts and used + cost > max_tokens:
+                break
+            parts.append(truncate_to_tokens(text, max_tokens) if cost > max_tokens else text)
+            used += cost
+        if self.summary and used < max_tokens:
+            parts.append(truncate_to_tokens(f"Resumo da conversa até aqui: {self.summary}", max_tokens - used))
+        return "\n\n".join(reversed(parts))
+
+    def add_turn(self, question, answer, documents, retrieval):
+        """
+        Registra um turno concluído
+
+        Args:
+            question: Pergunta do usuário
+            answer: Resposta gerada
+            documents: Documentos usados na resposta
+            retrieval: Tipo de recuperação usado no turno
+        """
+        self.turns.append({"question": question, "answer": answer})
+        self.documents = documents
+        terms = set(normalize_terms(question))
+        self.topic_terms = terms if retrieval == RETRIEVAL_FULL else self.topic_terms | terms
+        self.last_question = question
+        self.updated_at = time.time()
+
+    def turns_to_summarize(self):
+        """Turnos antigos que devem ser resumidos (apenas quando o histórico passa de CHAT_MAX_TURNS)"""
+        if len(self.turns) <= CHAT_MAX_TURNS:
+            return []
+        return self.turns[:len(self.turns) - CHAT_KEEP_TURNS]
+
+    def apply_summary(self, summary, summarized_turns):
+        """Substitui os turnos resumidos pelo novo resumo"""
+        self.summary = summary
+        self.turns = self.turns[summarized_turns:]
+
+
+class ConversationStore:
+    """Sessões de chat em memória, com remoção LRU e expiração por inatividade"""
+
+    def __init__(self, max_sessions=CHAT_MAX_SESSIONS, ttl=CHAT_SESSION_TTL):
+        self._sessions = TTLLRUCache(max_sessions, ttl)
+        self._lock = threading.Lock()
+
+    def get(self, session_id=None):
+        """
+        Retorna a conversa da sessão, criando-a se não existir (ou se tiver expirado)
+
+        Args:
+            session_id: Identificador da sessão (None cria uma sessão nova)
+
+        Returns:
+            Instância de Conversation
+        """
+        with self._lock:
+            session_id = session_id or uuid.uuid4().hex
+            conversation = self._sessions.get(session_id)
+            if conversation is None:
+                conversation = Conversation(session_id)
+                logger.info(f"Nova sessão de chat: {session_id}")
+            # Renovar a expiração a cada acesso
+            self._sessions.set(session_id, conversation)
+            return conversation
+
+    def reset(self, session_id):
+        """Remove a conversa da sessão"""
+        self._sessions.pop(session_id)
+
+    def stats(self):
+        return self._sessions.stats()
@@ -1,31 +1,286 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from contextvars import ContextVar
+import asyncio
+import contextlib
+import hashlib
 import json
 import logging
-from config import ES_CLOUD_ID, ES_API_KEY, ES_INDEX, ES_TIMEOUT, ES_MAX_RESULTS, ES_TEXT_FIELD, ES_SEMANTIC_FIELD
+from utils.metrics import current_trace
+from utils.local_index import LocalBM25Index
+from utils.retriever import Retriever
+from utils.keywords import build_keyword_expression
+from config import (ES_CLOUD_ID, ES_API_KEY, ES_URL, ES_INDEX, ES_INDICES, ES_TENANT_INDICES, ES_INDEX_BUDGETS, ES_MERGE_STRATEGY, ES_TIMEOUT, ES_MAX_RESULTS, ES_CONNECTIONS_PER_NODE, ES_TEXT_FIELD, ES_SEMANTIC_FIELD,
+                    ES_SOURCE_INCLUDES, ES_SOURCE_EXCLUDES, ES_HIGHLIGHT, ES_HIGHLIGHT_FIELD,
+                    ES_HIGHLIGHT_FRAGMENT_SIZE, ES_HIGHLIGHT_FRAGMENTS, LOCAL_INDEX_ENABLED)
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class ElasticsearchClient:
-    def __init__(self):
+# Índices consultados na requisição em andamento (None = ES_INDICES)
+_search_indices = ContextVar("search_indices", default=None)
+
+# Constante do RRF na combinação dos resultados de vários índices (a mesma do retriever rrf do Elasticsearch)
+MERGE_RANK_CONSTANT = 60
+
+@contextlib.contextmanager
+def search_indices(indices):
+    """Define os índices consultados durante o bloco (None mantém ES_INDICES)"""
+    token = _search_indices.set(tuple(indices) if indices else None)
+    try:
+        yield
+    finally:
+        _search_indices.reset(token)
+
+def current_indices():
+    """Retorna a tupla de índices consultados na requisição em andamento"""
+    return _search_indices.get() or tuple(ES_INDICES)
+
+def searchable_indices():
+    """Retorna todos os índices que podem ser consultados (ES_INDICES e os índices dos tenants)"""
+    return sorted(set(ES_INDICES).union(*ES_TENANT_INDICES.values()))
+
+def resolve_indices(tenant=None, indices=None):
+    """
+    Determina os índices de uma requisição: a lista informada ou os índices do tenant (ES_TENANT_INDICES).
+    Com um tenant, a lista informada só pode conter índices desse tenant.
+    
+    Args:
+        tenant: Tenant da requisição (opcional)
+        indices: Lista de índices ou string separada por vírgula (opcional; precisam estar entre os índices
+                 do tenant ou, sem tenant, entre os searchable_indices)
+        
+    Returns:
+        Lista de índices, ou None para os índices padrão (ES_INDICES)
+        
+    Raises:
+        ValueError: Se o tenant for desconhecido ou algum índice não for permitido
+    """
+    if tenant and tenant not in ES_TENANT_INDICES:
+        raise ValueError(f"Tenant desconhecido: {tenant}")
+    if indices:
+        if isinstance(indices, str):
+            indices = indices.split(",")
+        indices = [index.strip() for index in indices if index.strip()]
+        allowed = set(ES_TENANT_INDICES[tenant]) if tenant else set(searchable_indices())
+        not_allowed = [index for index in indices if index not in allowed]
+        if not_allowed:
+            scope = f" para o tenant {tenant}" if tenant else ""
+            raise ValueError(f"Índices não permitidos{scope}: {', '.join(not_allowed)}")
+        if indices:
+            return indices
+    if tenant:
+        return ES_TENANT_INDICES[tenant]
+    return None
+
+def index_size(index, size):
+    """Número de documentos solicitados a um índice: size limitado ao orçamento do índice (ES_INDEX_BUDGETS)"""
+    budget = ES_INDEX_BUDGETS.get(index)
+    return min(size, budget) if budget else size
+
+def merge_index_results(results, size, strategy=ES_MERGE_STRATEGY):
+    """
+    Combina os resultados de uma mesma consulta em vários índices
+    
+    Args:
+        results: Lista com a lista de documentos de cada índice
+        size: Número máximo de documentos retornados
+        strategy: "rrf" (1 / (60 + posição) em cada índice, somado) ou "score" (scores normalizados
+                  para [0, 1] em cada índice)
+        
+    Returns:
+        Lista de documentos ordenada pelo score combinado (em "merge_score")
+    """
+    merged = {}
+    for documents in results:
+        scores = [doc["score"] or 0 for doc in documents]
+        low, spread = (min(scores), max(scores) - min(scores)) if scores else (0, 0)
+        for rank, (doc, score) in enumerate(zip(documents, scores), start=1):
+            if strategy == "score":
+                value = (score - low) / spread if spread > 0 else 1.0
+            else:
+                value = 1.0 / (MERGE_RANK_CONSTANT + rank)
+            key = (doc.get("index"), doc["id"])
+            if key in merged:
+                merged[key][0] += value
+            else:
+                merged[key] = [value, doc]
+    ranked = sorted(merged.values(), key=lambda entry: entry[0], reverse=True)[:size]
+    return [dict(doc, merge_score=value) for value, doc in ranked]
+
+def connection_options():
+    """
+    Monta os parâmetros de conexão do cliente Elasticsearch: ES_URL (on-prem ou local) tem
+    precedência sobre ES_CLOUD_ID (Elastic Cloud)
+    
+    Returns:
+        Dicionário de parâmetros para Elasticsearch/AsyncElasticsearch
+    """
+    # Verificar se temos as credenciais necessárias
+    if ES_URL:
+        options = {"hosts": [ES_URL]}
+        if ES_API_KEY:
+            options["api_key"] = ES_API_KEY
+        logger.info(f"Usando Elasticsearch em {ES_URL}")
+    else:
+        if not ES_CLOUD_ID:
+            raise ValueError("ES_CLOUD_ID (ou ES_URL) não configurado no arquivo .env")
+        if not ES_API_KEY:
+            raise ValueError("ES_API_KEY não configurado no arquivo .env")
+        options = {"cloud_id": ES_CLOUD_ID, "api_key": ES_API_KEY}
+        logger.info(f"Usando Elasticsearch com cloud_id: {ES_CLOUD_ID[:10]}...")
+    
+    options.update(
+        verify_certs=True,  # Geralmente True para conexões cloud
+        request_timeout=ES_TIMEOUT,
+        connections_per_node=ES_CONNECTIONS_PER_NODE
+    )
+    return options
+
+def index_version_from_stats(stats):
+    """
+    Calcula um marcador da versão do índice a partir da resposta de _stats/docs,indexing: muda
+    quando o índice é recriado (uuid) ou quando documentos são indexados, atualizados ou removidos
+    
+    Args:
+        stats: Resposta da API _stats do Elasticsearch (um ou mais índices, no caso de alias)
+        
+    Returns:
+        Hash curto da versão do índice
+    """
+    parts = []
+    for name, index_stats in sorted(stats.get("indices", {}).items()):
+        primaries = index_stats.get("primaries", {})
+        docs = primaries.get("docs", {})
+        indexing = primaries.get("indexing", {})
+        parts.append(f"{name}:{index_stats.get('uuid', '')}:{docs.get('count', 0)}:{docs.get('deleted', 0)}:"
+                     f"{indexing.get('index_total', 0)}:{indexing.get('delete_total', 0)}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def build_rrf_query(keyword_expression, query_text, size, filters=None):
+    """
+    Monta a consulta híbrida RRF: query_string com as palavras-chave no campo de texto e
+    semantic com a pergunta original no campo vetorizado
+    
+    Args:
+        keyword_expression: Expressão booleana do query_string (ex.: "(copa) OR (futebol)")
+        query_text: Pergunta original do usuário, usada na parte semântica
+        size: número máximo de resultados a retornar
+        filters: Lista de cláusulas de filtro aplicadas aos dois retrievers (opcional)
+        
+    Returns:
+        Dicionário da consulta RRF
+    """
+    queries = [
+        {
+            "query_string": {
+                "default_field": ES_TEXT_FIELD,
+                "query": keyword_expression
+            }
+        },
+        {
+            "semantic": {
+                "field": ES_SEMANTIC_FIELD,
+                "query": query_text
+            }
+        }
+    ]
+    if filters:
+        queries = [{"bool": {"must": [query], "filter": filters}} for query in queries]
+    
+    return {
+        "retriever": {
+            "rrf": {
+                "retrievers": [{"standard": {"query": query}} for query in queries]
+            }
+        },
+        "size": size
+    }
+
+def _retriever_queries(query):
+    """Retorna as consultas dos retrievers standard de uma consulta RRF (sem o bool dos filtros)"""
+    clauses = []
+    try:
+        for retriever in query["retriever"]["rrf"]["retrievers"]:
+            clause = retriever.get("standard", {}).get("query", {})
+            if "bool" in clause and clause["bool"].get("must"):
+                clause = clause["bool"]["must"][0]
+            clauses.append(clause)
+    except (KeyError, TypeError, AttributeError, IndexError):
+        pass
+    return clauses
+
+def _has_filters(query):
+    """Verifica se algum retriever da consulta RRF restringe os documentos com filtros (bool.filter)"""
+    try:
+        return any(retriever.get("standard", {}).get("query", {}).get("bool", {}).get("filter")
+                   for retriever in query["retriever"]["rrf"]["retrievers"])
+    except (KeyError, TypeError, AttributeError):
+        return False
+
+def extract_query_string_keywords(query):
+    """
+    Extrai a expressão de palavras-chave do retriever query_string de uma consulta RRF
+    
+    Args:
+        query: Dicionário da consulta RRF
+        
+    Returns:
+        Expressão query_string, ou None se a consulta não tiver um retriever query_string
+    """
+    for clause in _retriever_queries(query):
+        if "query_string" in clause:
+            return clause["query_string"].get("query")
+    return None
+
+def extract_semantic_query_text(query):
+    """
+    Extrai o texto do retriever semantic de uma consulta RRF (a pergunta original do usuário)
+    
+    Args:
+        query: Dicionário da consulta RRF
+        
+    Returns:
+        Texto da consulta semântica, ou None se a consulta não tiver um retriever semantic
+    """
+    for clause in _retriever_queries(query):
+        if "semantic" in clause:
+            return clause["semantic"].get("query")
+    return None
+
+def same_keywords(query_a, query_b):
+    """
+    Verifica se duas consultas RRF usam o mesmo conjunto de palavras-chave no query_string
+    (ignorando parênteses, operadores, ordem e maiúsculas)
+    """
+    def terms(query):
+        expression = extract_query_string_keywords(query) or ""
+        tokens = expression.lower().replace("(", " ").replace(")", " ").replace('"', " ").split()
+        return {token for token in tokens if token not in ("or", "and", "not")}
+    
+    return terms(query_a) == terms(query_b)
+
+class ElasticsearchClient(Retriever):
+    def __init__(self, es=None):
+        """
+        Inicializa o cliente Elasticsearch
+        
+        Args:
+            es: Instância de Elasticsearch já configurada (compartilhada pelo ClientManager).
+                Se informada, a criação da conexão e o ping são dispensados.
+        """
+        # Índice BM25 local com os documentos já retornados (camada opcional antes do Elasticsearch)
+        self.local_index = LocalBM25Index() if LOCAL_INDEX_ENABLED else None
+        
+        if es is not None:
+            self.es = es
+            return
+        
         try:
-            # Verificar se temos as credenciais necessárias
-            if not ES_CLOUD_ID:
-                raise ValueError("ES_CLOUD_ID não configurado no arquivo .env")
-                
-            if not ES_API_KEY:
-                raise ValueError("ES_API_KEY não configurado no arquivo .env")
-                
-            logger.info(f"Tentando conectar ao Elasticsearch usando cloud_id: {ES_CLOUD_ID[:10]}...")
+            logger.info("Tentando conectar ao Elasticsearch...")
             
-            # Inicializar cliente usando cloud_id e api_key
-            self.es = Elasticsearch(
-                cloud_id=ES_CLOUD_ID,
-                api_key=ES_API_KEY,
-                verify_certs=True,  # Geralmente True para conexões cloud
-                request_timeout=ES_TIMEOUT
-            )
+            # Inicializar cliente usando cloud_id (ou URL) e api_key
+            self.es = Elasticsearch(**connection_options())
             
             # Verificar conexão
             logger.info("Verificando conexão com o Elasticsearch...")
@@ -39,6 +294,149 @@ class ElasticsearchClient:
             logger.error(f"Erro ao conectar ao Elasticsearch: {str(e)}")
             raise
         
+    def _prepare_query(self, query_json, size):
+        """
+        Normaliza a consulta recebida (string ou dicionário) antes do envio ao Elasticsearch
+        
+        Args:
+            query_json: JSON da consulta Elasticsearch (já formatado)
+            size: número máximo de resultados a retornar (usado se o query_json não definir "size")
+            
+        Returns:
+            Dicionário da consulta
+        """
+        # Garantir que o query_json é um dicionário
+        if isinstance(query_json, str):
+            query = json.loads(query_json)
+        else:
+            query = query_json
+        
+        # Definir o tamanho máximo de resultados se não estiver definido no query
+        if "size" not in query:
+            query["size"] = size
+        
+        # Limitar os campos do _source retornados (por padrão, sem o payload de inferência do campo vetorizado)
+        if "_source" not in query and (ES_SOURCE_INCLUDES or ES_SOURCE_EXCLUDES):
+            source_filter = {}
+            if ES_SOURCE_INCLUDES:
+                source_filter["includes"] = ES_SOURCE_INCLUDES
+            if ES_SOURCE_EXCLUDES:
+                source_filter["excludes"] = ES_SOURCE_EXCLUDES
+            query["_source"] = source_filter
+        
+        # Solicitar os melhores fragmentos do campo de texto
+        if ES_HIGHLIGHT and "highlight" not in query:
+            query["highlight"] = {
+                "fields": {
+                    ES_HIGHLIGHT_FIELD: {
+                        "fragment_size": ES_HIGHLIGHT_FRAGMENT_SIZE,
+                        "number_of_fragments": ES_HIGHLIGHT_FRAGMENTS
+                    }
+                },
+                "pre_tags": [""],
+                "post_tags": [""]
+            }
+        
+        logger.info(f"Executando consulta no(s) índice(s) {', '.join(current_indices())}")
+        logger.debug(f"Query: {json.dumps(query, indent=2, ensure_ascii=False)}")
+        logger.info(f"Consulta JSON enviada ao Elasticsearch:\n{json.dumps(query, ensure_ascii=False, indent=2)}")
+        return query
+    
+    def _parse_hits(self, response):
+        """
+        Converte a resposta do Elasticsearch na lista de documentos usada pela pipeline
+        
+        Args:
+            response: Resposta da API de busca do Elasticsearch
+            
+        Returns:
+            Lista de documentos com id, score, source e, com highlight, os fragmentos (highlights)
+        """
+        hits = response["hits"]["hits"]
+        logger.info(f"Encontrados {len(hits)} resultados")
+        
+        # Registrar o tempo de execução informado pelo próprio Elasticsearch (took, em ms)
+        trace = current_trace()
+        trace.add_timing("es_took", response.get("took", 0) / 1000)
+        trace.set("hits", len(hits))
+        
+        # Extrair documentos
+        documents = []
+        for hit in hits:
+            doc = {
+                "id": hit["_id"],
+                "index": hit.get("_index"),
+                "score": hit["_score"],
+                "source": hit.get("_source", {})
+            }
+            # Fragmentos mais relevantes retornados pelo highlight, se solicitado
+            if "highlight" in hit:
+                doc["highlights"] = hit["highlight"].get(ES_HIGHLIGHT_FIELD, [])
+            documents.append(doc)
+        
+        # Alimentar o índice BM25 local com os documentos retornados (apenas dos índices padrão)
+        if self.local_index is not None and documents and current_indices() == tuple(ES_INDICES):
+            self.local_index.add(documents)
+        
+        return documents
+    
+    def _search_local(self, query_json, size):
+        """
+        Tenta responder a consulta com o índice BM25 local
+        
+        Args:
+            query_json: JSON da consulta Elasticsearch
+            size: número máximo de resultados (usado se o query_json não definir "size")
+            
+        Returns:
+            Tupla (consulta como dicionário, documentos), com documentos None se a consulta
+            precisar ir ao Elasticsearch
+        """
+        query = json.loads(query_json) if isinstance(query_json, str) else query_json
+        # O índice local só conhece os documentos dos índices padrão
+        if self.local_index is None or current_indices() != tuple(ES_INDICES):
+            return query, None
+        # O índice local não aplica filtros (term, terms e range): consultas filtradas vão ao Elasticsearch
+        if _has_filters(query):
+            return query, None
+        
+        query_text = extract_semantic_query_text(query) or extract_query_string_keywords(query)
+        if not query_text:
+            return query, None
+        
+        trace = current_trace()
+        with trace.stage("local_index"):
+            documents = self.local_index.search(query_text, int(query.get("size", size)))
+        if documents is None:
+            trace.event("local_index_miss")
+            return query, None
+        
+        trace.event("local_index_hit")
+        trace.set("hits", len(documents))
+        logger.info(f"Consulta respondida pelo índice local com {len(documents)} documentos")
+        return query, documents
+    
+    def build_semantic_query(self, query_text, size):
+        """
+        Monta a consulta híbrida RRF (query_string + semantic) a partir do texto da consulta
+        
+        Args:
+            query_text: Texto da consulta
+            size: número máximo de resultados a retornar
+            
+        Returns:
+            Dicionário da consulta RRF
+        """
+        # Extrair as palavras-chave para o query_string
+        palavras_chave = build_keyword_expression(query_text)
+        
+        # Construir a consulta RRF (Reciprocal Rank Fusion)
+        query = build_rrf_query(palavras_chave, query_text, size)
+        
+        logger.info(f"Executando busca RRF com consulta: '{query_text}'")
+        logger.info(f"Palavras-chave extraídas: '{palavras_chave}'")
+        return query
+    
     def search(self, query_json, size=ES_MAX_RESULTS):
         """
         Executa uma consulta JSON no Elasticsearch
@@ -51,43 +449,110 @@ class ElasticsearchClient:
             Lista de documentos correspondentes
         """
         try:
-            # Garantir que o query_json é um dicionário
-            if isinstance(query_json, str):
-                query = json.loads(query_json)
-            else:
-                query = query_json
+            # Responder localmente quando o índice BM25 local tiver um resultado confiável
+            query, documents = self._search_local(query_json, size)
+            if documents is not None:
+                return documents
+            
+            query = self._prepare_query(query, size)
             
-            # Definir o tamanho máximo de resultados se não estiver definido no query
-            if "size" not in query:
-                query["size"] = size
+            # Vários índices: uma consulta por índice em um único _msearch, com os resultados combinados
+            indices = current_indices()
+            if len(indices) > 1:
+                with current_trace().stage("es_request"):
+                    response = self.es.msearch(body=self._msearch_body([query], size, indices))
+                documents = self._parse_msearch(response, [query], size, indices)[0]
+                if isinstance(documents, Exception):
+                    raise documents
+                return documents
             
             # Executar a consulta
-            logger.info(f"Executando consulta no índice {ES_INDEX}")
-            logger.debug(f"Query: {json.dumps(query, indent=2, ensure_ascii=False)}")
-            logger.info(f"Consulta JSON enviada ao Elasticsearch:\n{json.dumps(query, ensure_ascii=False, indent=2)}")
-            response = self.es.search(index=ES_INDEX, body=query)
-            logger.info(f"Encontrados {len(response['hits']['hits'])} resultados")
+            with current_trace().stage("es_request"):
+                response = self.es.search(index=indices[0], body=query)
             
             # Processar resultados
-            hits = response["hits"]["hits"]
-            logger.info(f"Encontrados {len(hits)} resultados")
+            return self._parse_hits(response)
             
-            # Extrair documentos
-            documents = []
-            for hit in hits:
-                doc = {
-                    "id": hit["_id"],
-                    "score": hit["_score"],
-                    "source": hit["_source"]
-                }
-                documents.append(doc)
+        except Exception as e:
+            logger.error(f"Erro na consulta ao Elasticsearch: {str(e)}")
+            raise
+    
+    def msearch(self, queries, size=ES_MAX_RESULTS):
+        """
+        Executa várias consultas JSON em uma única requisição _msearch
+        
+        Args:
+            queries: Lista de consultas Elasticsearch (dicionários ou strings JSON)
+            size: número máximo de resultados por consulta (usado se a consulta não definir "size")
             
-            return documents
+        Returns:
+            Lista com um item por consulta, na mesma ordem: a lista de documentos encontrados
+            ou a exceção retornada pelo Elasticsearch para aquela consulta
+        """
+        if not queries:
+            return []
+        
+        try:
+            indices = current_indices()
+            queries = [self._prepare_query(query_json, size) for query_json in queries]
+            
+            logger.info(f"Executando {len(queries)} consultas via _msearch no(s) índice(s) {', '.join(indices)}")
+            response = self.es.msearch(body=self._msearch_body(queries, size, indices))
+            return self._parse_msearch(response, queries, size, indices)
             
         except Exception as e:
-            logger.error(f"Erro na consulta ao Elasticsearch: {str(e)}")
+            logger.error(f"Erro na consulta _msearch ao Elasticsearch: {str(e)}")
             raise
     
+    def _msearch_body(self, queries, size, indices):
+        """
+        Monta o corpo do _msearch: cada consulta (já preparada) é enviada a cada índice e, com
+        vários índices, o size é limitado ao orçamento de cada um (ES_INDEX_BUDGETS)
+        """
+        body = []
+        for query in queries:
+            requested = int(query.get("size", size))
+            for index in indices:
+                body.append({"index": index})
+                body.append(dict(query, size=index_size(index, requested)) if len(indices) > 1 else query)
+        return body
+    
+    def _parse_msearch(self, response, queries, size, indices):
+        """
+        Converte a resposta do _msearch em uma lista de resultados por consulta, combinando os
+        resultados dos índices de cada consulta (merge_index_results)
+        
+        Args:
+            response: Resposta da API _msearch do Elasticsearch
+            queries: Consultas enviadas (na ordem do _msearch_body)
+            size: Número máximo de resultados (usado se a consulta não definir "size")
+            indices: Índices consultados
+            
+        Returns:
+            Lista de documentos ou exceção (RuntimeError) para cada consulta
+        """
+        items = response["responses"]
+        results = []
+        for position, query in enumerate(queries):
+            per_index = []
+            errors = []
+            for index, item in zip(indices, items[position * len(indices):(position + 1) * len(indices)]):
+                if "error" in item:
+                    logger.error(f"Erro em consulta do _msearch no índice {index}: {item['error']}")
+                    errors.append(item["error"])
+                else:
+                    per_index.append(self._parse_hits(item))
+            if not per_index:
+                results.append(RuntimeError(f"Erro no Elasticsearch: {errors[0]}"))
+            elif len(indices) == 1:
+                results.append(per_index[0])
+            else:
+                # Os índices que falharem são ignorados, desde que algum tenha respondido
+                if errors:
+                    current_trace().event("index_error")
+                results.append(merge_index_results(per_index, int(query.get("size", size))))
+        return results
+    
     def semantic_search(self, query_text, size=ES_MAX_RESULTS):
         """
         Realiza uma busca híbrida (vetorial + textual) utilizando a funcionalidade nativa de semantic search do Elasticsearch
@@ -101,58 +566,7 @@ class ElasticsearchClient:
             Lista de documentos correspondentes
         """
         try:
-            # Extrair palavras-chave simples para query_string
-            import re
-            # Remove pontuação e caracteres especiais
-            palavras = re.sub(r'[^\w\s]', ' ', query_text.lower())
-            # Lista de stop words em português
-            stop_words = {'o', 'a', 'os', 'as', 'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no',
-                          'nas', 'nos', 'por', 'para', 'como', 'que', 'se', 'e', 'ou', 'é', 'são', 
-                          'um', 'uma', 'uns', 'umas', 'ao', 'aos', 'pelo', 'pela'}
-            # Criar expressão com palavras-chave relevantes
-            palavras_filtradas = [palavra for palavra in palavras.split() if palavra not in stop_words and len(palavra) > 2]
-            
-            if palavras_filtradas:
-                palavras_chave = ' OR '.join(['(' + palavra + ')' for palavra in palavras_filtradas])
-            else:
-                # Se não conseguiu extrair palavras-chave, usa algumas palavras da query original
-                palavras_chave = ' OR '.join(['(' + palavra + ')' for palavra in query_text.split()[:3] if len(palavra) > 2])
-                if not palavras_chave:
-                    palavras_chave = query_text  # Último recurso: usa a query original
-            
-            # Construir a consulta RRF (Reciprocal Rank Fusion)
-            query = {
-                "retriever": {
-                    "rrf": {
-                        "retrievers": [
-                            {
-                                "standard": {
-                                    "query": {
-                                        "query_string": {
-                                            "default_field": ES_TEXT_FIELD,
-                                            "query": palavras_chave
-                                        }
-                                    }
-                                }
-                            },
-                            {
-                                "standard": {
-                                    "query": {
-                                        "semantic": { 
-                                            "field": ES_SEMANTIC_FIELD,
-                                            "query": query_text
-                                        }
-                                    }
-                                }
-                            }
-                        ]
-                    }
-                },
-                "size": size
-            }
-            
-            logger.info(f"Executando busca RRF com consulta: '{query_text}'")
-            logger.info(f"Palavras-chave extraídas: '{palavras_chave}'")
+            query = self.build_semantic_query(query_text, size)
             
             # Executar a consulta
             return self.search(query)
@@ -168,3 +582,174 @@ class ElasticsearchClient:
         except Exception as e:
             logger.error(f"Erro ao obter informações do índice: {str(e)}")
             raise
+    
+    def index_versions(self):
+        """
+        Retorna o marcador da versão de cada índice consultável (ver index_version_from_stats). Índices
+        cuja versão não pôde ser obtida ficam de fora
+        
+        Raises:
+            Exception: Se a versão de nenhum índice pôde ser obtida (Elasticsearch indisponível)
+        """
+        versions = {}
+        error = None
+        for index in searchable_indices():
+            try:
+                versions[index] = index_version_from_stats(self.es.indices.stats(index=index, metric="docs,indexing"))
+            except Exception as e:
+                logger.warning(f"Falha ao obter a versão do índice {index}: {str(e)}")
+                error = e
+        if error is not None and not versions:
+            raise error
+        return versions
+    
+    def ping(self):
+        """Verifica a conexão com o Elasticsearch"""
+        return self.es.ping()
+    
+    def close(self):
+        """Fecha o pool de conexões do cliente"""
+        self.es.close()
+
+
+class AsyncElasticsearchClient(ElasticsearchClient):
+    def __init__(self, es=None):
+        """
+        Inicializa o cliente assíncrono do Elasticsearch.
+        A verificação de conexão (ping) deve ser feita com await verify_connection().
+        
+        Args:
+            es: Instância de AsyncElasticsearch já configurada (opcional)
+        """
+        self.local_index = LocalBM25Index() if LOCAL_INDEX_ENABLED else None
+        
+        if es is not None:
+            self.es = es
+            return
+        
+        try:
+            logger.info("Criando cliente assíncrono do Elasticsearch...")
+            self.es = AsyncElasticsearch(**connection_options())
+                
+        except Exception as e:
+            logger.error(f"Erro ao criar cliente assíncrono do Elasticsearch: {str(e)}")
+            raise
+    
+    async def verify_connection(self):
+        """Verifica a conexão com o Elasticsearch"""
+        logger.info("Verificando conexão com o Elasticsearch...")
+        if not await self.es.ping():
+            raise ConnectionError("Falha no ping: Não foi possível conectar ao Elasticsearch")
+        logger.info("Conectado ao Elasticsearch com sucesso!")
+    
+    async def search(self, query_json, size=ES_MAX_RESULTS):
+        """
+        Executa uma consulta JSON no Elasticsearch de forma assíncrona
+        
+        Args:
+            query_json: JSON da consulta Elasticsearch (já formatado)
+            size: número máximo de resultados a retornar (substitui o valor no query_json se presente)
+            
+        Returns:
+            Lista de documentos correspondentes
+        """
+        try:
+            query, documents = self._search_local(query_json, size)
+            if documents is not None:
+                return documents
+            
+            query = self._prepare_query(query, size)
+            indices = current_indices()
+            if len(indices) > 1:
+                with current_trace().stage("es_request"):
+                    response = await self.es.msearch(body=self._msearch_body([query], size, indices))
+                documents = self._parse_msearch(response, [query], size, indices)[0]
+                if isinstance(documents, Exception):
+                    raise documents
+                return documents
+            
+            with current_trace().stage("es_request"):
+                response = await self.es.search(index=indices[0], body=query)
+            return self._parse_hits(response)
+            
+        except Exception as e:
+            logger.error(f"Erro na consulta ao Elasticsearch: {str(e)}")
+            raise
+    
+    async def msearch(self, queries, size=ES_MAX_RESULTS):
+        """
+        Executa várias consultas JSON em uma única requisição _msearch de forma assíncrona
+        
+        Args:
+            queries: Lista de consultas Elasticsearch (dicionários ou strings JSON)
+            size: número máximo de resultados por consulta (usado se a consulta não definir "size")
+            
+        Returns:
+            Lista com um item por consulta: a lista de documentos ou a exceção da consulta
+        """
+        if not queries:
+            return []
+        
+        try:
+            indices = current_indices()
+            queries = [self._prepare_query(query_json, size) for query_json in queries]
+            
+            logger.info(f"Executando {len(queries)} consultas via _msearch no(s) índice(s) {', '.join(indices)}")
+            response = await self.es.msearch(body=self._msearch_body(queries, size, indices))
+            return self._parse_msearch(response, queries, size, indices)
+            
+        except Exception as e:
+            logger.error(f"Erro na consulta _msearch ao Elasticsearch: {str(e)}")
+            raise
+    
+    async def semantic_search(self, query_text, size=ES_MAX_RESULTS):
+        """
+        Realiza a busca híbrida RRF (vetorial + textual) de forma assíncrona
+        
+        Args:
+            query_text: Texto da consulta
+            size: número máximo de resultados a retornar
+            
+        Returns:
+            Lista de documentos correspondentes
+        """
+        try:
+            query = self.build_semantic_query(query_text, size)
+            return await self.search(query)
+            
+        except Exception as e:
+            logger.error(f"Erro na consulta semântica: {str(e)}")
+            raise
+    
+    async def get_index_info(self):
+        """Retorna informações sobre o índice configurado"""
+        try:
+            return await self.es.indices.get(index=ES_INDEX)
+        except Exception as e:
+            logger.error(f"Erro ao obter informações do índice: {str(e)}")
+            raise
+    
+    async def index_versions(self):
+        """Versão assíncrona de index_versions (as versões dos índices são obtidas concorrentemente)"""
+        indices = searchable_indices()
+        responses = await asyncio.gather(*(self.es.indices.stats(index=index, metric="docs,indexing") for index in indices),
+                                         return_exceptions=True)
+        versions = {}
+        error = None
+        for index, response in zip(indices, responses):
+            if isinstance(response, Exception):
+                logger.warning(f"Falha ao obter a versão do índice {index}: {str(response)}")
+                error = response
+            else:
+                versions[index] = index_version_from_stats(response)
+        if error is not None and not versions:
+            raise error
+        return versions
+    
+    async def ping(self):
+        """Verifica a conexão com o Elasticsearch"""
+        return await self.es.ping()
+    
+    async def close(self):
+        """Fecha as conexões do cliente assíncrono"""
+        await self.es.close()
@@ -0,0 +1,452 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import math
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+import groq
+from config import (GROQ_MAX_CONCURRENCY, GROQ_RPM_LIMIT, GROQ_TPM_LIMIT, GROQ_MAX_RETRIES, GROQ_RETRY_BASE_DELAY,
+                    GROQ_RETRY_MAX_DELAY, GROQ_COMPLETION_TOKENS_ESTIMATE, GROQ_FALLBACK_MODEL, GROQ_FALLBACK_QUEUE_DEPTH)
+from utils.admission import check_deadline, remaining_time
+from utils.context_builder import estimate_tokens
+from utils.metrics import current_trace
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Prioridades das chamadas (valores menores são atendidos primeiro)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+_priority = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+# Erros transitórios, que justificam uma nova tentativa
+RETRYABLE_ERRORS = (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+@contextlib.contextmanager
+def llm_priority(priority):
+    """Define a prioridade das chamadas ao Groq feitas durante o bloco (ex.: PRIORITY_BATCH no processamento em lote)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_duration(value):
+    """
+    Converte as durações dos headers do Groq em segundos
+
+    Args:
+        value: Duração no formato "2m59.56s", "7.66s", "120ms" ou em segundos ("3")
+
+    Returns:
+        Duração em segundos, ou None se o valor for inválido
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    matches = _DURATION_RE.findall(value)
+    if not matches:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in matches)
+
+
+def _header_number(headers, name):
+    try:
+        return float(headers[name]) if headers.get(name) is not None else None
+    except ValueError:
+        return None
+
+
+def estimate_request_tokens(options):
+    """Estima os tokens de uma chamada (prompt + resposta), como o Groq os contabiliza no limite por minuto"""
+    prompt_tokens = sum(estimate_tokens(message.get("content") or "") for message in options.get("messages", []))
+    return prompt_tokens + (options.get("max_tokens") or GROQ_COMPLETION_TOKENS_ESTIMATE)
+
+
+class TokenBucket:
+    """
+    Balde de tokens com reposição contínua, dimensionado por minuto. Sem capacidade conhecida
+    (0), o balde segue apenas o saldo e o instante de renovação informados pela API
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = float(per_minute) if per_minute else math.inf
+        self.blocked_until = 0.0
+        self.reset_at = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        elif self.reset_at and now >= self.reset_at:
+            # Janela informada pela API encerrada: sem saldo conhecido até o próximo header
+            self.level = math.inf
+            self.reset_at = 0.0
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        """Tempo até o balde comportar amount, em segundos (0 se já comporta)"""
+        blocked = max(0.0, self.blocked_until - now)
+        self._refill(now)
+        if not self.capacity:
+            return max(blocked, self.reset_at - now if self.level < amount else 0.0)
+        # Uma chamada maior que a capacidade só precisa esperar o balde encher
+        amount = min(amount, self.capacity)
+        missing = amount - self.level
+        return max(blocked, missing * 60 / self.capacity if missing > 0 else 0.0)
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity) if self.capacity else amount
+
+    def update(self, limit, remaining, reset, now):
+        """
+        Sincroniza o balde com os headers da API
+
+        Args:
+            limit: Capacidade por minuto informada (None mantém a atual)
+            remaining: Saldo restante na janela atual
+            reset: Segundos até a renovação do saldo
+            now: Instante atual (time.monotonic)
+        """
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self._refill(now)
+            self.level = min(remaining, self.capacity) if self.capacity else remaining
+            if reset:
+                self.reset_at = now + reset
+
+    def block(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class _ModelLimits:
+    """Limites de requisições e de tokens por minuto de um modelo (o Groq aplica os limites por modelo)"""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def wait_time(self, tokens, now):
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def consume(self, tokens, now):
+        self.requests.consume(1, now)
+        self.tokens.consume(tokens, now)
+
+
+class GroqScheduler:
+    """
+    Agendador das chamadas ao Groq: limita as chamadas simultâneas, respeita os limites de
+    requisições e de tokens por minuto (atualizados pelos headers x-ratelimit-* de cada resposta),
+    atende as chamadas interativas antes das de lote, repete as chamadas com erros transitórios
+    (429, timeout, 5xx) com backoff exponencial e jitter e, com a fila longa, pode desviar as
+    chamadas para um modelo menor e mais rápido
+    """
+
+    def __init__(self, max_concurrency=GROQ_MAX_CONCURRENCY, rpm=GROQ_RPM_LIMIT, tpm=GROQ_TPM_LIMIT,
+                 max_retries=GROQ_MAX_RETRIES, retry_base_delay=GROQ_RETRY_BASE_DELAY,
+                 retry_max_delay=GROQ_RETRY_MAX_DELAY, fallback_model=GROQ_FALLBACK_MODEL,
+                 fallback_queue_depth=GROQ_FALLBACK_QUEUE_DEPTH):
+        """
+        Args:
+            max_concurrency: Número máximo de chamadas simultâneas
+            rpm: Requisições por minuto por modelo (0 = apenas os limites informados pela API)
+            tpm: Tokens por minuto por modelo (0 = obtido do header x-ratelimit-limit-tokens)
+            max_retries: Número máximo de novas tentativas de cada chamada
+            retry_base_delay: Espera base do backoff exponencial, em segundos
+            retry_max_delay: Espera máxima entre tentativas, em segundos
+            fallback_model: Modelo usado quando a fila fica longa (vazio desativa o desvio)
+            fallback_queue_depth: Número de chamadas na fila a partir do qual o modelo alternativo é usado
+        """
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.fallback_model = fallback_model
+        self.fallback_queue_depth = fallback_queue_depth
+        self.active = 0
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.fallbacks = 0
+        self._waiting = []  # heap de [prioridade, ordem de chegada, modelo, tokens]
+        self._sequence = itertools.count()
+        self._limits = {}
+        self._lock = threading.Condition()
+
+    def _model_limits(self, model):
+        limits = self._limits.get(model)
+        if limits is None:
+            limits = self._limits[model] = _ModelLimits(self.rpm, self.tpm)
+        return limits
+
+    def _enqueue(self, model, tokens):
+        """Coloca a chamada na fila, desviando-a para o modelo alternativo se a fila estiver longa"""
+        if self.fallback_model and model != self.fallback_model and len(self._waiting) >= self.fallback_queue_depth:
+            logger.warning(f"{len(self._waiting)} chamadas na fila do Groq. Usando o modelo alternativo {self.fallback_model}")
+            current_trace().event("groq_fallback_model")
+            self.fallbacks += 1
+            model = self.fallback_model
+        entry = [_priority.get(), next(self._sequence), model, tokens]
+        heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _wait_time(self, entry, now):
+        """
+        Tempo até a chamada poder ser liberada (0 se já pode), ou None se ela deve aguardar a
+        sua vez (há chamadas à frente ou todas as vagas estão ocupadas)
+        """
+        if self._waiting[0] is not entry or self.active >= self.max_concurrency:
+            return None
+        return self._model_limits(entry[2]).wait_time(entry[3], now)
+
+    def _dequeue(self, entry):
+        """Retira da fila uma chamada que desistiu de esperar (prazo esgotado ou cancelamento)"""
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+
+    def _deadline_wait(self, wait):
+        """
+        Limita a espera da chamada ao prazo da consulta (controle de admissão), descartando a
+        chamada se o prazo já se esgotou
+
+        Returns:
+            Espera em segundos (None = até ser notificada)
+        """
+        check_deadline("groq_queue")
+        remaining = remaining_time()
+        if remaining is None:
+            return wait
+        return remaining if wait is None else min(wait, remaining)
+
+    def _grant(self, entry, now):
+        heapq.heappop(self._waiting)
+        self.active += 1
+        self.calls += 1
+        self._model_limits(entry[2]).consume(entry[3], now)
+
+    def observe(self, model, headers):
+        """
+        Atualiza os limites do modelo com os headers da resposta. O Groq informa em
+        x-ratelimit-*-requests o limite diário de requisições e em x-ratelimit-*-tokens o limite de
+        tokens por minuto; do primeiro, apenas o saldo e a renovação são usados
+        """
+        now = time.monotonic()
+        with self._lock:
+            limits = self._model_limits(model)
+            limits.requests.update(None, _header_number(headers, "x-ratelimit-remaining-requests"),
+                                   parse_duration(headers.get("x-ratelimit-reset-requests")), now)
+            limits.tokens.update(_header_number(headers, "x-ratelimit-limit-tokens"),
+                                 _header_number(headers, "x-ratelimit-remaining-tokens"),
+                                 parse_duration(headers.get("x-ratelimit-reset-tokens")), now)
+
+    def _retry_delay(self, attempt, error, model):
+        """
+        Calcula a espera antes da nova tentativa: backoff exponencial com jitter, respeitando o
+        retry-after informado pela API nos erros 429
+
+        Returns:
+            Espera em segundos, ou None se a chamada não deve ser repetida
+        """
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries:
+            return None
+
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        if isinstance(error, groq.RateLimitError):
+            headers = getattr(getattr(error, "response", None), "headers", None) or {}
+            retry_after = parse_duration(headers.get("retry-after"))
+            if retry_after:
+                delay += retry_after
+            self.observe(model, headers)
+            with self._lock:
+                self.rate_limited += 1
+                # As demais chamadas do modelo também aguardam, em vez de receberem o mesmo 429
+                self._model_limits(model).requests.block(delay, time.monotonic())
+
+        with self._lock:
+            self.retries += 1
+        current_trace().event("groq_retry")
+        logger.warning(f"Chamada ao Groq falhou ({type(error).__name__}). Nova tentativa em {delay:.2f} segundos")
+        return delay
+
+    def _acquire(self, model, tokens):
+        """
+        Aguarda a vez da chamada, respeitando a prioridade, as vagas e os limites por minuto. Uma
+        chamada cuja consulta esgota o prazo na fila é descartada (DeadlineExceeded) sem chegar ao Groq
+        """
+        start = time.monotonic()
+        with self._lock:
+            entry = self._enqueue(model, tokens)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(entry, now)
+                    if wait == 0:
+                        self._grant(entry, now)
+                        self._lock.notify_all()
+                        break
+                    self._lock.wait(self._deadline_wait(wait))
+            except BaseException:
+                self._dequeue(entry)
+                self._lock.notify_all()
+                raise
+        current_trace().add_timing("groq_queue", time.monotonic() - start)
+        return entry[2]
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+            self._lock.notify_all()
+
+    def _hold(self, stream):
+        """Repassa os chunks do streaming, mantendo a vaga ocupada até o fim da resposta"""
+        try:
+            yield from stream
+        finally:
+            self._release()
+
+    def call(self, completions, options):
+        """
+        Executa chat.completions.create através do agendador
+
+        Args:
+            completions: Recurso chat.completions do cliente Groq
+            options: Parâmetros da chamada (com stream=True, a vaga fica ocupada até o fim do streaming)
+
+        Returns:
+            Resposta da API (ou iterador dos chunks, no modo streaming)
+        """
+        tokens = estimate_request_tokens(options)
+        for attempt in itertools.count():
+            model = self._acquire(options["model"], tokens)
+            try:
+                raw = completions.with_raw_response.create(**dict(options, model=model))
+                self.observe(model, raw.headers)
+                response = raw.parse()
+            except Exception as e:
+                self._release()
+                delay = self._retry_delay(attempt, e, model)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            if options.get("stream"):
+                return self._hold(response)
+            self._release()
+            return response
+
+    def stats(self):
+        """Retorna o estado do agendador: vagas ocupadas, fila, novas tentativas, 429 recebidos e desvios de modelo"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "active": self.active,
+                "waiting": len(self._waiting),
+                "max_concurrency": self.max_concurrency,
+                "calls": self.calls,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "fallbacks": self.fallbacks,
+                "models": {
+                    model: {
+                        "tokens_per_minute": limits.tokens.capacity,
+                        "tokens_available": round(limits.tokens.level) if math.isfinite(limits.tokens.level) else None,
+                        "requests_available": round(limits.requests.level) if math.isfinite(limits.requests.level) else None,
+                        "blocked_for": round(max(limits.requests.blocked_until, limits.tokens.blocked_until) - now, 3)
+                                       if max(limits.requests.blocked_until, limits.tokens.blocked_until) > now else 0.0
+                    }
+                    for model, limits in self._limits.items()
+                }
+            }
+
+
+class AsyncGroqScheduler(GroqScheduler):
+    """Versão assíncrona de GroqScheduler, para o groq.AsyncClient (toda a coordenação ocorre no event loop)"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # No event loop não há concorrência entre threads: basta acordar as chamadas em espera
+        self._lock = contextlib.nullcontext()
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _acquire(self, model, tokens):
+        start = time.monotonic()
+        entry = self._enqueue(model, tokens)
+        try:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(entry, now)
+                if wait == 0:
+                    self._grant(entry, now)
+                    self._notify()
+                    break
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self._deadline_wait(wait))
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            # Chamada cancelada (ou com o prazo esgotado) enquanto aguardava: sair da fila
+            self._dequeue(entry)
+            self._notify()
+            raise
+        current_trace().add_timing("groq_queue", time.monotonic() - start)
+        return entry[2]
+
+    def _release(self):
+        self.active -= 1
+        self._notify()
+
+    async def _hold(self, stream):
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self._release()
+
+    async def call(self, completions, options):
+        """Versão assíncrona de GroqScheduler.call"""
+        tokens = estimate_request_tokens(options)
+        for attempt in itertools.count():
+            model = await self._acquire(options["model"], tokens)
+            try:
+                raw = await completions.with_raw_response.create(**dict(options, model=model))
+                self.observe(model, raw.headers)
+                response = await raw.parse()
+            except Exception as e:
+                self._release()
+                delay = self._retry_delay(attempt, e, model)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            if options.get("stream"):
+                return self._hold(response)
+            self._release()
+            return response
@@ -0,0 +1,325 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import Elasticsearch, helpers
+from config import (ES_INDEX, ES_TEXT_FIELD, ES_SEMANTIC_FIELD, INGEST_INFERENCE_ID, INGEST_CHUNK_TOKENS,
+                    INGEST_CHUNK_OVERLAP, INGEST_BULK_SIZE, INGEST_BULK_MAX_BYTES, INGEST_THREADS,
+                    INGEST_MAX_RETRIES, INGEST_REQUEST_TIMEOUT)
+from utils.context_builder import estimate_tokens, split_passages
+from utils.es_client import connection_options
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INPUT_FORMATS = ("jsonl", "csv", "txt")
+
+# Campos de controle gravados em cada trecho indexado
+SOURCE_ID_FIELD = "source_id"
+CHUNK_FIELD = "chunk"
+
+# Intervalo, em trechos indexados, entre as mensagens de progresso
+PROGRESS_INTERVAL = 10000
+
+def detect_format(path):
+    """Detecta o formato do arquivo pela extensão (.jsonl/.json, .csv ou .txt)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".json", ".ndjson"):
+        return "jsonl"
+    if extension in (".csv", ".txt"):
+        return extension[1:]
+    raise ValueError(f"Formato não reconhecido para {path}. Use --format ({', '.join(INPUT_FORMATS)})")
+
+def _iter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+def read_documents(paths, input_format=None, text_field=ES_TEXT_FIELD):
+    """
+    Lê os documentos dos arquivos um a um, sem carregar os arquivos inteiros em memória.
+    Em JSONL, cada linha é um objeto (ou uma string com o texto); em CSV, cada linha é um
+    documento com as colunas como campos; em texto, cada arquivo é um documento.
+    
+    Args:
+        paths: Arquivos ou diretórios a ler
+        input_format: jsonl, csv ou txt (None detecta pela extensão de cada arquivo)
+        text_field: Campo com o texto do documento (usado para strings JSON e arquivos de texto)
+    
+    Yields:
+        Dicionários com os campos de cada documento
+    """
+    # Notícias longas excedem o limite padrão de 128 KB por campo do módulo csv
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    
+    for path in _iter_files(paths):
+        file_format = input_format or detect_format(path)
+        logger.info(f"Lendo {path} ({file_format})")
+        with open(path, encoding="utf-8", newline="" if file_format == "csv" else None) as input_file:
+            if file_format == "jsonl":
+                for line in input_file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    yield {text_field: item} if isinstance(item, str) else item
+            elif file_format == "csv":
+                yield from csv.DictReader(input_file)
+            else:
+                name = os.path.splitext(os.path.basename(path))[0]
+                yield {"id": path, "title": name, text_field: input_file.read()}
+
+def _split_long_passage(passage, max_tokens):
+    """Divide uma passagem maior que max_tokens em pedaços de palavras consecutivas"""
+    pieces = []
+    words = []
+    used = 0
+    for word in passage.split():
+        cost = estimate_tokens(word)
+        if words and used + cost > max_tokens:
+            pieces.append(" ".join(words))
+            words, used = [], 0
+        words.append(word)
+        used += cost
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+def chunk_text(text, max_tokens=INGEST_CHUNK_TOKENS, overlap_tokens=INGEST_CHUNK_OVERLAP):
+    """
+    Divide um texto longo em trechos de até max_tokens, respeitando o limite das frases e
+    repetindo no início de cada trecho as últimas frases do anterior (até overlap_tokens)
+    
+    Args:
+        text: Texto do documento
+        max_tokens: Tamanho máximo de cada trecho, em tokens estimados
+        overlap_tokens: Tokens repetidos entre trechos consecutivos
+    
+    Returns:
+        Lista de trechos (o próprio texto, se couber em um trecho)
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text] if text.strip() else []
+    
+    passages = []
+    for passage in split_passages(text):
+        passages.extend(_split_long_passage(passage, max_tokens) if estimate_tokens(passage) > max_tokens else [passage])
+    
+    chunks = []
+    current = []
+    used = 0
+    for passage in passages:
+        cost = estimate_tokens(passage)
+        if current and used + cost > max_tokens:
+            chunks.append(" ".join(current))
+            # Sobreposição: as últimas passagens do trecho anterior que couberem em overlap_tokens
+            overlap = []
+            overlap_used = 0
+            for previous in reversed(current):
+                previous_cost = estimate_tokens(previous)
+                if overlap_used + previous_cost > overlap_tokens or overlap_used + previous_cost + cost > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_used += previous_cost
+            current, used = overlap, overlap_used
+        current.append(passage)
+        used += cost
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def content_hash(source):
+    """Hash SHA-256 do conteúdo de um trecho, usado como _id (trechos inalterados mantêm o mesmo _id)"""
+    return hashlib.sha256(json.dumps(source, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def build_actions(documents, index=ES_INDEX, text_field=ES_TEXT_FIELD, id_field="id",
+                  max_tokens=INGEST_CHUNK_TOKENS, overlap_tokens=INGEST_CHUNK_OVERLAP, stats=None):
+    """
+    Converte os documentos em ações _bulk, um trecho por ação. Cada trecho leva os demais
+    campos do documento, o texto no campo de texto e no campo semantic_text e o id de origem
+    (o hash do conteúdo do documento quando ele não tem id, estável entre execuções e arquivos).
+    
+    Args:
+        documents: Iterável de documentos (dicionários)
+        index: Índice de destino
+        text_field: Campo com o texto a ser dividido e vetorizado
+        id_field: Campo com o identificador do documento na origem (opcional)
+        max_tokens: Tamanho máximo de cada trecho
+        overlap_tokens: Sobreposição entre trechos consecutivos
+        stats: Dicionário de contadores atualizado com os documentos e trechos gerados (opcional)
+    
+    Yields:
+        Ações no formato de elasticsearch.helpers (op_type create, _id = hash do conteúdo)
+    """
+    for document in documents:
+        text = str(document.get(text_field) or "")
+        metadata = {key: value for key, value in document.items()
+                    if key not in (text_field, ES_SEMANTIC_FIELD) and value not in (None, "")}
+        if document.get(id_field) not in (None, ""):
+            source_id = str(document[id_field])
+        else:
+            source_id = content_hash(dict(metadata, **{text_field: text}))
+        chunks = chunk_text(text, max_tokens, overlap_tokens)
+        if stats is not None:
+            stats["documents"] += 1
+            stats["chunks"] += len(chunks)
+        for chunk_number, chunk in enumerate(chunks):
+            source = dict(metadata, **{text_field: chunk, ES_SEMANTIC_FIELD: chunk,
+                                       SOURCE_ID_FIELD: source_id, CHUNK_FIELD: chunk_number})
+            yield {"_op_type": "create", "_index": index, "_id": content_hash(source), "_source": source}
+
+class _SharedIterator:
+    """Iterador compartilhado entre as threads de envio (cada próximo item é entregue a uma única thread)"""
+    
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._lock = threading.Lock()
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        with self._lock:
+            return next(self._iterator)
+
+class DocumentIngestor:
+    """
+    Ingestão de documentos no índice semantic_text: cria o índice com o mapeamento adequado e
+    indexa os trechos com várias requisições _bulk simultâneas (streaming_bulk por thread), com
+    novas tentativas dos documentos recusados com 429. É idempotente: o _id de cada trecho é o
+    hash do seu conteúdo, e os trechos já indexados são ignorados antes do envio (sem repetir a
+    inferência do semantic_text)
+    """
+    
+    def __init__(self, es=None, index=ES_INDEX, text_field=ES_TEXT_FIELD, inference_id=INGEST_INFERENCE_ID,
+                 bulk_size=INGEST_BULK_SIZE, max_bytes=INGEST_BULK_MAX_BYTES, threads=INGEST_THREADS,
+                 max_retries=INGEST_MAX_RETRIES, request_timeout=INGEST_REQUEST_TIMEOUT):
+        """
+        Args:
+            es: Cliente Elasticsearch (opcional; por padrão cria um com as configurações do .env)
+            index: Índice de destino
+            text_field: Campo de texto dos documentos
+            inference_id: Endpoint de inferência do campo semantic_text
+            bulk_size: Documentos por requisição _bulk
+            max_bytes: Tamanho máximo de cada requisição _bulk
+            threads: Requisições _bulk simultâneas
+            max_retries: Novas tentativas dos documentos recusados com 429
+            request_timeout: Timeout de cada requisição, em segundos
+        """
+        es = es if es is not None else Elasticsearch(**connection_options())
+        self.es = es.options(request_timeout=request_timeout)
+        self.index = index
+        self.text_field = text_field
+        self.inference_id = inference_id
+        self.bulk_size = bulk_size
+        self.max_bytes = max_bytes
+        self.threads = max(1, threads)
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+    
+    def index_mapping(self):
+        """Mapeamento do índice: texto para a busca textual, semantic_text para a busca semântica"""
+        return {
+            "properties": {
+                self.text_field: {"type": "text"},
+                ES_SEMANTIC_FIELD: {"type": "semantic_text", "inference_id": self.inference_id},
+                SOURCE_ID_FIELD: {"type": "keyword"},
+                CHUNK_FIELD: {"type": "integer"}
+            }
+        }
+    
+    def create_index(self):
+        """Cria o índice com o mapeamento semantic_text, se ele ainda não existir"""
+        if self.es.indices.exists(index=self.index):
+            logger.info(f"Índice {self.index} já existe")
+            return False
+        self.es.indices.create(index=self.index, mappings=self.index_mapping())
+        logger.info(f"Índice {self.index} criado com o campo {ES_SEMANTIC_FIELD} (inference_id={self.inference_id})")
+        return True
+    
+    def _existing_ids(self, ids):
+        """Retorna os _ids que já existem no índice (uma requisição _mget, sem o _source)"""
+        response = self.es.mget(index=self.index, ids=ids, source=False)
+        return {doc["_id"] for doc in response["docs"] if doc.get("found")}
+    
+    def _new_actions(self, actions, stats):
+        """Descarta, em blocos de bulk_size, as ações cujos trechos já estão indexados"""
+        batch = []
+        for action in actions:
+            batch.append(action)
+            if len(batch) >= self.bulk_size:
+                yield from self._filter_batch(batch, stats)
+                batch = []
+        if batch:
+            yield from self._filter_batch(batch, stats)
+    
+    def _filter_batch(self, batch, stats):
+        try:
+            existing = self._existing_ids([action["_id"] for action in batch])
+        except Exception as e:
+            # Sem a verificação prévia, os trechos existentes são recusados pelo op_type create (409)
+            logger.warning(f"Falha ao verificar os trechos já indexados: {str(e)}")
+            existing = set()
+        with self._lock:
+            stats["skipped"] += len(existing)
+        return [action for action in batch if action["_id"] not in existing]
+    
+    def _send(self, actions, stats):
+        """Envia as ações com streaming_bulk, contabilizando os resultados"""
+        for ok, item in helpers.streaming_bulk(self.es, actions, chunk_size=self.bulk_size,
+                                               max_chunk_bytes=self.max_bytes, raise_on_error=False,
+                                               raise_on_exception=False, max_retries=self.max_retries,
+                                               initial_backoff=1, max_backoff=60):
+            result = next(iter(item.values()))
+            with self._lock:
+                if ok:
+                    stats["indexed"] += 1
+                    if stats["indexed"] % PROGRESS_INTERVAL == 0:
+                        logger.info(f"{stats['indexed']} trechos indexados ({stats['documents']} documentos lidos)")
+                elif result.get("status") == 409:
+                    # Trecho indexado entre a verificação e o envio (ou sem a verificação prévia)
+                    stats["skipped"] += 1
+                else:
+                    stats["failed"] += 1
+                    if stats["failed"] <= 10:
+                        logger.error(f"Falha ao indexar o trecho {result.get('_id')}: {result.get('error')}")
+    
+    def ingest(self, documents, id_field="id", max_tokens=INGEST_CHUNK_TOKENS, overlap_tokens=INGEST_CHUNK_OVERLAP):
+        """
+        Divide os documentos em trechos e os indexa
+        
+        Args:
+            documents: Iterável de documentos (lido sob demanda, sem carregá-lo inteiro em memória)
+            id_field: Campo com o identificador do documento na origem
+            max_tokens: Tamanho máximo de cada trecho
+            overlap_tokens: Sobreposição entre trechos consecutivos
+        
+        Returns:
+            Dicionário com os contadores: documents, chunks, indexed, skipped e failed
+        """
+        stats = {"documents": 0, "chunks": 0, "indexed": 0, "skipped": 0, "failed": 0}
+        start_time = time.time()
+        actions = build_actions(documents, self.index, self.text_field, id_field, max_tokens, overlap_tokens, stats)
+        # A leitura, a divisão e a verificação prévia ocorrem sob demanda, à medida que as threads pedem novas ações
+        shared_actions = _SharedIterator(self._new_actions(actions, stats))
+        
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="rag-ingest") as executor:
+            futures = [executor.submit(self._send, shared_actions, stats) for _ in range(self.threads)]
+            for future in futures:
+                future.result()
+        
+        elapsed = time.time() - start_time
+        logger.info(f"Ingestão concluída em {elapsed:.2f} segundos: {stats['documents']} documentos, "
+                    f"{stats['chunks']} trechos, {stats['indexed']} indexados, {stats['skipped']} já existentes, "
+                    f"{stats['failed']} com erro")
+        return stats
@@ -0,0 +1,136 @@
+import re
+import unicodedata
+from functools import lru_cache
+from config import KEYWORDS_MAX_TERMS
+
+# Expressões compiladas uma única vez (e não a cada consulta)
+_WORD_RE = re.compile(r'\w+')
+_RESERVED_RE = re.compile(r'([+\-=&|!(){}\[\]^"~*?:\\/])')
+
+# Stop words em português (sem acentos, pois são comparadas com as palavras já normalizadas)
+STOP_WORDS = frozenset("""
+a o as os um uma uns umas de da do das dos em na no nas nos ao aos a as pelo pela pelos pelas por para
+com sem sob sobre entre ate desde contra perante apos como que qual quais quem onde quando quanto quanta
+quantos quantas porque se e ou mas nem tambem ja ainda so muito muita muitos muitas mais menos
+eu tu ele ela nos vos eles elas me te lhe lhes meu minha meus minhas seu sua seus suas nosso nossa
+este esta estes estas esse essa esses essas aquele aquela aqueles aquelas isto isso aquilo
+e sao foi foram ser era eram sera estar esta estao estava tem ter tinha ha houve havia
+sim nao pode podem poderia deve devem me fale diga mostre quero queria gostaria
+""".split())
+
+# Operadores da sintaxe query_string, que não podem aparecer como palavras-chave
+_OPERATORS = frozenset({"and", "or", "not"})
+
+# Sufixos removidos pelo stemming leve (plurais e variações mais comuns), do mais longo para o mais curto
+_SUFFIXES = (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"), ("res", "r"),
+             ("ns", "m"), ("s", ""))
+
+# Tabela de remoção de acentos para os caracteres latinos mais comuns
+_FOLD_TABLE = {
+    ord(char): unicodedata.normalize("NFKD", char)[0]
+    for char in map(chr, range(0xC0, 0x250))
+    if unicodedata.normalize("NFKD", char)[0].isascii()
+}
+
+
+def fold_accents(text):
+    """Remove os acentos do texto (ex.: "eleição" -> "eleicao")"""
+    return text.translate(_FOLD_TABLE)
+
+
+def light_stem(word):
+    """
+    Stemming leve para o português: reduz plurais às formas singulares mais prováveis
+    (ex.: "eleicoes" -> "eleicao", "jornais" -> "jornal", "noticias" -> "noticia")
+
+    Args:
+        word: Palavra em minúsculas e sem acentos
+
+    Returns:
+        Radical da palavra
+    """
+    if len(word) <= 4:
+        return word
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix):
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def escape_query_string(text):
+    """Escapa os caracteres reservados da sintaxe query_string do Elasticsearch"""
+    text = _RESERVED_RE.sub(r'\\\1', text)
+    # "<" e ">" não podem ser escapados e são removidos
+    return text.replace("<", " ").replace(">", " ")
+
+
+def normalize_terms(text):
+    """
+    Converte o texto nos termos normalizados usados para comparação: minúsculas, sem acentos,
+    sem stop words e palavras de até 2 caracteres, com stemming leve
+
+    Args:
+        text: Texto a ser normalizado
+
+    Returns:
+        Lista de termos normalizados (com repetições, na ordem do texto)
+    """
+    # O vocabulário se repete muito entre textos: cada palavra distinta é normalizada uma única vez
+    return [term for term in map(_normalize_word, _WORD_RE.findall(text.lower())) if term]
+
+
+@lru_cache(maxsize=100000)
+def _normalize_word(word):
+    """Termo normalizado de uma palavra em minúsculas, ou None para stop words e palavras curtas"""
+    word = fold_accents(word)
+    if len(word) <= 2 or word in STOP_WORDS:
+        return None
+    return light_stem(word)
+
+
+def extract_keywords(text, max_terms=KEYWORDS_MAX_TERMS):
+    """
+    Extrai as palavras-chave relevantes do texto, sem stop words e sem repetições (palavras com
+    o mesmo radical, como "eleição" e "eleições", contam uma vez), limitadas a max_terms
+
+    Args:
+        text: Pergunta do usuário
+        max_terms: Número máximo de palavras-chave
+
+    Returns:
+        Lista de palavras-chave na forma original (minúsculas), na ordem em que aparecem
+    """
+    keywords = []
+    seen = set()
+    for word in _WORD_RE.findall(text.lower()):
+        folded = fold_accents(word)
+        if len(folded) <= 2 or folded in STOP_WORDS or folded in _OPERATORS:
+            continue
+        stem = light_stem(folded)
+        if stem in seen:
+            continue
+        seen.add(stem)
+        keywords.append(word)
+        if len(keywords) >= max_terms:
+            break
+    return keywords
+
+
+def build_keyword_expression(text, max_terms=KEYWORDS_MAX_TERMS):
+    """
+    Monta a expressão booleana do retriever query_string a partir da pergunta do usuário
+
+    Args:
+        text: Pergunta do usuário
+        max_terms: Número máximo de palavras-chave
+
+    Returns:
+        Expressão no formato "(termo1) OR (termo2)", ou a pergunta como frase entre aspas
+        se nenhuma palavra-chave for encontrada
+    """
+    keywords = extract_keywords(text, max_terms)
+    if keywords:
+        return " OR ".join(f"({escape_query_string(keyword)})" for keyword in keywords)
+    # Dentro de uma frase, apenas aspas e barras invertidas precisam ser escapadas
+    phrase = " ".join(text.split()).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{phrase}"' if phrase else "*"
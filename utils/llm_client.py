@@ -1,37 +1,93 @@
 import groq
 import json
 import logging
-from config import GROQ_API_KEY, LLM_MODEL, LLM_TEMPERATURE, ELASTICSEARCH_QUERY_TEMPLATE, RESPONSE_GENERATION_TEMPLATE, ES_TEXT_FIELD, ES_SEMANTIC_FIELD, ES_MAX_RESULTS
+import re
+from config import (GROQ_API_KEY, GROQ_BASE_URL, LLM_MODEL, LLM_TEMPERATURE, ELASTICSEARCH_QUERY_TEMPLATE, RESPONSE_GENERATION_TEMPLATE,
+                    ES_TEXT_FIELD, ES_SEMANTIC_FIELD, ES_MAX_RESULTS, QUERY_CACHE_ENABLED, KEYWORDS_MAX_TERMS,
+                    QUERY_PLANNING_MODE, QUERY_PLANNING_TEMPLATE, QUERY_PLANNING_MAX_TOKENS, QUERY_PLANNING_TEMPERATURE,
+                    QUERY_PLANNING_RETRIES, QUERY_PLANNING_FILTER_FIELDS, CHAT_HISTORY_TEMPLATE, CHAT_SUMMARY_TEMPLATE,
+                    CHAT_SUMMARY_MAX_TOKENS, GROQ_SCHEDULER_ENABLED)
+from utils.groq_scheduler import GroqScheduler, AsyncGroqScheduler
+from utils.admission import check_deadline
+from utils.query_cache import QueryPlanCache
+from utils.context_builder import build_context
+from utils.keywords import build_keyword_expression, escape_query_string
+from utils.es_client import build_rrf_query
+from utils.metrics import current_trace, record_usage
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_JSON_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+
+# Valores aceitos nos filtros do plano (term, terms e limites de range) e operadores de intervalo
+_FILTER_VALUE_TYPES = (str, int, float, bool)
+_RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+NO_DOCUMENTS_MESSAGE = "Não encontrei informações relevantes para responder sua pergunta. Por favor, reformule ou tente outra questão."
+
+def groq_options():
+    """
+    Monta os parâmetros do cliente Groq. GROQ_BASE_URL permite apontar para um endpoint
+    compatível (por exemplo, o servidor falso usado nos benchmarks)
+    """
+    options = {"api_key": GROQ_API_KEY}
+    if GROQ_BASE_URL:
+        options["base_url"] = GROQ_BASE_URL
+    if GROQ_SCHEDULER_ENABLED:
+        # As novas tentativas ficam a cargo do agendador, que conhece os limites de taxa e a fila
+        options["max_retries"] = 0
+    return options
+
 class LLMClient:
-    def __init__(self):
+    def __init__(self, client=None):
         """
         Inicializa o cliente LLM com Groq API
+        
+        Args:
+            client: Instância de groq.Client já configurada (compartilhada pelo ClientManager, opcional)
         """
         if not GROQ_API_KEY:
             raise ValueError("GROQ_API_KEY não encontrada. Configure a variável de ambiente ou o arquivo .env")
         
         logger.info(f"Inicializando cliente Groq com modelo: {LLM_MODEL}")
-        self.client = groq.Client(api_key=GROQ_API_KEY)
+        self.client = client if client is not None else groq.Client(**groq_options())
         self.model = LLM_MODEL
         self.temperature = LLM_TEMPERATURE
+        self.query_cache = QueryPlanCache() if QUERY_CACHE_ENABLED else None
+        self.scheduler = GroqScheduler() if GROQ_SCHEDULER_ENABLED else None
     
-    def prepare_elasticsearch_query(self, user_query, max_results=ES_MAX_RESULTS):
+    def _create(self, **options):
         """
-        Prepara uma consulta Elasticsearch híbrida a partir da pergunta do usuário
+        Chama a API de chat do Groq através do agendador (limites de taxa, concorrência,
+        prioridade e novas tentativas), ou diretamente se o agendador estiver desativado.
+        Consultas com o prazo esgotado (controle de admissão) não chegam ao Groq.
+        """
+        check_deadline("groq")
+        if self.scheduler is None:
+            return self.client.chat.completions.create(**options)
+        return self.scheduler.call(self.client.chat.completions, options)
+    
+    def _record_model(self, response):
+        """
+        Registra no trace o modelo que gerou a resposta, que pode ser o modelo alternativo do
+        agendador (GROQ_FALLBACK_MODEL) quando a fila do Groq está longa
+        """
+        current_trace().set("generation_model", getattr(response, "model", None) or self.model)
+    
+    def _build_query_messages(self, user_query, max_results):
+        """
+        Monta as mensagens enviadas à LLM para a preparação da consulta Elasticsearch
         
         Args:
             user_query: Pergunta do usuário
             max_results: Número máximo de resultados a retornar
             
         Returns:
-            Consulta JSON para o Elasticsearch
+            Lista de mensagens no formato da API de chat
         """
-        try:
+        if QUERY_PLANNING_MODE == "template":
             # Formatar o prompt com a pergunta do usuário e campos do Elasticsearch
             prompt = ELASTICSEARCH_QUERY_TEMPLATE.format(
                 query=user_query,
@@ -39,163 +95,601 @@ class LLMClient:
                 semantic_field=ES_SEMANTIC_FIELD,
                 text_field=ES_TEXT_FIELD
             )
+            system = "Você é um assistente especializado em gerar consultas Elasticsearch e extrair palavras-chave relevantes."
+        else:
+            if QUERY_PLANNING_FILTER_FIELDS:
+                filters_hint = ("filtros citados explicitamente na pergunta, apenas nos campos "
+                                f"{', '.join(QUERY_PLANNING_FILTER_FIELDS)} (valor, lista de valores ou "
+                                '{"gte": ..., "lte": ...}); {} se não houver')
+            else:
+                filters_hint = "sempre {}"
+            # Prompt curto: a LLM retorna apenas o plano, e a consulta RRF é montada localmente
+            prompt = QUERY_PLANNING_TEMPLATE.format(
+                query=user_query,
+                max_results=max_results,
+                max_keywords=KEYWORDS_MAX_TERMS,
+                filters_hint=filters_hint
+            )
+            system = "Você planeja consultas Elasticsearch. Responda somente com JSON."
+        logger.debug(f"Prompt para gerar consulta: {prompt}")
+        
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _planning_options(self, user_query, max_results):
+        """
+        Monta os parâmetros da chamada de planejamento à API do Groq. Em JSON mode, a resposta
+        é limitada a QUERY_PLANNING_MAX_TOKENS e a API garante um objeto JSON válido.
+        """
+        options = {
+            "model": self.model,
+            "messages": self._build_query_messages(user_query, max_results)
+        }
+        if QUERY_PLANNING_MODE == "template":
+            options["temperature"] = self.temperature
+        else:
+            options["temperature"] = QUERY_PLANNING_TEMPERATURE
+            options["max_tokens"] = QUERY_PLANNING_MAX_TOKENS
+            options["response_format"] = {"type": "json_object"}
+        return options
+    
+    def _load_json(self, generated_text):
+        """Carrega o JSON da resposta da LLM (pode estar entre ```json e ``` ou ser o texto completo)"""
+        json_match = _JSON_BLOCK_RE.search(generated_text)
+        return json.loads(json_match.group(1) if json_match else generated_text)
+    
+    def _build_filters(self, filters):
+        """
+        Converte os filtros do plano em cláusulas do Elasticsearch, descartando campos não permitidos
+        
+        Args:
+            filters: Dicionário {campo: valor, lista de valores ou intervalo}
             
-            # Chamar a API do Groq
-            logger.info("Preparando consulta Elasticsearch com LLM")
-            logger.debug(f"Prompt para gerar consulta: {prompt}")
+        Returns:
+            Lista de cláusulas term, terms ou range
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Você é um assistente especializado em gerar consultas Elasticsearch e extrair palavras-chave relevantes."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature
-            )
+        Raises:
+            ValueError se algum valor não for um texto, número ou booleano (ou lista deles), ou um intervalo sem operadores
+        """
+        if not isinstance(filters, dict):
+            raise ValueError("Filtros do plano devem ser um objeto")
+        
+        clauses = []
+        for field, value in filters.items():
+            if field not in QUERY_PLANNING_FILTER_FIELDS:
+                logger.warning(f"Filtro no campo não permitido ignorado: {field}")
+                continue
+            if isinstance(value, dict):
+                bounds = {op: bound for op, bound in value.items() if op in _RANGE_OPERATORS}
+                if not bounds or not all(isinstance(bound, _FILTER_VALUE_TYPES) for bound in bounds.values()):
+                    raise ValueError(f"Intervalo inválido no filtro {field}: use gt, gte, lt ou lte com valores simples")
+                clauses.append({"range": {field: bounds}})
+            elif isinstance(value, list):
+                if not all(isinstance(item, _FILTER_VALUE_TYPES) for item in value):
+                    raise ValueError(f"Valores inválidos no filtro {field}: use textos, números ou booleanos")
+                if value:
+                    clauses.append({"terms": {field: value}})
+            elif value not in (None, ""):
+                if not isinstance(value, _FILTER_VALUE_TYPES):
+                    raise ValueError(f"Valor inválido no filtro {field}: use um texto, número ou booleano")
+                clauses.append({"term": {field: value}})
+        return clauses
+    
+    def _build_query_from_plan(self, plan, user_query, max_results):
+        """
+        Monta a consulta RRF a partir do plano {keywords, filters, size} retornado pela LLM
+        
+        Args:
+            plan: Dicionário do plano
+            user_query: Pergunta do usuário (usada na parte semântica)
+            max_results: Número máximo de resultados a retornar
+            
+        Returns:
+            Consulta JSON para o Elasticsearch
+            
+        Raises:
+            ValueError se o plano não seguir o formato esperado
+        """
+        if not isinstance(plan, dict):
+            raise ValueError("O plano deve ser um objeto JSON")
+        
+        keywords = plan.get("keywords") or []
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        if not isinstance(keywords, list) or not all(isinstance(keyword, str) for keyword in keywords):
+            raise ValueError("keywords deve ser uma lista de textos")
+        
+        # Remover repetições e limitar o número de termos; sem termos, usar a extração heurística
+        terms = []
+        for keyword in keywords:
+            keyword = " ".join(keyword.split())
+            if keyword and keyword.lower() not in (term.lower() for term in terms):
+                terms.append(keyword)
+        terms = terms[:KEYWORDS_MAX_TERMS]
+        if terms:
+            keyword_expression = " OR ".join(f"({escape_query_string(term)})" for term in terms)
+        else:
+            keyword_expression = build_keyword_expression(user_query)
+        
+        try:
+            size = int(plan.get("size") or max_results)
+        except (TypeError, ValueError):
+            raise ValueError("size deve ser um número inteiro")
+        size = max(1, min(size, max_results))
+        
+        query_json = build_rrf_query(keyword_expression, user_query, size, self._build_filters(plan.get("filters") or {}))
+        logger.info(f"Plano de consulta: palavras-chave '{keyword_expression}', size {size}")
+        return query_json
+    
+    def _extract_query_json(self, generated_text, user_query, max_results):
+        """
+        Extrai e valida a consulta gerada pela LLM: em JSON mode, monta a consulta RRF a partir
+        do plano; no modo template, valida a consulta RRF completa gerada
+        
+        Args:
+            generated_text: Texto retornado pela LLM
+            user_query: Pergunta do usuário
+            max_results: Número máximo de resultados a retornar
+            
+        Returns:
+            Consulta JSON para o Elasticsearch
+            
+        Raises:
+            json.JSONDecodeError ou ValueError se a resposta não contiver uma consulta válida
+        """
+        logger.debug(f"Resposta da LLM: {generated_text}")
+        if not generated_text:
+            raise ValueError("Resposta vazia")
+        
+        query_json = self._load_json(generated_text)
+        if QUERY_PLANNING_MODE != "template":
+            return self._build_query_from_plan(query_json, user_query, max_results)
+        
+        # Verificar se a consulta foi gerada corretamente
+        if 'retriever' in query_json and 'rrf' in query_json['retriever']:
+            # Estrutura correta baseada no novo template
+            logger.info("Consulta Elasticsearch RRF preparada com sucesso")
+            return query_json
+        
+        logger.warning("A consulta gerada não segue o formato RRF esperado.")
+        raise ValueError("Formato de consulta inválido")
+    
+    def _build_fallback_query(self, user_query, max_results):
+        """
+        Monta uma consulta RRF padrão a partir de palavras-chave simples da consulta original
+        
+        Args:
+            user_query: Pergunta do usuário
+            max_results: Número máximo de resultados a retornar
+            
+        Returns:
+            Consulta JSON para o Elasticsearch
+        """
+        # Extrair as palavras-chave da consulta original
+        palavras_chave = build_keyword_expression(user_query)
+        fallback_query = build_rrf_query(palavras_chave, user_query, max_results)
+        
+        logger.info("Usando consulta fallback devido a erro na extração de JSON")
+        return fallback_query
+    
+    def _parse_generated_query(self, generated_text, user_query, max_results):
+        """
+        Extrai a consulta gerada pela LLM. Consultas válidas são armazenadas no cache de consultas.
+        
+        Args:
+            generated_text: Texto retornado pela LLM (None se a API rejeitou a resposta)
+            user_query: Pergunta do usuário
+            max_results: Número máximo de resultados a retornar
             
-            # Extrair a consulta gerada do texto da resposta
-            generated_text = response.choices[0].message.content
-            logger.debug(f"Resposta da LLM: {generated_text}")
+        Returns:
+            Consulta JSON para o Elasticsearch, ou None se a resposta for inválida
+        """
+        try:
+            query_json = self._extract_query_json(generated_text, user_query, max_results)
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.error(f"Erro ao extrair ou validar JSON da resposta da LLM: {str(e)}")
+            logger.error(f"Resposta recebida: {generated_text}")
+            current_trace().event("planning_invalid")
+            return None
+        
+        if self.query_cache is not None:
+            self.query_cache.set(user_query, max_results, query_json)
+        return query_json
+    
+    def _planning_failed(self, user_query, max_results, use_fallback):
+        """Resultado do planejamento quando todas as tentativas retornaram respostas inválidas"""
+        if not use_fallback:
+            return None
+        # Usar uma consulta RRF padrão como fallback
+        return self._build_fallback_query(user_query, max_results)
+    
+    def _get_cached_query(self, user_query, max_results):
+        """Retorna a consulta armazenada no cache de consultas, ou None"""
+        if self.query_cache is None:
+            return None
+        query_json = self.query_cache.get(user_query, max_results)
+        if query_json is not None:
+            current_trace().event("query_cache_hit")
+            logger.info("Consulta Elasticsearch encontrada no cache; chamada à LLM dispensada")
+        return query_json
+    
+    def prepare_elasticsearch_query(self, user_query, max_results=ES_MAX_RESULTS, use_fallback=True):
+        """
+        Prepara uma consulta Elasticsearch híbrida a partir da pergunta do usuário
+        
+        Args:
+            user_query: Pergunta do usuário
+            max_results: Número máximo de resultados a retornar
+            use_fallback: Se False, retorna None em vez da consulta fallback quando a resposta da LLM for inválida
             
-            # Extrair o JSON da resposta (pode estar entre ```json e ``` ou ser o texto completo)
-            try:
-                # Tentar extrair o JSON se estiver formatado com blocos de código markdown
-                import re
-                json_pattern = r'```(?:json)?\s*([\s\S]*?)\s*```'
-                json_match = re.search(json_pattern, generated_text)
+        Returns:
+            Consulta JSON para o Elasticsearch
+        """
+        try:
+            cached_query = self._get_cached_query(user_query, max_results)
+            if cached_query is not None:
+                return cached_query
+            
+            for attempt in range(QUERY_PLANNING_RETRIES + 1):
+                if attempt:
+                    current_trace().event("planning_retry")
                 
-                if json_match:
-                    json_str = json_match.group(1)
-                    query_json = json.loads(json_str)
+                # Chamar a API do Groq
+                logger.info("Preparando consulta Elasticsearch com LLM")
+                try:
+                    response = self._create(**self._planning_options(user_query, max_results))
+                except groq.BadRequestError as e:
+                    # Em JSON mode, a API rejeita respostas que não são JSON válido (json_validate_failed)
+                    logger.error(f"Resposta de planejamento rejeitada pela API: {str(e)}")
+                    generated_text = None
                 else:
-                    # Tentar carregar o texto completo como JSON
-                    query_json = json.loads(generated_text)
+                    # Extrair a consulta gerada do texto da resposta
+                    generated_text = response.choices[0].message.content
+                    record_usage(response.usage)
                 
-                # Verificar se a consulta foi gerada corretamente
-                if 'retriever' in query_json and 'rrf' in query_json['retriever']:
-                    # Estrutura correta baseada no novo template
-                    logger.info("Consulta Elasticsearch RRF preparada com sucesso")
+                query_json = self._parse_generated_query(generated_text, user_query, max_results)
+                if query_json is not None:
                     return query_json
-                else:
-                    logger.warning("A consulta gerada não segue o formato RRF esperado. Usando fallback.")
-                    raise ValueError("Formato de consulta inválido")
-                    
-            except (json.JSONDecodeError, ValueError) as e:
-                logger.error(f"Erro ao extrair ou validar JSON da resposta da LLM: {str(e)}")
-                logger.error(f"Resposta recebida: {generated_text}")
-                
-                # Usar uma consulta RRF padrão como fallback
-                # Extrair algumas palavras-chave simples da consulta original
-                import re
-                # Remove palavras comuns, pontuação e mantém palavras relevantes
-                palavras = re.sub(r'[^\w\s]', ' ', user_query.lower())
-                stop_words = {'o', 'a', 'os', 'as', 'de', 'da', 'do', 'das', 'dos', 'em', 'na', 'no', 'nas', 'nos', 'por', 'para', 'como', 'que', 'se', 'e', 'ou', 'é', 'são'}
-                palavras_chave = ' OR '.join(['(' + palavra + ')' for palavra in palavras.split() if palavra not in stop_words and len(palavra) > 2])
-                
-                if not palavras_chave:
-                    palavras_chave = user_query  # Uso a consulta original se não conseguir extrair palavras-chave
-                
-                fallback_query = {
-                    "retriever": {
-                        "rrf": {
-                            "retrievers": [
-                                {
-                                    "standard": {
-                                        "query": {
-                                            "query_string": {
-                                                "default_field": ES_TEXT_FIELD,
-                                                "query": palavras_chave
-                                            }
-                                        }
-                                    }
-                                },
-                                {
-                                    "standard": {
-                                        "query": {
-                                            "semantic": { 
-                                                "field": ES_SEMANTIC_FIELD,
-                                                "query": user_query
-                                            }
-                                        }
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "size": max_results
-                }
-                
-                logger.info("Usando consulta fallback devido a erro na extração de JSON")
-                return fallback_query
+            
+            return self._planning_failed(user_query, max_results, use_fallback)
             
         except Exception as e:
             logger.error(f"Erro ao preparar consulta Elasticsearch: {str(e)}")
             raise
     
-    def generate_response(self, user_query, documents):
+    def _format_context(self, user_query, documents):
+        """
+        Formata os documentos recuperados como contexto para o prompt, respeitando o orçamento de tokens
+        
+        Args:
+            user_query: Pergunta do usuário
+            documents: Documentos recuperados do Elasticsearch
+            
+        Returns:
+            Texto do contexto formatado
+        """
+        with current_trace().stage("context_build"):
+            passages = [f"Documento {i+1}:\n{text}\n\n" for i, (_, text) in enumerate(build_context(user_query, documents))]
+            return "".join(passages)
+    
+    def _build_response_messages(self, user_query, documents, history=None):
+        """
+        Monta as mensagens enviadas à LLM para a geração da resposta
+        
+        Args:
+            user_query: Pergunta do usuário
+            documents: Documentos recuperados do Elasticsearch
+            history: Histórico da conversa, no modo chat (opcional)
+            
+        Returns:
+            Lista de mensagens no formato da API de chat
+        """
+        # Formatar o prompt com a pergunta do usuário e o contexto
+        prompt = RESPONSE_GENERATION_TEMPLATE.format(
+            query=user_query,
+            context=self._format_context(user_query, documents)
+        )
+        if history:
+            prompt = CHAT_HISTORY_TEMPLATE.format(history=history) + prompt
+        
+        return [
+            {"role": "system", "content": "Você é um assistente especializado em fornecer respostas precisas baseadas no contexto."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _build_summary_messages(self, summary, turns):
+        """
+        Monta as mensagens enviadas à LLM para resumir os turnos antigos de uma conversa
+        
+        Args:
+            summary: Resumo anterior da conversa (pode ser vazio)
+            turns: Turnos a resumir ({"question", "answer"})
+            
+        Returns:
+            Lista de mensagens no formato da API de chat
+        """
+        prompt = CHAT_SUMMARY_TEMPLATE.format(
+            summary=f"Resumo anterior: {summary}" if summary else "",
+            turns="\n\n".join(f"Usuário: {turn['question']}\nAssistente: {turn['answer']}" for turn in turns)
+        )
+        return [
+            {"role": "system", "content": "Você resume conversas de forma fiel e concisa."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def summarize_conversation(self, summary, turns):
+        """
+        Resume os turnos antigos de uma conversa, incorporando o resumo anterior
+        
+        Args:
+            summary: Resumo anterior da conversa (pode ser vazio)
+            turns: Turnos a resumir ({"question", "answer"})
+            
+        Returns:
+            Novo resumo da conversa
+        """
+        try:
+            logger.info(f"Resumindo {len(turns)} turnos antigos da conversa")
+            response = self._create(
+                model=self.model,
+                messages=self._build_summary_messages(summary, turns),
+                temperature=0,
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS
+            )
+            record_usage(response.usage)
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            logger.error(f"Erro ao resumir a conversa: {str(e)}")
+            raise
+    
+    def generate_response(self, user_query, documents, history=None):
         """
         Gera uma resposta para o usuário com base nos documentos recuperados
         
         Args:
             user_query: Pergunta do usuário
             documents: Documentos recuperados do Elasticsearch
+            history: Histórico da conversa, no modo chat (opcional)
             
         Returns:
             Resposta gerada pela LLM
         """
         try:
             if not documents:
-                return "Não encontrei informações relevantes para responder sua pergunta. Por favor, reformule ou tente outra questão."
-                
-            # Formatar o contexto para o prompt
-            formatted_context = ""
-            for i, doc in enumerate(documents):
-                formatted_context += f"Documento {i+1}:\n"
-                
-                # Se tivermos um campo de texto ou conteúdo específico, exiba-o
-                # Adapte os campos conforme a estrutura real dos seus documentos
-                source = doc["source"]
+                return NO_DOCUMENTS_MESSAGE
+            
+            # Chamar a API do Groq
+            logger.info("Gerando resposta para o usuário com LLM")
+            response = self._create(
+                model=self.model,
+                messages=self._build_response_messages(user_query, documents, history),
+                temperature=self.temperature
+            )
+            
+            self._record_model(response)
+            
+            # Extrair e retornar a resposta gerada
+            answer = response.choices[0].message.content
+            record_usage(response.usage)
+            logger.info("Resposta gerada com sucesso")
+            return answer
+            
+        except Exception as e:
+            logger.error(f"Erro ao gerar resposta: {str(e)}")
+            raise
+    
+    def generate_response_stream(self, user_query, documents, history=None):
+        """
+        Gera uma resposta em modo streaming, produzindo os trechos à medida que a LLM os envia
+        
+        Args:
+            user_query: Pergunta do usuário
+            documents: Documentos recuperados do Elasticsearch
+            history: Histórico da conversa, no modo chat (opcional)
+            
+        Yields:
+            Trechos (deltas) da resposta gerada pela LLM
+        """
+        try:
+            if not documents:
+                yield NO_DOCUMENTS_MESSAGE
+                return
+            
+            # Chamar a API do Groq com stream=True
+            logger.info("Gerando resposta em streaming para o usuário com LLM")
+            stream = self._create(
+                model=self.model,
+                messages=self._build_response_messages(user_query, documents, history),
+                temperature=self.temperature,
+                stream=True
+            )
+            
+            model_recorded = False
+            for chunk in stream:
+                if not model_recorded:
+                    self._record_model(chunk)
+                    model_recorded = True
+                # O último chunk traz o uso de tokens em x_groq.usage
+                record_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+            
+            logger.info("Resposta em streaming gerada com sucesso")
+            
+        except Exception as e:
+            logger.error(f"Erro ao gerar resposta em streaming: {str(e)}")
+            raise
+    
+    def close(self):
+        """Fecha as conexões do cliente"""
+        self.client.close()
+
+
+class AsyncLLMClient(LLMClient):
+    def __init__(self, client=None):
+        """
+        Inicializa o cliente LLM assíncrono com Groq API
+        
+        Args:
+            client: Instância de groq.AsyncClient já configurada (opcional)
+        """
+        if not GROQ_API_KEY:
+            raise ValueError("GROQ_API_KEY não encontrada. Configure a variável de ambiente ou o arquivo .env")
+        
+        logger.info(f"Inicializando cliente Groq assíncrono com modelo: {LLM_MODEL}")
+        self.client = client if client is not None else groq.AsyncClient(**groq_options())
+        self.model = LLM_MODEL
+        self.temperature = LLM_TEMPERATURE
+        self.query_cache = QueryPlanCache() if QUERY_CACHE_ENABLED else None
+        self.scheduler = AsyncGroqScheduler() if GROQ_SCHEDULER_ENABLED else None
+    
+    async def _create(self, **options):
+        """Versão assíncrona de _create"""
+        check_deadline("groq")
+        if self.scheduler is None:
+            return await self.client.chat.completions.create(**options)
+        return await self.scheduler.call(self.client.chat.completions, options)
+    
+    async def prepare_elasticsearch_query(self, user_query, max_results=ES_MAX_RESULTS, use_fallback=True):
+        """
+        Prepara uma consulta Elasticsearch híbrida a partir da pergunta do usuário de forma assíncrona
+        
+        Args:
+            user_query: Pergunta do usuário
+            max_results: Número máximo de resultados a retornar
+            use_fallback: Se False, retorna None em vez da consulta fallback quando a resposta da LLM for inválida
+            
+        Returns:
+            Consulta JSON para o Elasticsearch
+        """
+        try:
+            cached_query = self._get_cached_query(user_query, max_results)
+            if cached_query is not None:
+                return cached_query
+            
+            for attempt in range(QUERY_PLANNING_RETRIES + 1):
+                if attempt:
+                    current_trace().event("planning_retry")
                 
-                # Tentar extrair o conteúdo do documento com base nos campos mais comuns
-                # Adicione ou modifique os campos de acordo com a estrutura real do seu índice
-                if ES_TEXT_FIELD in source:
-                    formatted_context += f"{source[ES_TEXT_FIELD]}\n\n"
-                elif "text" in source:
-                    formatted_context += f"{source['text']}\n\n"
-                elif "content" in source:
-                    formatted_context += f"{source['content']}\n\n"
-                elif "title" in source and "body" in source:
-                    formatted_context += f"Título: {source['title']}\n\nConteúdo: {source['body']}\n\n"
+                logger.info("Preparando consulta Elasticsearch com LLM")
+                try:
+                    response = await self._create(**self._planning_options(user_query, max_results))
+                except groq.BadRequestError as e:
+                    logger.error(f"Resposta de planejamento rejeitada pela API: {str(e)}")
+                    generated_text = None
                 else:
-                    # Mostrar todo o documento se não houver campo específico
-                    # Excluir o campo vetorial para não sobrecarregar o contexto
-                    source_copy = source.copy()
-                    if ES_SEMANTIC_FIELD in source_copy:
-                        del source_copy[ES_SEMANTIC_FIELD]
-                    formatted_context += f"{json.dumps(source_copy, ensure_ascii=False, indent=2)}\n\n"
-            
-            # Formatar o prompt com a pergunta do usuário e o contexto
-            prompt = RESPONSE_GENERATION_TEMPLATE.format(
-                query=user_query,
-                context=formatted_context
+                    generated_text = response.choices[0].message.content
+                    record_usage(response.usage)
+                
+                query_json = self._parse_generated_query(generated_text, user_query, max_results)
+                if query_json is not None:
+                    return query_json
+            
+            return self._planning_failed(user_query, max_results, use_fallback)
+            
+        except Exception as e:
+            logger.error(f"Erro ao preparar consulta Elasticsearch: {str(e)}")
+            raise
+    
+    async def summarize_conversation(self, summary, turns):
+        """Resume os turnos antigos de uma conversa de forma assíncrona"""
+        try:
+            logger.info(f"Resumindo {len(turns)} turnos antigos da conversa")
+            response = await self._create(
+                model=self.model,
+                messages=self._build_summary_messages(summary, turns),
+                temperature=0,
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS
             )
+            record_usage(response.usage)
+            return response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            logger.error(f"Erro ao resumir a conversa: {str(e)}")
+            raise
+    
+    async def generate_response(self, user_query, documents, history=None):
+        """
+        Gera uma resposta para o usuário com base nos documentos recuperados de forma assíncrona
+        
+        Args:
+            user_query: Pergunta do usuário
+            documents: Documentos recuperados do Elasticsearch
+            history: Histórico da conversa, no modo chat (opcional)
+            
+        Returns:
+            Resposta gerada pela LLM
+        """
+        try:
+            if not documents:
+                return NO_DOCUMENTS_MESSAGE
             
-            # Chamar a API do Groq
             logger.info("Gerando resposta para o usuário com LLM")
-            response = self.client.chat.completions.create(
+            response = await self._create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "Você é um assistente especializado em fornecer respostas precisas baseadas no contexto."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_response_messages(user_query, documents, history),
                 temperature=self.temperature
             )
             
-            # Extrair e retornar a resposta gerada
+            self._record_model(response)
             answer = response.choices[0].message.content
+            record_usage(response.usage)
             logger.info("Resposta gerada com sucesso")
             return answer
             
         except Exception as e:
             logger.error(f"Erro ao gerar resposta: {str(e)}")
             raise
+    
+    async def generate_response_stream(self, user_query, documents, history=None):
+        """
+        Gera uma resposta em modo streaming de forma assíncrona
+        
+        Args:
+            user_query: Pergunta do usuário
+            documents: Documentos recuperados do Elasticsearch
+            history: Histórico da conversa, no modo chat (opcional)
+            
+        Yields:
+            Trechos (deltas) da resposta gerada pela LLM
+        """
+        try:
+            if not documents:
+                yield NO_DOCUMENTS_MESSAGE
+                return
+            
+            logger.info("Gerando resposta em streaming para o usuário com LLM")
+            stream = await self._create(
+                model=self.model,
+                messages=self._build_response_messages(user_query, documents, history),
+                temperature=self.temperature,
+                stream=True
+            )
+            
+            model_recorded = False
+            async for chunk in stream:
+                if not model_recorded:
+                    self._record_model(chunk)
+                    model_recorded = True
+                record_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+            
+            logger.info("Resposta em streaming gerada com sucesso")
+            
+        except Exception as e:
+            logger.error(f"Erro ao gerar resposta em streaming: {str(e)}")
+            raise
+    
+    async def close(self):
+        """Fecha as conexões do cliente assíncrono"""
+        await self.client.close()
@@ -0,0 +1,167 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from config import LOCAL_INDEX_MAX_DOCS, LOCAL_INDEX_TTL, LOCAL_INDEX_MIN_COVERAGE, LOCAL_INDEX_MIN_MARGIN
+from utils.context_builder import extract_document_text
+from utils.keywords import normalize_terms
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Parâmetros do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class LocalBM25Index:
+    """
+    Índice invertido BM25 em memória com os documentos já retornados pelo Elasticsearch.
+    Responde localmente às consultas cujo resultado é confiável (todos os termos conhecidos e
+    separação clara entre os documentos retornados e os seguintes); nas demais, a consulta
+    segue para o Elasticsearch. Limitado por número de documentos, com remoção LRU e TTL.
+    """
+
+    def __init__(self, max_docs=LOCAL_INDEX_MAX_DOCS, ttl=LOCAL_INDEX_TTL,
+                 min_coverage=LOCAL_INDEX_MIN_COVERAGE, min_margin=LOCAL_INDEX_MIN_MARGIN):
+        """
+        Args:
+            max_docs: Número máximo de documentos indexados antes da remoção dos menos usados
+            ttl: Tempo de vida de cada documento no índice, em segundos
+            min_coverage: Fração mínima dos termos da consulta presentes no vocabulário local
+            min_margin: Diferença mínima (relativa ao melhor score) entre o último documento
+                retornado e o primeiro não retornado
+        """
+        self.max_docs = max_docs
+        self.ttl = ttl
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._documents = OrderedDict()  # id -> (documento, frequências dos termos, tamanho, expires_at)
+        self._postings = {}  # termo -> {id: frequência}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def add(self, documents):
+        """Indexa (ou atualiza) os documentos retornados pelo Elasticsearch"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for doc in documents:
+                self._remove(doc["id"])
+                terms = {}
+                for term in normalize_terms(extract_document_text(doc["source"])):
+                    terms[term] = terms.get(term, 0) + 1
+                length = sum(terms.values())
+                # Os fragmentos do highlight são específicos da consulta original e não são guardados
+                stored = {"id": doc["id"], "source": doc["source"]}
+                self._documents[doc["id"]] = (stored, terms, length, expires_at)
+                self._total_length += length
+                for term, frequency in terms.items():
+                    self._postings.setdefault(term, {})[doc["id"]] = frequency
+            while len(self._documents) > self.max_docs:
+                self._remove(next(iter(self._documents)))
+                self.evictions += 1
+
+    def _remove(self, doc_id):
+        entry = self._documents.pop(doc_id, None)
+        if entry is None:
+            return
+        _, terms, length, _ = entry
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query_text, size):
+        """
+        Busca os documentos no índice local
+
+        Args:
+            query_text: Texto da consulta
+            size: Número de documentos desejados
+
+        Returns:
+            Lista de documentos (id, score BM25, source), ou None se o resultado local não for confiável
+        """
+        query_terms = list(dict.fromkeys(normalize_terms(query_text)))
+        with self._lock:
+            documents = self._search(query_terms, size)
+            if documents is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return documents
+
+    def _search(self, query_terms, size):
+        if not query_terms or len(self._documents) < size:
+            return None
+
+        known = [term for term in query_terms if term in self._postings]
+        if len(known) / len(query_terms) < self.min_coverage:
+            return None
+
+        now = time.time()
+        count = len(self._documents)
+        average_length = self._total_length / count if count else 0.0
+        scores = {}
+        expired = set()
+        for term in known:
+            postings = self._postings.get(term, {})
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                _, _, length, expires_at = self._documents[doc_id]
+                if expires_at < now:
+                    expired.add(doc_id)
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length) if average_length else BM25_K1
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        for doc_id in expired:
+            self._remove(doc_id)
+            scores.pop(doc_id, None)
+
+        if len(scores) < size:
+            return None
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best = ranked[0][1]
+        next_score = ranked[size][1] if len(ranked) > size else 0.0
+        if best <= 0 or (ranked[size - 1][1] - next_score) / best < self.min_margin:
+            return None
+
+        documents = []
+        for doc_id, score in ranked[:size]:
+            self._documents.move_to_end(doc_id)
+            stored = self._documents[doc_id][0]
+            documents.append({"id": stored["id"], "score": score, "source": stored["source"]})
+        return documents
+
+    def clear(self):
+        """Remove todos os documentos do índice"""
+        with self._lock:
+            self._documents.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def stats(self):
+        """Retorna os contadores do índice local, incluindo a taxa de consultas respondidas localmente"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "documents": len(self._documents),
+                "terms": len(self._postings),
+                "max_docs": self.max_docs
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
@@ -0,0 +1,628 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+import numpy as np
+from config import (ES_MAX_RESULTS, ES_TEXT_FIELD, ES_SEMANTIC_FIELD, ES_SOURCE_INCLUDES, ES_SOURCE_EXCLUDES,
+                    LOCAL_RETRIEVER_PATH, LOCAL_RETRIEVER_MODEL, LOCAL_RETRIEVER_NPROBE, LOCAL_RETRIEVER_BLOCK_ROWS)
+from utils.es_client import build_rrf_query
+from utils.keywords import build_keyword_expression, normalize_terms
+from utils.local_index import BM25_K1, BM25_B
+from utils.metrics import current_trace
+from utils.retriever import Retriever
+
+# Dependência opcional: sem o sentence-transformers, as consultas usam apenas o BM25
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Arquivos do índice local
+META_FILE = "meta.json"
+DOCUMENTS_FILE = "documents.jsonl"
+VECTORS_FILE = "vectors.f32"
+IVF_FILE = "ivf.npz"
+
+# Prefixos esperados pelos modelos E5 (os mesmos do .multilingual-e5-small-elasticsearch)
+QUERY_PREFIX = "query: "
+PASSAGE_PREFIX = "passage: "
+
+# Padrões do retriever rrf do Elasticsearch
+RRF_RANK_CONSTANT = 60
+
+_OPERATORS_RE = re.compile(r'\b(?:AND|OR|NOT)\b')
+
+
+def _top_k(scores, k):
+    """Índices dos k maiores scores finitos, em ordem decrescente"""
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[np.isfinite(scores[candidates])]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def _source_value(source, field):
+    """Valor de um campo do _source, aceitando caminhos com pontos (ex.: "autor.nome")"""
+    value = source
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _filter_source(source):
+    """Aplica ES_SOURCE_INCLUDES/ES_SOURCE_EXCLUDES ao _source, como no Elasticsearch"""
+    return {key: value for key, value in source.items()
+            if (not ES_SOURCE_INCLUDES or key in ES_SOURCE_INCLUDES) and key not in ES_SOURCE_EXCLUDES}
+
+
+class QueryEncoder:
+    """Gera os embeddings das consultas com um modelo sentence-transformers, carregado na primeira consulta"""
+
+    def __init__(self, model_name=LOCAL_RETRIEVER_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return SentenceTransformer is not None
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                logger.info(f"Carregando o modelo de embeddings {self.model_name}")
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    def encode(self, texts, prefix=QUERY_PREFIX, batch_size=32):
+        """
+        Gera os embeddings normalizados (norma 1) dos textos
+
+        Args:
+            texts: Lista de textos
+            prefix: Prefixo do modelo (QUERY_PREFIX para consultas, PASSAGE_PREFIX para documentos)
+            batch_size: Textos por lote na inferência
+
+        Returns:
+            Matriz float32 (textos x dimensões)
+        """
+        vectors = self._get_model().encode([prefix + text for text in texts], batch_size=batch_size,
+                                           normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class LocalHybridIndex:
+    """
+    Índice local somente leitura: matriz de embeddings mapeada em memória (np.memmap, com
+    busca exaustiva em blocos ou IVF), índice invertido BM25 e os documentos
+    """
+
+    def __init__(self, path=LOCAL_RETRIEVER_PATH, nprobe=LOCAL_RETRIEVER_NPROBE, block_rows=LOCAL_RETRIEVER_BLOCK_ROWS):
+        """
+        Args:
+            path: Diretório gerado por build_local_index
+            nprobe: Listas IVF visitadas por consulta
+            block_rows: Vetores comparados por bloco na busca exaustiva
+        """
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as meta_file:
+            self.meta = json.load(meta_file)
+        self.path = path
+        self.nprobe = nprobe
+        self.block_rows = block_rows
+        self.text_field = self.meta.get("text_field", ES_TEXT_FIELD)
+
+        self.ids = []
+        self.sources = []
+        with open(os.path.join(path, DOCUMENTS_FILE), encoding="utf-8") as documents_file:
+            for line in documents_file:
+                item = json.loads(line)
+                self.ids.append(item["id"])
+                self.sources.append(item["source"])
+        self.count = len(self.ids)
+
+        self.dims = self.meta.get("dims", 0)
+        self.vectors = None
+        if self.dims and self.count:
+            self.vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r",
+                                     shape=(self.count, self.dims))
+
+        self.centroids = None
+        ivf_path = os.path.join(path, IVF_FILE)
+        if self.vectors is not None and os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            self.centroids, self.ivf_order, self.ivf_offsets = ivf["centroids"], ivf["order"], ivf["offsets"]
+
+        self._build_bm25()
+        logger.info(f"Índice local carregado de {path}: {self.count} documentos, {self.dims} dimensões, "
+                    f"{len(self.centroids) if self.centroids is not None else 0} listas IVF, {len(self.postings)} termos")
+
+    def _build_bm25(self):
+        """Monta o índice invertido com os pesos BM25 já calculados de cada termo em cada documento"""
+        frequencies = {}
+        lengths = np.zeros(self.count, dtype=np.float32)
+        for row, source in enumerate(self.sources):
+            terms = normalize_terms(str(_source_value(source, self.text_field) or ""))
+            lengths[row] = len(terms)
+            for term in terms:
+                postings = frequencies.setdefault(term, {})
+                postings[row] = postings.get(row, 0) + 1
+
+        average_length = float(lengths.mean()) if self.count else 0.0
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length) if average_length else np.full(self.count, BM25_K1)
+        self.postings = {}
+        for term, postings in frequencies.items():
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            idf = math.log(1 + (self.count - len(postings) + 0.5) / (len(postings) + 0.5))
+            self.postings[term] = (rows, (idf * tf * (BM25_K1 + 1) / (tf + norms[rows])).astype(np.float32))
+
+    def filter_mask(self, filters):
+        """
+        Converte as cláusulas de filtro (term, terms e range) em uma máscara booleana dos documentos
+
+        Returns:
+            Array booleano (um item por documento), ou None sem filtros
+        """
+        if not filters:
+            return None
+        mask = np.ones(self.count, dtype=bool)
+        for clause in filters:
+            (kind, condition), = clause.items()
+            (field, expected), = condition.items()
+            if kind == "term":
+                accepted = {str(expected.get("value") if isinstance(expected, dict) else expected).lower()}
+                match = lambda value: value is not None and str(value).lower() in accepted
+            elif kind == "terms":
+                accepted = {str(item).lower() for item in expected}
+                match = lambda value: value is not None and str(value).lower() in accepted
+            elif kind == "range":
+                match = lambda value, bounds=expected: value is not None and all(
+                    _compare(value, op, bound) for op, bound in bounds.items() if op in ("gt", "gte", "lt", "lte"))
+            else:
+                raise ValueError(f"Filtro não suportado pelo mecanismo local: {kind}")
+            values = (_source_value(source, field) for source in self.sources)
+            mask &= np.fromiter((any(match(item) for item in value) if isinstance(value, list) else match(value)
+                                 for value in values), dtype=bool, count=self.count)
+        return mask
+
+    def bm25_search(self, text, k, mask=None):
+        """
+        Busca BM25 pelos termos do texto (os operadores do query_string são ignorados e os termos somados)
+
+        Returns:
+            Tupla (linhas, scores) em ordem decrescente de score
+        """
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in dict.fromkeys(normalize_terms(_OPERATORS_RE.sub(" ", text))):
+            postings = self.postings.get(term)
+            if postings is not None:
+                scores[postings[0]] += postings[1]
+        scores[scores <= 0] = -np.inf
+        if mask is not None:
+            scores[~mask] = -np.inf
+        rows = _top_k(scores, k)
+        return rows, scores[rows]
+
+    def vector_search(self, query_vectors, k, masks):
+        """
+        Busca os k vetores mais próximos (produto interno entre vetores normalizados) de cada consulta
+
+        Args:
+            query_vectors: Matriz float32 (consultas x dimensões)
+            k: Número de resultados por consulta
+            masks: Lista com a máscara de filtros de cada consulta (ou None)
+
+        Returns:
+            Lista de tuplas (linhas, scores), uma por consulta
+        """
+        if self.centroids is not None:
+            return [self._ivf_search(vector, k, mask) for vector, mask in zip(query_vectors, masks)]
+
+        # Busca exaustiva em blocos: cada bloco da matriz mapeada é lido uma vez para todas as consultas do lote
+        best = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(len(query_vectors))]
+        for start in range(0, self.count, self.block_rows):
+            end = min(start + self.block_rows, self.count)
+            block_scores = query_vectors @ np.asarray(self.vectors[start:end]).T
+            for i, mask in enumerate(masks):
+                scores = block_scores[i]
+                if mask is not None:
+                    scores = np.where(mask[start:end], scores, -np.inf)
+                top = _top_k(scores, k)
+                rows = np.concatenate([best[i][0], top + start])
+                merged = np.concatenate([best[i][1], scores[top]])
+                order = _top_k(merged, k)
+                best[i] = (rows[order], merged[order])
+        return best
+
+    def _ivf_search(self, vector, k, mask):
+        """Busca nas nprobe listas IVF mais próximas da consulta"""
+        lists = _top_k(self.centroids @ vector, self.nprobe)
+        rows = np.sort(np.concatenate([self.ivf_order[self.ivf_offsets[j]:self.ivf_offsets[j + 1]] for j in lists]))
+        if mask is not None:
+            rows = rows[mask[rows]]
+        scores = np.asarray(self.vectors[rows]) @ vector
+        top = _top_k(scores, k)
+        return rows[top], scores[top]
+
+
+def _compare(value, op, bound):
+    """Compara um valor do documento com um limite de range (números ou textos, como datas ISO)"""
+    try:
+        value, bound = float(value), float(bound)
+    except (TypeError, ValueError):
+        value, bound = str(value), str(bound)
+    if op == "gt":
+        return value > bound
+    if op == "gte":
+        return value >= bound
+    if op == "lt":
+        return value < bound
+    return value <= bound
+
+
+@lru_cache(maxsize=None)
+def load_local_index(path=LOCAL_RETRIEVER_PATH):
+    """Carrega o índice local uma única vez por processo (compartilhado pelos clientes síncrono e assíncrono)"""
+    return LocalHybridIndex(path)
+
+
+def _parse_clause(clause):
+    """
+    Converte a consulta de um retriever standard em (tipo, texto, filtros), com tipo
+    "semantic" (busca vetorial) ou "text" (BM25)
+    """
+    filters = []
+    if "bool" in clause:
+        must = clause["bool"].get("must") or []
+        must = must if isinstance(must, list) else [must]
+        filter_clauses = clause["bool"].get("filter") or []
+        filters = filter_clauses if isinstance(filter_clauses, list) else [filter_clauses]
+        if len(must) != 1:
+            raise ValueError("Consulta bool não suportada pelo mecanismo local (apenas um must)")
+        clause = must[0]
+
+    if "semantic" in clause:
+        return "semantic", clause["semantic"]["query"], filters
+    if "query_string" in clause:
+        return "text", clause["query_string"]["query"], filters
+    if "multi_match" in clause:
+        return "text", clause["multi_match"]["query"], filters
+    if "match" in clause:
+        (_, value), = clause["match"].items()
+        return "text", value.get("query", "") if isinstance(value, dict) else value, filters
+    raise ValueError(f"Consulta não suportada pelo mecanismo local: {', '.join(clause)}")
+
+
+def parse_query(query, size):
+    """
+    Interpreta uma consulta do Elasticsearch (retriever rrf, retriever standard ou query)
+
+    Args:
+        query: Dicionário da consulta
+        size: Número de resultados se a consulta não definir "size"
+
+    Returns:
+        Dicionário com size, rrf (bool), rank_window_size, rank_constant e clauses [(tipo, texto, filtros)]
+    """
+    size = int(query.get("size", size))
+    retriever = query.get("retriever")
+    if retriever and "rrf" in retriever:
+        rrf = retriever["rrf"]
+        clauses = [_parse_clause(child["standard"]["query"]) for child in rrf["retrievers"]]
+        window = int(rrf.get("rank_window_size", rrf.get("window_size", size)))
+        return {"size": size, "rrf": True, "rank_window_size": max(window, size),
+                "rank_constant": int(rrf.get("rank_constant", RRF_RANK_CONSTANT)), "clauses": clauses}
+    if retriever and "standard" in retriever:
+        return {"size": size, "rrf": False, "clauses": [_parse_clause(retriever["standard"]["query"])]}
+    if "query" in query:
+        return {"size": size, "rrf": False, "clauses": [_parse_clause(query["query"])]}
+    raise ValueError("Consulta sem retriever ou query")
+
+
+def reciprocal_rank_fusion(rankings, size, rank_window_size, rank_constant=RRF_RANK_CONSTANT):
+    """
+    Combina listas ordenadas com Reciprocal Rank Fusion, como o retriever rrf do Elasticsearch:
+    cada lista contribui com os rank_window_size primeiros itens e score 1 / (rank_constant + posição)
+
+    Args:
+        rankings: Listas de itens, cada uma em ordem decrescente de relevância
+        size: Número de itens retornados
+        rank_window_size: Itens considerados de cada lista
+        rank_constant: Constante k do RRF
+
+    Returns:
+        Lista de tuplas (item, score RRF) em ordem decrescente de score
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking[:rank_window_size], start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rank_constant + rank)
+    return sorted(scores.items(), key=lambda entry: entry[1], reverse=True)[:size]
+
+
+class LocalHybridRetriever(Retriever):
+    """
+    Mecanismo de recuperação local, sem o Elasticsearch: executa as mesmas consultas RRF
+    (query_string + semantic) com BM25 e busca vetorial em processo, combinadas por RRF com a
+    semântica de rank_window_size/rank_constant do Elasticsearch. Indicado para corpora pequenos
+    com requisitos de latência e como fallback quando o Elasticsearch está indisponível.
+    """
+
+    def __init__(self, index=None, encoder=None, path=LOCAL_RETRIEVER_PATH):
+        """
+        Args:
+            index: LocalHybridIndex (opcional; por padrão carrega o índice de path)
+            encoder: QueryEncoder das consultas (opcional)
+            path: Diretório do índice local
+        """
+        self.index = index if index is not None else load_local_index(path)
+        self.encoder = encoder if encoder is not None else QueryEncoder(self.index.meta.get("model") or LOCAL_RETRIEVER_MODEL)
+        self.vector_search_enabled = self.index.vectors is not None and self.encoder.available
+        if self.index.vectors is not None and not self.encoder.available:
+            logger.warning("sentence-transformers não instalado: o mecanismo local usará apenas o BM25")
+
+    def build_semantic_query(self, query_text, size):
+        """Monta a consulta híbrida RRF (query_string + semantic), a mesma enviada ao Elasticsearch"""
+        return build_rrf_query(build_keyword_expression(query_text), query_text, size)
+
+    def search(self, query_json, size=ES_MAX_RESULTS):
+        """
+        Executa uma consulta no índice local
+
+        Args:
+            query_json: Consulta no formato do Elasticsearch (dicionário ou string JSON)
+            size: Número máximo de resultados (usado se a consulta não definir "size")
+
+        Returns:
+            Lista de documentos correspondentes
+        """
+        result = self._run_queries([query_json], size)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def msearch(self, queries, size=ES_MAX_RESULTS):
+        """
+        Executa várias consultas no índice local, com os embeddings das consultas gerados em um
+        único lote e a busca vetorial exaustiva feita em uma passada pela matriz
+
+        Returns:
+            Lista com um item por consulta: a lista de documentos ou a exceção da consulta
+        """
+        return self._run_queries(queries, size)
+
+    def _run_queries(self, queries, size):
+        trace = current_trace()
+        plans = []
+        for query_json in queries:
+            try:
+                query = json.loads(query_json) if isinstance(query_json, str) else query_json
+                plan = parse_query(query, size)
+                plan["masks"] = [self.index.filter_mask(filters) for _, _, filters in plan["clauses"]]
+                plans.append(plan)
+            except Exception as e:
+                logger.error(f"Erro na consulta ao mecanismo local: {str(e)}")
+                plans.append(e)
+
+        # Consultas vetoriais de todas as consultas do lote
+        semantic = [(i, j) for i, plan in enumerate(plans) if not isinstance(plan, Exception)
+                    for j, (kind, _, _) in enumerate(plan["clauses"]) if kind == "semantic"]
+        vector_results = {}
+        if semantic and self.vector_search_enabled:
+            with trace.stage("local_encode"):
+                vectors = self.encoder.encode([plans[i]["clauses"][j][1] for i, j in semantic])
+            with trace.stage("local_vector"):
+                found = self.index.vector_search(vectors, max(self._window(plans[i]) for i, _ in semantic),
+                                                 [plans[i]["masks"][j] for i, j in semantic])
+            vector_results = dict(zip(semantic, found))
+        elif semantic:
+            trace.event("local_vector_unavailable")
+
+        results = []
+        with trace.stage("local_search"):
+            for i, plan in enumerate(plans):
+                if isinstance(plan, Exception):
+                    results.append(plan)
+                    continue
+                rankings = []
+                for j, (kind, text, _) in enumerate(plan["clauses"]):
+                    if kind == "semantic":
+                        if (i, j) in vector_results:
+                            rows, scores = vector_results[(i, j)]
+                            rankings.append(list(zip(rows[:self._window(plan)].tolist(), scores.tolist())))
+                    else:
+                        rows, scores = self.index.bm25_search(text, self._window(plan), plan["masks"][j])
+                        rankings.append(list(zip(rows.tolist(), scores.tolist())))
+                results.append(self._documents(plan, rankings))
+
+        for result in results:
+            if not isinstance(result, Exception):
+                trace.set("hits", len(result))
+        logger.info(f"{len(queries)} consulta(s) executada(s) no índice local")
+        return results
+
+    def _window(self, plan):
+        return plan["rank_window_size"] if plan["rrf"] else plan["size"]
+
+    def _documents(self, plan, rankings):
+        """Combina os resultados dos retrievers (RRF ou o único retriever) na lista de documentos"""
+        if plan["rrf"]:
+            ranked = reciprocal_rank_fusion([[row for row, _ in ranking] for ranking in rankings], plan["size"],
+                                            plan["rank_window_size"], plan["rank_constant"])
+        else:
+            ranked = rankings[0][:plan["size"]] if rankings else []
+        return [{"id": self.index.ids[row], "score": float(score), "source": _filter_source(self.index.sources[row])}
+                for row, score in ranked]
+
+    def ping(self):
+        return self.index.count > 0
+
+    def stats(self):
+        return {
+            "documents": self.index.count,
+            "dims": self.index.dims,
+            "ivf_lists": len(self.index.centroids) if self.index.centroids is not None else 0,
+            "vector_search": self.vector_search_enabled
+        }
+
+
+class AsyncLocalHybridRetriever(LocalHybridRetriever):
+    """Versão assíncrona do mecanismo local: as buscas (NumPy, fora do GIL) rodam em threads do executor padrão"""
+
+    async def search(self, query_json, size=ES_MAX_RESULTS):
+        result = (await asyncio.to_thread(self._run_queries, [query_json], size))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def msearch(self, queries, size=ES_MAX_RESULTS):
+        return await asyncio.to_thread(self._run_queries, queries, size)
+
+    async def semantic_search(self, query_text, size=ES_MAX_RESULTS):
+        return await self.search(self.build_semantic_query(query_text, size))
+
+    async def verify_connection(self):
+        """Verifica se o índice local tem documentos"""
+        if not self.index.count:
+            raise ConnectionError(f"Índice local vazio: {self.index.path}")
+
+    async def ping(self):
+        return self.index.count > 0
+
+    async def close(self):
+        """O índice local é compartilhado pelo processo e não é fechado"""
+
+
+def _train_ivf(vectors, lists, iterations=10, sample_per_list=256):
+    """
+    Treina as listas IVF com k-means esférico sobre uma amostra dos vetores e atribui cada
+    vetor à lista do centroide mais próximo
+
+    Returns:
+        Tupla (centroides, ordem dos vetores agrupados por lista, início de cada lista na ordem)
+    """
+    count = len(vectors)
+    rng = np.random.default_rng(0)
+    sample = np.asarray(vectors[np.sort(rng.choice(count, min(count, lists * sample_per_list), replace=False))])
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for j in range(lists):
+            members = sample[assignment == j]
+            if len(members):
+                centroids[j] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+
+    assignment = np.empty(count, dtype=np.int64)
+    for start in range(0, count, LOCAL_RETRIEVER_BLOCK_ROWS):
+        end = min(start + LOCAL_RETRIEVER_BLOCK_ROWS, count)
+        assignment[start:end] = np.argmax(np.asarray(vectors[start:end]) @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.searchsorted(assignment[order], np.arange(lists + 1))
+    return centroids.astype(np.float32), order, offsets
+
+
+def build_local_index(documents, path=LOCAL_RETRIEVER_PATH, text_field=ES_TEXT_FIELD, embedding_field=None,
+                      encoder=None, batch_size=64, ivf_lists=0):
+    """
+    Gera o índice local a partir dos documentos: embeddings (pré-calculados em embedding_field
+    ou gerados pelo encoder) gravados em disco à medida que são produzidos, documentos em JSONL
+    e, opcionalmente, as listas IVF. Os arquivos são escritos com nomes temporários e trocados
+    no final.
+
+    Args:
+        documents: Iterável de tuplas (id, source)
+        path: Diretório do índice local
+        text_field: Campo de texto usado no BM25 e nos embeddings
+        embedding_field: Campo do source com o embedding pré-calculado (opcional)
+        encoder: QueryEncoder usado para gerar os embeddings ausentes (opcional; sem ele e sem
+            embeddings pré-calculados, o índice tem apenas o BM25)
+        batch_size: Documentos por lote na geração dos embeddings
+        ivf_lists: Número de listas IVF (0 = apenas a busca exaustiva)
+
+    Returns:
+        Dicionário de metadados do índice gerado
+    """
+    os.makedirs(path, exist_ok=True)
+    files = {name: os.path.join(path, name) for name in (META_FILE, DOCUMENTS_FILE, VECTORS_FILE, IVF_FILE)}
+    temporary = {name: file + ".tmp" for name, file in files.items()}
+    count = 0
+    dims = 0
+    vector_rows = 0
+
+    def flush(batch, vectors_file):
+        nonlocal dims, vector_rows
+        missing = [k for k, (_, _, vector) in enumerate(batch) if vector is None]
+        vectors = [vector for _, _, vector in batch]
+        if missing and encoder is not None:
+            encoded = encoder.encode([str(batch[k][1].get(text_field) or "") for k in missing], PASSAGE_PREFIX, batch_size)
+            for k, vector in zip(missing, encoded):
+                vectors[k] = vector
+        elif missing and (dims or any(vector is not None for vector in vectors)):
+            raise ValueError("Documentos sem embedding e sem modelo para gerá-los")
+        if all(vector is None for vector in vectors):
+            return
+        matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        if dims and matrix.shape[1] != dims:
+            raise ValueError(f"Embeddings com {matrix.shape[1]} dimensões (esperado {dims})")
+        dims = matrix.shape[1]
+        vectors_file.write(matrix.tobytes())
+        vector_rows += len(matrix)
+
+    with open(temporary[DOCUMENTS_FILE], "w", encoding="utf-8") as documents_file, \
+            open(temporary[VECTORS_FILE], "wb") as vectors_file:
+        batch = []
+        for doc_id, source in documents:
+            vector = source.get(embedding_field) if embedding_field else None
+            source = {key: value for key, value in source.items() if key not in (ES_SEMANTIC_FIELD, embedding_field)}
+            batch.append((doc_id, source, vector))
+            documents_file.write(json.dumps({"id": doc_id, "source": source}, ensure_ascii=False) + "\n")
+            count += 1
+            if len(batch) >= batch_size:
+                flush(batch, vectors_file)
+                batch = []
+                if count % 10000 == 0:
+                    logger.info(f"{count} documentos processados")
+        if batch:
+            flush(batch, vectors_file)
+    if vector_rows not in (0, count):
+        raise ValueError(f"Apenas {vector_rows} de {count} documentos têm embedding")
+
+    meta = {"count": count, "dims": dims, "text_field": text_field,
+            "model": encoder.model_name if encoder is not None else None, "ivf_lists": 0}
+    if ivf_lists and dims and count >= ivf_lists:
+        logger.info(f"Treinando {ivf_lists} listas IVF")
+        vectors = np.memmap(temporary[VECTORS_FILE], dtype=np.float32, mode="r", shape=(count, dims))
+        centroids, order, offsets = _train_ivf(vectors, ivf_lists)
+        with open(temporary[IVF_FILE], "wb") as ivf_file:
+            np.savez(ivf_file, centroids=centroids, order=order, offsets=offsets)
+        meta["ivf_lists"] = ivf_lists
+    with open(temporary[META_FILE], "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file, ensure_ascii=False, indent=2)
+
+    for name, file in files.items():
+        if os.path.exists(temporary[name]):
+            os.replace(temporary[name], file)
+        elif os.path.exists(file):
+            os.remove(file)
+    logger.info(f"Índice local gerado em {path}: {count} documentos, {dims} dimensões, {meta['ivf_lists']} listas IVF")
+    return meta
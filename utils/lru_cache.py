@@ -0,0 +1,282 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TTLLRUCache:
+    """
+    Cache LRU em memória, thread-safe, limitado por número de entradas e com TTL por entrada
+    """
+
+    def __init__(self, max_size, ttl):
+        """
+        Args:
+            max_size: Número máximo de entradas antes da remoção das menos usadas recentemente
+            ttl: Tempo de vida de cada entrada, em segundos
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Retorna o valor da chave, ou None se não existir ou estiver expirado"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Armazena o valor da chave, removendo as entradas menos usadas recentemente se necessário"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Remove a chave e retorna seu valor (ou None)"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return None if entry is None else entry[0]
+
+    def clear(self):
+        """Remove todas as entradas"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Retorna os contadores do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class KeyValueCache:
+    """
+    Interface base dos caches de chave-valor com TTL usados pela pipeline (respostas e resultados da
+    recuperação). Cada entrada é associada aos índices de origem (separados por vírgula), para que possa
+    ser invalidada quando um deles muda.
+    """
+
+    # Nome do cache nas mensagens de log
+    name = "Cache"
+
+    def __init__(self, ttl):
+        """
+        Args:
+            ttl: Tempo de vida de cada entrada, em segundos
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """Retorna o valor armazenado para a chave, ou None se não existir ou estiver expirado"""
+        value = self._get(key)
+        self._count(value is not None)
+        return value
+
+    def set(self, key, value, index):
+        """Armazena o valor da chave, associado aos índices de origem (separados por vírgula)"""
+        self._set(key, value, index, time.time() + self.ttl)
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Retorna os contadores de acertos e falhas do cache"""
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": self.size()
+            }
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, index, expires_at):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def invalidate_index(self, index):
+        """Remove as entradas associadas ao índice informado (sozinho ou junto com outros índices)"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove todas as entradas"""
+        raise NotImplementedError
+
+    def size(self):
+        """Retorna o número de entradas armazenadas"""
+        raise NotImplementedError
+
+
+class MemoryKeyValueCache(KeyValueCache):
+    """Cache LRU em memória, limitado por número de entradas e com TTL"""
+
+    def __init__(self, max_size, ttl):
+        """
+        Args:
+            max_size: Número máximo de entradas antes da remoção das menos usadas recentemente
+            ttl: Tempo de vida de cada entrada, em segundos
+        """
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (value, index, expires_at)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, _, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, index, expires_at):
+        with self._lock:
+            self._entries[key] = (value, index, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_index(self, index):
+        with self._lock:
+            keys = [key for key, (_, entry_index, _) in self._entries.items() if index in entry_index.split(",")]
+            for key in keys:
+                del self._entries[key]
+        logger.info(f"{self.name}: {len(keys)} entradas invalidadas para o índice {index}")
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteKeyValueCache(KeyValueCache):
+    """
+    Cache em disco (SQLite), persistente entre reinicializações, limitado por número de entradas e com TTL.
+    Os valores são armazenados em JSON.
+    """
+
+    def __init__(self, path, table, max_size, ttl):
+        """
+        Args:
+            path: Caminho do arquivo SQLite
+            table: Nome da tabela das entradas
+            max_size: Número máximo de entradas antes da remoção das menos usadas recentemente
+            ttl: Tempo de vida de cada entrada, em segundos
+        """
+        super().__init__(ttl)
+        self.path = path
+        self.table = table
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, idx TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        logger.info(f"{self.name} em disco aberto em {path}")
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def _set(self, key, value, index, expires_at):
+        value = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, idx, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, index, expires_at, time.time())
+            )
+            # Remover as entradas menos usadas recentemente que excedem o limite
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+
+    def _delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def invalidate_index(self, index):
+        with self._lock, self._conn:
+            removed = self._conn.execute(f"DELETE FROM {self.table} WHERE instr(',' || idx || ',', ?) > 0",
+                                         (f",{index},",)).rowcount
+        logger.info(f"{self.name}: {removed} entradas invalidadas para o índice {index}")
+        return removed
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
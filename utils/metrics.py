@@ -0,0 +1,303 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Limites dos buckets dos histogramas de latência, em segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Limites dos buckets do histograma de número de documentos por consulta
+HITS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    """Contador monotônico com rótulos, no formato de métricas do Prometheus"""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Histograma cumulativo com rótulos, no formato de métricas do Prometheus"""
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [contagens por bucket, soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total_sum, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total_sum}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas da pipeline RAG, alimentado pelos traces de cada consulta"""
+
+    def __init__(self):
+        self.stage_duration = Histogram("rag_stage_duration_seconds", "Duração de cada etapa da pipeline RAG")
+        self.requests = Counter("rag_requests_total", "Consultas processadas, por modo e resultado")
+        self.events = Counter("rag_events_total", "Eventos da pipeline (fallbacks, acertos de cache etc.)")
+        self.tokens = Counter("rag_llm_tokens_total", "Tokens consumidos na API do Groq, por tipo")
+        self.hits = Histogram("rag_es_hits", "Número de documentos retornados por consulta ao Elasticsearch", HITS_BUCKETS)
+        self._metrics = [self.stage_duration, self.requests, self.events, self.tokens, self.hits]
+
+    def register(self, metric):
+        """Registra uma métrica adicional para exposição no endpoint"""
+        self._metrics.append(metric)
+        return metric
+
+    def observe_trace(self, trace):
+        """Registra nas métricas as informações de um trace finalizado"""
+        for stage, seconds in trace.timings.items():
+            self.stage_duration.observe(seconds, stage=stage)
+        for event in trace.events:
+            self.events.inc(event=event)
+        for token_type in ("prompt_tokens", "completion_tokens"):
+            if token_type in trace.attributes:
+                self.tokens.inc(trace.attributes[token_type], type=token_type)
+        if "hits" in trace.attributes:
+            self.hits.observe(trace.attributes["hits"])
+        self.requests.inc(mode=trace.mode, status="error" if trace.error else "ok")
+
+    def render(self):
+        """Retorna todas as métricas no formato de texto do Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+
+class Trace:
+    """
+    Registro das etapas de uma consulta: tempos por etapa, eventos (fallbacks, acertos de cache)
+    e atributos (número de documentos, uso de tokens)
+    """
+
+    def __init__(self, mode="default"):
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.timings = {}
+        self.events = []
+        self.attributes = {}
+        self.error = None
+        self.finished = False
+        # Prazo da consulta (time.perf_counter) definido pelo controle de admissão: math.inf sem prazo, None fora dele
+        self.deadline = None
+
+    @contextmanager
+    def stage(self, name):
+        """Mede o tempo de execução do bloco e o acumula na etapa informada"""
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - stage_start)
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def mark(self, name):
+        """Registra o tempo decorrido desde o início da consulta (apenas na primeira marcação)"""
+        if name not in self.timings:
+            self.timings[name] = time.perf_counter() - self.start
+
+    def event(self, name):
+        self.events.append(name)
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, value):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def finish(self, error=None):
+        """Finaliza o trace e registra suas informações nas métricas"""
+        if self.finished:
+            return
+        self.finished = True
+        self.error = str(error) if error is not None else None
+        self.timings["total"] = time.perf_counter() - self.start
+        registry.observe_trace(self)
+
+    def to_dict(self):
+        return {
+            "mode": self.mode,
+            "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            "events": list(self.events),
+            "attributes": dict(self.attributes),
+            "error": self.error
+        }
+
+
+class _NullTrace(Trace):
+    """Trace usado fora de uma consulta instrumentada; descarta todas as informações"""
+
+    def add_timing(self, name, seconds):
+        pass
+
+    def mark(self, name):
+        pass
+
+    def event(self, name):
+        pass
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, value):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+
+_NULL_TRACE = _NullTrace()
+
+
+def current_trace():
+    """Retorna o trace da consulta em andamento (ou um trace nulo)"""
+    trace = _current_trace.get()
+    return trace if trace is not None else _NULL_TRACE
+
+
+@contextmanager
+def activate(trace):
+    """Define o trace da consulta em andamento durante o bloco"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def iterate_in_trace(iterable, trace):
+    """
+    Itera sobre um gerador ativando o trace a cada passo. Geradores podem ser retomados em
+    threads ou contextos diferentes (como faz o Gradio), então o trace não pode ficar só no contexto inicial.
+    """
+    iterator = iter(iterable)
+    try:
+        while True:
+            with activate(trace):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        # Encerrar o gerador interno se o consumidor abandonar a iteração
+        if hasattr(iterator, "close"):
+            with activate(trace):
+                iterator.close()
+
+
+async def aiterate_in_trace(async_iterable, trace):
+    """Versão assíncrona de iterate_in_trace"""
+    iterator = async_iterable.__aiter__()
+    try:
+        while True:
+            with activate(trace):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        if hasattr(iterator, "aclose"):
+            with activate(trace):
+                await iterator.aclose()
+
+
+def record_usage(usage):
+    """Registra no trace atual o uso de tokens informado pela API do Groq"""
+    if usage is None:
+        return
+    trace = current_trace()
+    trace.add("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    trace.add("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """
+    Inicia o endpoint /metrics (formato Prometheus) em uma thread em segundo plano
+
+    Args:
+        port: Porta do servidor de métricas
+        host: Endereço de escuta
+
+    Returns:
+        Instância do servidor HTTP
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"Endpoint de métricas disponível em http://{host}:{port}/metrics")
+    return server
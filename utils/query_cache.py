@@ -0,0 +1,44 @@
+import copy
+import logging
+from config import ES_TEXT_FIELD, ES_SEMANTIC_FIELD, QUERY_CACHE_MAX_SIZE, QUERY_CACHE_TTL
+from utils.answer_cache import normalize_query
+from utils.lru_cache import TTLLRUCache
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class QueryPlanCache:
+    """
+    Cache das consultas RRF geradas pela LLM em prepare_elasticsearch_query.
+    Apenas consultas validadas são armazenadas; os fallbacks heurísticos nunca entram no cache.
+    """
+
+    def __init__(self, max_size=QUERY_CACHE_MAX_SIZE, ttl=QUERY_CACHE_TTL):
+        self._cache = TTLLRUCache(max_size, ttl)
+        logger.info(f"Cache de consultas da LLM ativado (max_size={max_size}, ttl={ttl}s)")
+
+    def make_key(self, user_query, max_results):
+        """Calcula a chave a partir da consulta normalizada, do número de resultados e dos campos do índice"""
+        return (normalize_query(user_query), max_results, ES_TEXT_FIELD, ES_SEMANTIC_FIELD)
+
+    def get(self, user_query, max_results):
+        """
+        Retorna uma cópia da consulta armazenada, ou None em caso de falha no cache
+        """
+        query_json = self._cache.get(self.make_key(user_query, max_results))
+        # Retorna uma cópia, pois ElasticsearchClient.search pode alterar o dicionário
+        return copy.deepcopy(query_json) if query_json is not None else None
+
+    def set(self, user_query, max_results, query_json):
+        """Armazena uma cópia da consulta validada"""
+        self._cache.set(self.make_key(user_query, max_results), copy.deepcopy(query_json))
+
+    def clear(self):
+        """Remove todas as consultas armazenadas"""
+        self._cache.clear()
+
+    def stats(self):
+        """Retorna os contadores de acertos, falhas e remoções do cache"""
+        return self._cache.stats()
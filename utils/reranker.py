@@ -0,0 +1,242 @@
+import asyncio
+import copy
+import json
+import logging
+import numpy as np
+from config import (ES_MAX_RESULTS, RERANK_WINDOW, RERANK_TOP_K, RERANK_MAX_CHARS, RERANK_EMBEDDINGS,
+                    RERANK_LEXICAL_WEIGHT, RERANK_COVERAGE_WEIGHT, RERANK_PROXIMITY_WEIGHT,
+                    RERANK_RETRIEVAL_WEIGHT, RERANK_EMBEDDING_WEIGHT)
+from utils.context_builder import extract_document_text
+from utils.es_client import extract_semantic_query_text, extract_query_string_keywords
+from utils.keywords import normalize_terms
+from utils.local_index import BM25_K1, BM25_B
+from utils.local_retriever import QueryEncoder, PASSAGE_PREFIX, RRF_RANK_CONSTANT
+from utils.metrics import current_trace
+from utils.retriever import Retriever
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _min_max(values):
+    """Normaliza os valores para o intervalo [0, 1] (zeros se todos forem iguais)"""
+    spread = values.max() - values.min() if len(values) else 0
+    return (values - values.min()) / spread if spread > 0 else np.zeros_like(values)
+
+
+def _document_text(doc, max_chars):
+    """Texto usado no reranking: os fragmentos do highlight (se houver) ou o texto do documento, limitado a max_chars"""
+    if doc.get("highlights"):
+        text = " ".join([str(doc["source"].get("title") or "")] + doc["highlights"])
+    else:
+        text = extract_document_text(doc["source"])
+    return text[:max_chars]
+
+
+class Reranker:
+    """
+    Reordena os candidatos recuperados com um score calculado em CPU, vetorizado com NumPy:
+    BM25 e cobertura (ponderada por idf) dos termos da pergunta, proximidade (pares de termos
+    consecutivos da pergunta presentes no documento), posição na recuperação original e,
+    opcionalmente, similaridade de embeddings (sentence-transformers)
+    """
+
+    def __init__(self, window=RERANK_WINDOW, top_k=RERANK_TOP_K, max_chars=RERANK_MAX_CHARS,
+                 use_embeddings=RERANK_EMBEDDINGS, encoder=None):
+        """
+        Args:
+            window: Candidatos buscados para o reranking
+            top_k: Documentos mantidos depois do reranking (no máximo o size da consulta)
+            max_chars: Caracteres de cada documento considerados no score
+            use_embeddings: Se True, soma a similaridade de embeddings (requer sentence-transformers)
+            encoder: QueryEncoder dos embeddings (opcional)
+        """
+        self.window = window
+        self.top_k = top_k
+        self.max_chars = max_chars
+        self.weights = {
+            "lexical": RERANK_LEXICAL_WEIGHT,
+            "coverage": RERANK_COVERAGE_WEIGHT,
+            "proximity": RERANK_PROXIMITY_WEIGHT,
+            "retrieval": RERANK_RETRIEVAL_WEIGHT,
+            "embedding": RERANK_EMBEDDING_WEIGHT
+        }
+        self.encoder = None
+        if use_embeddings:
+            self.encoder = encoder if encoder is not None else QueryEncoder()
+            if not self.encoder.available:
+                logger.warning("sentence-transformers não instalado: o reranking usará apenas os scores léxicos")
+                self.encoder = None
+
+    def _lexical_features(self, query_terms, documents_terms):
+        """Matrizes de BM25, cobertura e proximidade dos candidatos (um valor por documento)"""
+        vocabulary = {term: column for column, term in enumerate(dict.fromkeys(query_terms))}
+        frequencies = np.zeros((len(documents_terms), len(vocabulary)), dtype=np.float32)
+        lengths = np.empty(len(documents_terms), dtype=np.float32)
+        for row, terms in enumerate(documents_terms):
+            lengths[row] = len(terms)
+            for term in terms:
+                column = vocabulary.get(term)
+                if column is not None:
+                    frequencies[row, column] += 1
+
+        count = len(documents_terms)
+        document_frequency = (frequencies > 0).sum(axis=0)
+        idf = np.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = lengths.mean() if count else 0
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length) if average_length else np.full(count, BM25_K1)
+        bm25 = (idf * frequencies * (BM25_K1 + 1) / (frequencies + norms[:, None])).sum(axis=1)
+        coverage = (frequencies > 0) @ idf / idf.sum() if idf.sum() > 0 else np.zeros(count)
+
+        query_pairs = set(zip(query_terms, query_terms[1:]))
+        proximity = np.array([len(query_pairs & set(zip(terms, terms[1:]))) for terms in documents_terms],
+                             dtype=np.float32) if query_pairs else np.zeros(count, dtype=np.float32)
+        return bm25, coverage, proximity
+
+    def score(self, query_text, documents):
+        """
+        Calcula o score de reranking de cada candidato
+
+        Args:
+            query_text: Pergunta do usuário
+            documents: Candidatos na ordem da recuperação original
+
+        Returns:
+            Array com o score de cada candidato
+        """
+        texts = [_document_text(doc, self.max_chars) for doc in documents]
+        query_terms = normalize_terms(query_text)
+        bm25, coverage, proximity = self._lexical_features(query_terms, [normalize_terms(text) for text in texts])
+        # Posição na recuperação original, com o mesmo decaimento do RRF
+        retrieval = 1.0 / (RRF_RANK_CONSTANT + np.arange(1, len(documents) + 1, dtype=np.float32))
+        scores = (self.weights["lexical"] * _min_max(bm25) + self.weights["coverage"] * coverage
+                  + self.weights["proximity"] * _min_max(proximity) + self.weights["retrieval"] * _min_max(retrieval))
+        if self.encoder is not None:
+            with current_trace().stage("rerank_encode"):
+                query_vector = self.encoder.encode([query_text])[0]
+                document_vectors = self.encoder.encode(texts, PASSAGE_PREFIX)
+            scores = scores + self.weights["embedding"] * _min_max(document_vectors @ query_vector)
+        return scores
+
+    def rerank(self, query_text, documents, top_k=None):
+        """
+        Reordena os candidatos e mantém os top_k melhores
+
+        Args:
+            query_text: Pergunta do usuário
+            documents: Candidatos na ordem da recuperação original
+            top_k: Número de documentos mantidos (padrão: self.top_k)
+
+        Returns:
+            Lista de documentos reordenada, com o score de reranking em "rerank_score"
+        """
+        top_k = top_k or self.top_k
+        if not documents or not query_text:
+            return documents[:top_k]
+        trace = current_trace()
+        with trace.stage("rerank"):
+            scores = self.score(query_text, documents)
+            order = np.argsort(-scores, kind="stable")[:top_k]
+            reranked = [dict(documents[i], rerank_score=float(scores[i])) for i in order]
+        trace.set("rerank_candidates", len(documents))
+        # Quantos dos documentos finais não estariam entre os top_k da recuperação original
+        trace.set("rerank_promoted", int((order >= top_k).sum()))
+        return reranked
+
+
+class RerankingRetriever(Retriever):
+    """
+    Mecanismo de recuperação com reranking: busca uma janela maior de candidatos no mecanismo
+    interno (size e rank_window_size ampliados para window) e entrega apenas os top_k
+    reordenados pelo Reranker, sem aumentar o contexto enviado à LLM
+    """
+
+    def __init__(self, retriever, reranker=None):
+        """
+        Args:
+            retriever: Mecanismo de recuperação interno (Elasticsearch, local ou fallback)
+            reranker: Reranker (opcional; por padrão usa as configurações RERANK_*)
+        """
+        self.retriever = retriever
+        self.reranker = reranker if reranker is not None else Reranker()
+
+    @property
+    def local_index(self):
+        return self.retriever.local_index
+
+    def _widen(self, query_json, size):
+        """
+        Amplia a consulta para a janela de candidatos, sem alterar a consulta original (que pode
+        estar no cache de consultas)
+
+        Returns:
+            Tupla (consulta ampliada, número de documentos a manter, texto da pergunta)
+        """
+        query = json.loads(query_json) if isinstance(query_json, str) else copy.deepcopy(query_json)
+        requested = int(query.get("size", size))
+        query["size"] = max(requested, self.reranker.window)
+        rrf = query.get("retriever", {}).get("rrf")
+        if rrf is not None:
+            rrf["rank_window_size"] = max(int(rrf.get("rank_window_size", 0)), query["size"])
+        query_text = extract_semantic_query_text(query) or extract_query_string_keywords(query) or ""
+        return query, min(requested, self.reranker.top_k), query_text
+
+    def build_semantic_query(self, query_text, size):
+        return self.retriever.build_semantic_query(query_text, size)
+
+    def search(self, query_json, size=ES_MAX_RESULTS):
+        """Busca a janela de candidatos e retorna os top_k reordenados"""
+        query, top_k, query_text = self._widen(query_json, size)
+        return self.reranker.rerank(query_text, self.retriever.search(query, size), top_k)
+
+    def msearch(self, queries, size=ES_MAX_RESULTS):
+        """Busca a janela de candidatos de cada consulta e retorna os top_k reordenados"""
+        widened = [self._widen(query_json, size) for query_json in queries]
+        results = self.retriever.msearch([query for query, _, _ in widened], size)
+        return [result if isinstance(result, Exception) else self.reranker.rerank(query_text, result, top_k)
+                for result, (_, top_k, query_text) in zip(results, widened)]
+
+    def ping(self):
+        return self.retriever.ping()
+
+    def stats(self):
+        return {
+            "rerank": {"window": self.reranker.window, "top_k": self.reranker.top_k,
+                       "embeddings": self.reranker.encoder is not None},
+            "retriever": self.retriever.stats()
+        }
+
+    def close(self):
+        self.retriever.close()
+
+
+class AsyncRerankingRetriever(RerankingRetriever):
+    """Versão assíncrona do RerankingRetriever: o reranking roda em uma thread do executor padrão"""
+
+    async def search(self, query_json, size=ES_MAX_RESULTS):
+        query, top_k, query_text = self._widen(query_json, size)
+        documents = await self.retriever.search(query, size)
+        return await asyncio.to_thread(self.reranker.rerank, query_text, documents, top_k)
+
+    async def msearch(self, queries, size=ES_MAX_RESULTS):
+        widened = [self._widen(query_json, size) for query_json in queries]
+        results = await self.retriever.msearch([query for query, _, _ in widened], size)
+        reranked = []
+        for result, (_, top_k, query_text) in zip(results, widened):
+            if not isinstance(result, Exception):
+                result = await asyncio.to_thread(self.reranker.rerank, query_text, result, top_k)
+            reranked.append(result)
+        return reranked
+
+    async def semantic_search(self, query_text, size=ES_MAX_RESULTS):
+        return await self.search(self.build_semantic_query(query_text, size))
+
+    async def verify_connection(self):
+        await self.retriever.verify_connection()
+
+    async def ping(self):
+        return await self.retriever.ping()
+
+    async def close(self):
+        await self.retriever.close()
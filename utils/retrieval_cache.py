@@ -0,0 +1,336 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from config import (ES_INDEX, ES_MAX_RESULTS, ES_SOURCE_INCLUDES, ES_SOURCE_EXCLUDES, ES_HIGHLIGHT, ES_HIGHLIGHT_FIELD,
+                    ES_HIGHLIGHT_FRAGMENT_SIZE, ES_HIGHLIGHT_FRAGMENTS, RETRIEVAL_CACHE_BACKEND,
+                    RETRIEVAL_CACHE_MAX_SIZE, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_PATH,
+                    RETRIEVAL_CACHE_VERSION_INTERVAL)
+from utils.es_client import current_indices
+from utils.lru_cache import KeyValueCache, MemoryKeyValueCache, SQLiteKeyValueCache
+from utils.metrics import current_trace
+from utils.retriever import Retriever
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Campos mantidos de cada documento armazenado
+_DOCUMENT_FIELDS = ("id", "index", "score", "merge_score", "source", "highlights")
+
+
+def _compact(documents):
+    """Mantém apenas os campos usados pela pipeline em cada documento"""
+    return [{field: doc[field] for field in _DOCUMENT_FIELDS if field in doc} for doc in documents]
+
+
+class RetrievalCache(KeyValueCache):
+    """
+    Interface base do cache de resultados da recuperação. A chave é o hash da consulta canônica
+    (JSON com chaves ordenadas), dos índices consultados e dos parâmetros que o ElasticsearchClient acrescenta
+    à consulta (_source e highlight). Cada resultado guarda a versão dos índices consultados em que foi
+    obtido e deixa de ser válido quando a versão de algum deles muda.
+    """
+
+    name = "Cache de recuperação"
+
+    def __init__(self, ttl=RETRIEVAL_CACHE_TTL):
+        super().__init__(ttl)
+        self.stale = 0
+
+    def make_key(self, query, size=ES_MAX_RESULTS, index=ES_INDEX):
+        """
+        Calcula a chave de cache de uma consulta
+
+        Args:
+            query: Dicionário da consulta Elasticsearch
+            size: Número máximo de resultados (usado se a consulta não definir "size")
+            index: Índice consultado (ou índices, separados por vírgula)
+
+        Returns:
+            Hash SHA-256 da chave
+        """
+        key_data = {
+            "index": index,
+            "query": dict(query, size=query.get("size", size)),
+            "source": [ES_SOURCE_INCLUDES, ES_SOURCE_EXCLUDES],
+            "highlight": [ES_HIGHLIGHT, ES_HIGHLIGHT_FIELD, ES_HIGHLIGHT_FRAGMENT_SIZE, ES_HIGHLIGHT_FRAGMENTS]
+        }
+        canonical = json.dumps(key_data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key, version):
+        """
+        Retorna os documentos armazenados para a chave, ou None se não existirem, estiverem
+        expirados ou tiverem sido obtidos em outra versão dos índices
+        """
+        entry = self._get(key)
+        documents = None
+        if entry is not None:
+            documents, entry_version = entry
+            if entry_version != version:
+                self._delete(key)
+                documents = None
+        self._count(documents is not None)
+        if entry is not None and documents is None:
+            with self._stats_lock:
+                self.stale += 1
+        return documents
+
+    def set(self, key, documents, version, index=ES_INDEX):
+        """Armazena os documentos da chave, associados aos índices consultados (separados por vírgula) e à sua versão"""
+        super().set(key, (_compact(documents), version), index)
+
+    def stats(self):
+        """Retorna os contadores de acertos, falhas e resultados descartados por mudança de versão"""
+        return dict(super().stats(), stale=self.stale)
+
+
+class MemoryRetrievalCache(MemoryKeyValueCache, RetrievalCache):
+    """Cache LRU em memória, limitado por número de entradas e com TTL"""
+
+    def __init__(self, max_size=RETRIEVAL_CACHE_MAX_SIZE, ttl=RETRIEVAL_CACHE_TTL):
+        super().__init__(max_size, ttl)
+
+    def _get(self, key):
+        entry = super()._get(key)
+        if entry is None:
+            return None
+        documents, version = entry
+        # Cópias rasas, para que os documentos armazenados não sejam alterados por quem os recebe
+        return [dict(doc) for doc in documents], version
+
+
+class SQLiteRetrievalCache(SQLiteKeyValueCache, RetrievalCache):
+    """Cache em disco (SQLite), persistente entre reinicializações, limitado por número de entradas e com TTL"""
+
+    def __init__(self, path=RETRIEVAL_CACHE_PATH, max_size=RETRIEVAL_CACHE_MAX_SIZE, ttl=RETRIEVAL_CACHE_TTL):
+        super().__init__(path, "retrieval_entries", max_size, ttl)
+
+
+def create_retrieval_cache(backend=RETRIEVAL_CACHE_BACKEND):
+    """
+    Cria o cache de resultados da recuperação configurado em RETRIEVAL_CACHE_BACKEND
+
+    Args:
+        backend: "memory", "sqlite" ou "none"
+
+    Returns:
+        Instância de RetrievalCache, ou None se o cache estiver desativado
+    """
+    if backend == "memory":
+        logger.info(f"Cache de recuperação em memória ativado (max_size={RETRIEVAL_CACHE_MAX_SIZE}, "
+                    f"ttl={RETRIEVAL_CACHE_TTL}s)")
+        return MemoryRetrievalCache()
+    if backend == "sqlite":
+        return SQLiteRetrievalCache()
+    if backend == "none":
+        logger.info("Cache de recuperação desativado")
+        return None
+    raise ValueError(f"RETRIEVAL_CACHE_BACKEND inválido: {backend}")
+
+
+class CachingRetriever(Retriever):
+    """
+    Mecanismo de recuperação com cache de resultados: consultas repetidas são respondidas sem ir
+    ao Elasticsearch (nem à inferência do campo semantic_text). A versão de cada índice consultável
+    (index_versions do mecanismo interno) é verificada no máximo a cada version_interval segundos; quando a
+    versão de um índice muda, apenas os resultados das consultas a esse índice são descartados. Sem a versão
+    de algum dos índices consultados, o cache não é usado.
+    """
+
+    def __init__(self, retriever, cache, version_interval=RETRIEVAL_CACHE_VERSION_INTERVAL):
+        """
+        Args:
+            retriever: Mecanismo de recuperação interno (ElasticsearchClient)
+            cache: RetrievalCache usado para os resultados
+            version_interval: Intervalo mínimo entre as verificações da versão do índice, em segundos
+        """
+        self.retriever = retriever
+        self.cache = cache
+        self.version_interval = version_interval
+        self.versions = None
+        self._checked_at = 0.0
+        self._version_lock = threading.Lock()
+
+    @property
+    def local_index(self):
+        return self.retriever.local_index
+
+    def _version_expired(self):
+        return time.time() - self._checked_at >= self.version_interval
+
+    def _update_versions(self, versions):
+        """Registra as versões dos índices, descartando os resultados dos índices cuja versão mudou"""
+        if self.versions is not None:
+            changed = sorted(index for index in set(self.versions) | set(versions)
+                             if self.versions.get(index) != versions.get(index))
+            if changed:
+                logger.info(f"Índices alterados ({', '.join(changed)}): descartando os resultados em cache")
+                current_trace().event("retrieval_cache_invalidated")
+                for index in changed:
+                    self.cache.invalidate_index(index)
+        self.versions = versions
+        self._checked_at = time.time()
+
+    def _version_failed(self, error):
+        # Mantém as últimas versões conhecidas (o cache continua respondendo com o Elasticsearch indisponível)
+        logger.warning(f"Falha ao obter a versão dos índices: {str(error)}")
+        self._checked_at = time.time()
+
+    def _indices_version(self):
+        """
+        Versão dos índices consultados na requisição em andamento: a combinação das versões de cada
+        índice, ou None se a versão de algum deles não for conhecida
+        """
+        if not self.versions:
+            return None
+        try:
+            return ",".join(f"{index}:{self.versions[index]}" for index in current_indices())
+        except KeyError:
+            return None
+
+    def _current_version(self):
+        """Retorna a versão dos índices consultados, consultando o mecanismo interno se a última verificação expirou"""
+        # Apenas uma thread consulta as versões; as demais usam as últimas conhecidas (ou esperam as primeiras)
+        if self._version_expired() and self._version_lock.acquire(blocking=self.versions is None):
+            try:
+                if self._version_expired():
+                    with current_trace().stage("index_version"):
+                        versions = self.retriever.index_versions()
+                    self._update_versions(versions)
+            except Exception as e:
+                self._version_failed(e)
+            finally:
+                self._version_lock.release()
+        return self._indices_version()
+
+    def _lookup(self, key, version):
+        documents = self.cache.get(key, version)
+        trace = current_trace()
+        if documents is None:
+            trace.event("retrieval_cache_miss")
+        else:
+            trace.event("retrieval_cache_hit")
+            trace.set("hits", len(documents))
+        return documents
+
+    def _prepare(self, queries, size, version):
+        """Converte as consultas em dicionários e calcula as chaves e os resultados já armazenados"""
+        # Cópias, pois ElasticsearchClient.search acrescenta _source e highlight ao dicionário (e mudaria a chave)
+        queries = [json.loads(query_json) if isinstance(query_json, str) else copy.deepcopy(query_json)
+                   for query_json in queries]
+        if version is None:
+            return queries, None, [None] * len(queries)
+        index = ",".join(current_indices())
+        keys = [self.cache.make_key(query, size, index) for query in queries]
+        return queries, keys, [self._lookup(key, version) for key in keys]
+
+    def _store(self, keys, results, version):
+        if keys is None:
+            return
+        index = ",".join(current_indices())
+        for key, result in zip(keys, results):
+            if not isinstance(result, Exception):
+                self.cache.set(key, result, version, index)
+
+    def build_semantic_query(self, query_text, size):
+        return self.retriever.build_semantic_query(query_text, size)
+
+    def search(self, query_json, size=ES_MAX_RESULTS):
+        """Retorna o resultado armazenado da consulta ou a executa no mecanismo interno"""
+        version = self._current_version()
+        (query,), keys, (documents,) = self._prepare([query_json], size, version)
+        if documents is None:
+            documents = self.retriever.search(query, size)
+            self._store(keys, [documents], version)
+        return documents
+
+    def msearch(self, queries, size=ES_MAX_RESULTS):
+        """Executa no mecanismo interno (em um único _msearch) apenas as consultas sem resultado armazenado"""
+        version = self._current_version()
+        queries, keys, results = self._prepare(queries, size, version)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fetched = self.retriever.msearch([queries[i] for i in missing], size)
+            for i, result in zip(missing, fetched):
+                results[i] = result
+            self._store(keys and [keys[i] for i in missing], fetched, version)
+        return results
+
+    def ping(self):
+        return self.retriever.ping()
+
+    def index_versions(self):
+        return self.retriever.index_versions()
+
+    def stats(self):
+        return {
+            "retrieval_cache": dict(self.cache.stats(), index_versions=self.versions),
+            "retriever": self.retriever.stats()
+        }
+
+    def close(self):
+        self.retriever.close()
+
+
+class AsyncCachingRetriever(CachingRetriever):
+    """Versão assíncrona do CachingRetriever (AsyncElasticsearchClient)"""
+
+    def __init__(self, retriever, cache, version_interval=RETRIEVAL_CACHE_VERSION_INTERVAL):
+        super().__init__(retriever, cache, version_interval)
+        self._version_task = None
+
+    async def _fetch_version(self):
+        try:
+            with current_trace().stage("index_version"):
+                versions = await self.retriever.index_versions()
+            self._update_versions(versions)
+        except Exception as e:
+            self._version_failed(e)
+
+    async def _current_version(self):
+        # Apenas uma tarefa consulta as versões; as demais usam as últimas conhecidas (ou esperam as primeiras)
+        if self._version_expired():
+            if self._version_task is None or self._version_task.done():
+                self._version_task = asyncio.ensure_future(self._fetch_version())
+            if self.versions is None:
+                await asyncio.shield(self._version_task)
+        return self._indices_version()
+
+    async def search(self, query_json, size=ES_MAX_RESULTS):
+        version = await self._current_version()
+        (query,), keys, (documents,) = self._prepare([query_json], size, version)
+        if documents is None:
+            documents = await self.retriever.search(query, size)
+            self._store(keys, [documents], version)
+        return documents
+
+    async def msearch(self, queries, size=ES_MAX_RESULTS):
+        version = await self._current_version()
+        queries, keys, results = self._prepare(queries, size, version)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fetched = await self.retriever.msearch([queries[i] for i in missing], size)
+            for i, result in zip(missing, fetched):
+                results[i] = result
+            self._store(keys and [keys[i] for i in missing], fetched, version)
+        return results
+
+    async def semantic_search(self, query_text, size=ES_MAX_RESULTS):
+        return await self.search(self.build_semantic_query(query_text, size))
+
+    async def verify_connection(self):
+        await self.retriever.verify_connection()
+
+    async def ping(self):
+        return await self.retriever.ping()
+
+    async def index_versions(self):
+        return await self.retriever.index_versions()
+
+    async def close(self):
+        await self.retriever.close()
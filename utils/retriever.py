@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from config import ES_MAX_RESULTS, RETRIEVER_FALLBACK_COOLDOWN
+from utils.metrics import current_trace
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class Retriever:
+    """
+    Interface dos mecanismos de recuperação usados pela pipeline RAG. As consultas seguem o
+    formato das consultas do Elasticsearch (em especial a consulta híbrida RRF montada por
+    build_rrf_query) e os resultados são listas de documentos {"id", "score", "source"}.
+    Implementações: ElasticsearchClient e LocalHybridRetriever (e as versões assíncronas).
+    """
+
+    # Índice BM25 local com os documentos já retornados (apenas no ElasticsearchClient)
+    local_index = None
+
+    def build_semantic_query(self, query_text, size):
+        """Monta a consulta híbrida RRF (query_string + semantic) a partir do texto da consulta"""
+        raise NotImplementedError
+
+    def search(self, query_json, size=ES_MAX_RESULTS):
+        """Executa uma consulta e retorna a lista de documentos"""
+        raise NotImplementedError
+
+    def msearch(self, queries, size=ES_MAX_RESULTS):
+        """Executa várias consultas, retornando para cada uma a lista de documentos ou a exceção"""
+        raise NotImplementedError
+
+    def semantic_search(self, query_text, size=ES_MAX_RESULTS):
+        """Executa a busca híbrida RRF a partir do texto da consulta"""
+        return self.search(self.build_semantic_query(query_text, size))
+
+    def ping(self):
+        """Verifica se o mecanismo de recuperação está disponível"""
+        return True
+
+    def index_versions(self):
+        """Retorna, para cada índice consultável, um marcador que muda quando os documentos do índice mudam (None se não suportado)"""
+        return None
+
+    def stats(self):
+        """Retorna os contadores do mecanismo de recuperação (opcional)"""
+        return None
+
+    def close(self):
+        """Libera os recursos do mecanismo de recuperação"""
+
+
+class FallbackRetriever(Retriever):
+    """
+    Usa o mecanismo principal (Elasticsearch) e, quando ele falha ou excede o timeout, responde
+    com o mecanismo local. Depois de uma falha, o principal é evitado por cooldown segundos
+    (modo degradado), sem que cada consulta precise esperar o timeout novamente.
+    """
+
+    def __init__(self, primary, fallback, cooldown=RETRIEVER_FALLBACK_COOLDOWN):
+        """
+        Args:
+            primary: Mecanismo principal (ElasticsearchClient)
+            fallback: Mecanismo usado nas falhas do principal (LocalHybridRetriever)
+            cooldown: Tempo, em segundos, em que o principal é evitado depois de uma falha
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.cooldown = cooldown
+        self.fallbacks = 0
+        self._degraded_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def local_index(self):
+        return self.primary.local_index
+
+    @property
+    def degraded(self):
+        """Indica se as consultas estão indo diretamente para o mecanismo local"""
+        return time.time() < self._degraded_until
+
+    def _mark_failure(self, error):
+        with self._lock:
+            if not self.degraded:
+                logger.warning(f"Mecanismo de recuperação principal indisponível ({str(error)}). "
+                               f"Usando o mecanismo local por {self.cooldown:.0f} segundos")
+            self._degraded_until = time.time() + self.cooldown
+
+    def _use_fallback(self, error=None):
+        if error is not None:
+            self._mark_failure(error)
+        with self._lock:
+            self.fallbacks += 1
+        current_trace().event("retriever_fallback")
+
+    def build_semantic_query(self, query_text, size):
+        return self.primary.build_semantic_query(query_text, size)
+
+    def search(self, query_json, size=ES_MAX_RESULTS):
+        """Executa a consulta no mecanismo principal ou, em caso de falha, no local"""
+        if not self.degraded:
+            try:
+                return self.primary.search(query_json, size)
+            except Exception as e:
+                self._use_fallback(e)
+        else:
+            self._use_fallback()
+        return self.fallback.search(query_json, size)
+
+    def msearch(self, queries, size=ES_MAX_RESULTS):
+        """Executa as consultas no mecanismo principal ou, em caso de falha, no local"""
+        if not self.degraded:
+            try:
+                return self.primary.msearch(queries, size)
+            except Exception as e:
+                self._use_fallback(e)
+        else:
+            self._use_fallback()
+        return self.fallback.msearch(queries, size)
+
+    def ping(self):
+        """
+        Verifica o mecanismo principal (entrando no modo degradado se ele não responder) e
+        considera o serviço disponível enquanto o mecanismo local estiver disponível
+        """
+        try:
+            healthy = bool(self.primary.ping())
+        except Exception as e:
+            logger.error(f"Erro na verificação do mecanismo de recuperação principal: {str(e)}")
+            healthy = False
+        if healthy:
+            return True
+        self._mark_failure("falha no ping")
+        return self.fallback.ping()
+
+    def stats(self):
+        return {"fallbacks": self.fallbacks, "degraded": self.degraded, "local": self.fallback.stats()}
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+
+class AsyncFallbackRetriever(FallbackRetriever):
+    """Versão assíncrona do FallbackRetriever (AsyncElasticsearchClient + AsyncLocalHybridRetriever)"""
+
+    async def search(self, query_json, size=ES_MAX_RESULTS):
+        """Executa a consulta no mecanismo principal ou, em caso de falha, no local"""
+        if not self.degraded:
+            try:
+                return await self.primary.search(query_json, size)
+            except Exception as e:
+                self._use_fallback(e)
+        else:
+            self._use_fallback()
+        return await self.fallback.search(query_json, size)
+
+    async def msearch(self, queries, size=ES_MAX_RESULTS):
+        """Executa as consultas no mecanismo principal ou, em caso de falha, no local"""
+        if not self.degraded:
+            try:
+                return await self.primary.msearch(queries, size)
+            except Exception as e:
+                self._use_fallback(e)
+        else:
+            self._use_fallback()
+        return await self.fallback.msearch(queries, size)
+
+    async def semantic_search(self, query_text, size=ES_MAX_RESULTS):
+        return await self.search(self.build_semantic_query(query_text, size))
+
+    async def verify_connection(self):
+        """Verifica o mecanismo principal; se ele estiver indisponível, inicia no modo degradado"""
+        try:
+            await self.primary.verify_connection()
+        except Exception as e:
+            self._mark_failure(e)
+            await self.fallback.verify_connection()
+
+    async def ping(self):
+        try:
+            healthy = bool(await self.primary.ping())
+        except Exception as e:
+            logger.error(f"Erro na verificação do mecanismo de recuperação principal: {str(e)}")
+            healthy = False
+        if healthy:
+            return True
+        self._mark_failure("falha no ping")
+        return await self.fallback.ping()
+
+    async def close(self):
+        await self.primary.close()
+        await self.fallback.close()
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import threading
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Marca o fim dos trechos de uma computação
+_END = object()
+
+
+class _Flight:
+    """
+    Computação em andamento compartilhada pelas consultas idênticas. Os trechos já produzidos
+    ficam guardados para quem chega depois, e o próximo trecho é buscado por qualquer participante
+    que precise dele (assim, se quem iniciou a computação desistir, os demais continuam).
+    """
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.participants = 0
+        self._fetching = False
+        self._condition = threading.Condition()
+
+    def _next(self, index):
+        with self._condition:
+            while True:
+                if index < len(self.chunks):
+                    return self.chunks[index]
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return _END
+                if not self._fetching:
+                    self._fetching = True
+                    break
+                self._condition.wait()
+
+        # O próximo trecho é buscado fora do lock, enquanto os demais participantes aguardam
+        try:
+            chunk = next(self.iterator)
+        except StopIteration:
+            chunk = _END
+        except BaseException as e:
+            # Um iterador que lança uma exceção é encerrado: todos os participantes recebem o mesmo erro
+            with self._condition:
+                self.done, self.error, self._fetching = True, e, False
+                self._condition.notify_all()
+            raise
+
+        with self._condition:
+            if chunk is _END:
+                self.done = True
+            else:
+                self.chunks.append(chunk)
+            self._fetching = False
+            self._condition.notify_all()
+        return chunk
+
+
+class SingleFlight:
+    """
+    Coalescência de computações idênticas simultâneas (single-flight): a primeira chamada de
+    cada chave inicia a computação e as chamadas concorrentes com a mesma chave acompanham o
+    mesmo fluxo de trechos, em vez de repetir as chamadas ao Elasticsearch e ao Groq
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key, factory):
+        """
+        Participa da computação em andamento para a chave, ou inicia uma nova
+
+        Args:
+            key: Chave da computação (ex.: consulta normalizada e modo)
+            factory: Função sem argumentos que cria o iterador de trechos (chamada apenas por quem inicia)
+
+        Returns:
+            Tupla (iterador dos trechos, True se esta chamada iniciou a computação)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(iter(factory()))
+                self.leaders += 1
+            else:
+                self.followers += 1
+                logger.info("Consulta idêntica em andamento: acompanhando a computação existente")
+            flight.participants += 1
+        return self._iterate(key, flight), leader
+
+    def _iterate(self, key, flight):
+        index = 0
+        try:
+            while True:
+                chunk = flight._next(index)
+                if chunk is _END:
+                    return
+                index += 1
+                yield chunk
+        finally:
+            self._leave(key, flight)
+
+    def _leave(self, key, flight):
+        with self._lock:
+            flight.participants -= 1
+            abandoned = flight.participants == 0 and not flight.done
+            if (flight.done or abandoned) and self._flights.get(key) is flight:
+                del self._flights[key]
+        # Ninguém mais acompanha a computação: encerrar o iterador (e seu trace)
+        if abandoned and hasattr(flight.iterator, "close"):
+            flight.iterator.close()
+
+    def stats(self):
+        """Retorna o número de computações iniciadas, de chamadas coalescidas e de computações em andamento"""
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "coalesced_rate": self.followers / total if total else 0.0,
+                "in_flight": len(self._flights)
+            }
+
+
+class _AsyncFlight:
+    """Versão assíncrona de _Flight: os trechos são consumidos por uma tarefa própria no event loop"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.participants = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    async def consume(self, async_iterator):
+        try:
+            async for chunk in async_iterator:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        # Acorda os participantes em espera e prepara um novo evento para o próximo trecho
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self, index):
+        while index >= len(self.chunks) and not self.done:
+            await self._changed.wait()
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    Versão assíncrona de SingleFlight. A computação roda em uma tarefa separada, de modo que o
+    cancelamento de um participante (ex.: o usuário fechou a página) não interrompe os demais
+    """
+
+    def join(self, key, factory):
+        """
+        Participa da computação em andamento para a chave, ou inicia uma nova
+
+        Args:
+            key: Chave da computação (ex.: consulta normalizada e modo)
+            factory: Função sem argumentos que cria o iterador assíncrono de trechos
+
+        Returns:
+            Tupla (iterador assíncrono dos trechos, True se esta chamada iniciou a computação)
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _AsyncFlight()
+            flight.task = asyncio.create_task(flight.consume(factory()))
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            logger.info("Consulta idêntica em andamento: acompanhando a computação existente")
+        flight.participants += 1
+        return self._iterate(key, flight), leader
+
+    async def _iterate(self, key, flight):
+        index = 0
+        try:
+            while True:
+                await flight.wait(index)
+                if index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                elif flight.error is not None:
+                    raise flight.error
+                else:
+                    return
+        finally:
+            flight.participants -= 1
+            # Ninguém mais acompanha a computação: cancelar a tarefa
+            if flight.participants == 0 and not flight.done:
+                flight.task.cancel()
+                self._finish(key, flight)
+
+    def _finish(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]